@@ -0,0 +1,144 @@
+"""Columnar storage for a ground-truth roidb.
+
+The boxes of every image are kept in one concatenated array together with
+per-image offsets, so the whole roidb can be memory-mapped from the cache in
+O(1) and the per-image entries are only materialised, as views, on access.
+The whole text lines of the jsonl annotations, when there are, are one more
+column aligned with the boxes.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import numpy as np
+import scipy.sparse
+
+
+class ColumnarRoidb(object):
+    """List-like roidb backed by concatenated arrays.
+
+    Entries are built lazily and memoized, so callers may keep mutating them
+    (prepare_roidb, merge_roidbs, ...) exactly like the dicts of a plain list.
+    """
+
+    _FIELDS = ('boxes', 'gt_classes', 'seg_areas', 'offsets')
+    _KEY_FILE = 'key.txt'
+    _TEXT_LINES = 'text_lines'
+
+    def __init__(self, boxes, gt_classes, seg_areas, offsets, num_classes, text_lines=None):
+        self._boxes = boxes
+        self._gt_classes = gt_classes
+        self._seg_areas = seg_areas
+        self._offsets = offsets
+        self._num_classes = num_classes
+        self._text_lines = text_lines
+        # None until the entry of the image has been requested
+        self._entries = [None] * (len(offsets) - 1)
+
+    @classmethod
+    def from_annotations(cls, annotations, num_classes):
+        """
+        :param annotations: [(boxes, gt_classes, seg_areas[, text_lines])] one tuple per image,
+            text_lines is None or the (N, 8) quads of the boxes for every image
+        """
+        offsets = np.zeros((len(annotations) + 1,), dtype=np.int64)
+        offsets[1:] = np.cumsum([len(a[0]) for a in annotations])
+
+        with_lines = [len(a) > 3 and a[3] is not None for a in annotations]
+        if any(with_lines) and not all(with_lines):
+            raise ValueError('The text lines must be given for all the images or none')
+
+        boxes = np.zeros((offsets[-1], 4), dtype=np.uint16)
+        gt_classes = np.zeros((offsets[-1],), dtype=np.int32)
+        seg_areas = np.zeros((offsets[-1],), dtype=np.float32)
+        text_lines = np.zeros((offsets[-1], 8), dtype=np.float32) if all(with_lines) and annotations else None
+        for i, a in enumerate(annotations):
+            boxes[offsets[i]:offsets[i + 1]] = a[0]
+            gt_classes[offsets[i]:offsets[i + 1]] = a[1]
+            seg_areas[offsets[i]:offsets[i + 1]] = a[2]
+            if text_lines is not None:
+                text_lines[offsets[i]:offsets[i + 1]] = a[3]
+
+        return cls(boxes, gt_classes, seg_areas, offsets, num_classes, text_lines)
+
+    @classmethod
+    def load(cls, cache_dir, key, num_classes):
+        """Memory-map a cache written by save(), return None if it is missing or stale."""
+        key_file = os.path.join(cache_dir, cls._KEY_FILE)
+        if not os.path.exists(key_file):
+            return None
+        with open(key_file, 'r') as f:
+            if f.read().strip() != key:
+                return None
+
+        arrays = [np.load(os.path.join(cache_dir, name + '.npy'), mmap_mode='r')
+                  for name in cls._FIELDS]
+        text_lines_file = os.path.join(cache_dir, cls._TEXT_LINES + '.npy')
+        text_lines = np.load(text_lines_file, mmap_mode='r') if os.path.exists(text_lines_file) else None
+        return cls(*arrays, num_classes=num_classes, text_lines=text_lines)
+
+    def save(self, cache_dir, key):
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+        # Invalidate first, the key file is written last to mark the cache as complete
+        key_file = os.path.join(cache_dir, self._KEY_FILE)
+        if os.path.exists(key_file):
+            os.remove(key_file)
+
+        for name in self._FIELDS:
+            np.save(os.path.join(cache_dir, name + '.npy'), getattr(self, '_' + name))
+        text_lines_file = os.path.join(cache_dir, self._TEXT_LINES + '.npy')
+        if self._text_lines is not None:
+            np.save(text_lines_file, self._text_lines)
+        elif os.path.exists(text_lines_file):
+            os.remove(text_lines_file)
+
+        with open(key_file, 'w') as f:
+            f.write(key)
+
+    @property
+    def num_boxes(self):
+        return int(self._offsets[-1])
+
+    def _make_entry(self, i):
+        start, end = self._offsets[i], self._offsets[i + 1]
+        gt_classes = self._gt_classes[start:end]
+        num_objs = len(gt_classes)
+        overlaps = scipy.sparse.csr_matrix((np.ones((num_objs,), dtype=np.float32),
+                                            (np.arange(num_objs), gt_classes)),
+                                           shape=(num_objs, self._num_classes))
+        entry = {'boxes': self._boxes[start:end],
+                 'gt_classes': gt_classes,
+                 'gt_overlaps': overlaps,
+                 'flipped': False,
+                 'seg_areas': self._seg_areas[start:end]}
+        if self._text_lines is not None:
+            entry['text_lines'] = self._text_lines[start:end]
+        return entry
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        entry = self._entries[i]
+        if entry is None:
+            entry = self._make_entry(i)
+            self._entries[i] = entry
+        return entry
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def append(self, entry):
+        self._entries.append(entry)
+
+    def extend(self, entries):
+        for entry in entries:
+            self.append(entry)
@@ -24,6 +24,12 @@ for year in ['2007', '2012']:
         name = 'voc_{}_{}_diff'.format(year, split)
         __sets[name] = (lambda split=split, year=year: pascal_voc(split, year, use_diff=True))
 
+# Same image sets with the annotations of Annotations/<split>.jsonl instead of the XML files
+for year in ['2007', '2012']:
+    for split in ['train', 'val', 'trainval', 'test']:
+        name = 'voc_{}_{}_jsonl'.format(year, split)
+        __sets[name] = (lambda split=split, year=year: pascal_voc(split, year, annotation_format='jsonl'))
+
 
 def get_imdb(name):
     """Get an imdb (image database) by name."""
@@ -0,0 +1,217 @@
+# --------------------------------------------------------
+# Tensorflow CTPN
+# Licensed under The MIT License [see LICENSE for details]
+# --------------------------------------------------------
+"""In-process evaluation with the ICDAR Robust Reading scripts of tools/.
+
+The ground truth is read and parsed once, and the detections are given as
+arrays per sample id, so a checkpoint can be evaluated without writing,
+zipping and parsing result files. The parsed ground truth is also cached in
+a .npz file next to the ZIP file, keyed on its hash, so that evaluating
+many snapshots does not parse it again.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import os.path as osp
+import re
+import sys
+import hashlib
+import importlib.util
+import numpy as np
+
+from model.config import cfg
+
+CHALLENGES = ('ICDAR13', 'ICDAR13_Det', 'ICDAR15')
+
+
+def load_challenge_script(challenge):
+    """Import tools/<challenge>/script.py as the module icdar_eval_<challenge>."""
+    if challenge not in CHALLENGES:
+        raise ValueError('Unknown challenge {:s}, expected one of {}'.format(challenge, CHALLENGES))
+
+    name = 'icdar_eval_' + challenge
+    if name in sys.modules:
+        return sys.modules[name]
+
+    script_dir = osp.join(cfg.ROOT_DIR, 'tools', challenge)
+    # The scripts import their helpers (rrc_evaluation_funcs, ...) as top level modules
+    if script_dir not in sys.path:
+        sys.path.insert(0, script_dir)
+    sys.modules.pop('rrc_evaluation_funcs', None)
+
+    spec = importlib.util.spec_from_file_location(name, osp.join(script_dir, 'script.py'))
+    module = importlib.util.module_from_spec(spec)
+    # Registered before running it so the pool workers of map_samples can unpickle its functions
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def text_lines_to_points(text_lines, ltrb=False):
+    """
+    Convert the text lines of TextDetector to ICDAR points, as written in the result files
+    :param text_lines: (N, >=8) left-top, right-top, left-bottom, right-bottom points
+    :param ltrb: return [xmin, ymin, xmax, ymax] boxes instead of clockwise quadrilaterals
+    :return: (N, 4) or (N, 8) int array
+    """
+    text_lines = np.asarray(text_lines, dtype=np.float64)
+    if len(text_lines) == 0:
+        return np.zeros((0, 4 if ltrb else 8), dtype=np.int64)
+    # ICDAR need box points in clockwise
+    quads = text_lines[:, [0, 1, 2, 3, 6, 7, 4, 5]]
+    if ltrb:
+        xs, ys = quads[:, 0::2], quads[:, 1::2]
+        points = np.stack([xs.min(axis=1), ys.min(axis=1), xs.max(axis=1), ys.max(axis=1)], axis=1)
+    else:
+        points = quads
+    # Same truncation as '%d'
+    return np.trunc(points).astype(np.int64)
+
+
+def _file_sha1(path):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+class IcdarEvaluator(object):
+    """Evaluate detections held in memory against a ground truth ZIP file.
+
+    The metrics are the ones of evaluate_method of the challenge script on the
+    equivalent submission ZIP file.
+    """
+
+    def __init__(self, challenge, gt_path, params=None, use_cache=True):
+        """
+        :param challenge: one of CHALLENGES, the directory of the script in tools/
+        :param gt_path: the ground truth ZIP file of the challenge
+        :param params: overrides of the default evaluation params of the script
+        :param use_cache: load the parsed ground truth from, or save it to, gt_cache_file
+        """
+        self._script = load_challenge_script(challenge)
+        self.challenge = challenge
+        self.params = self._script.default_evaluation_params()
+        if params is not None:
+            self.params.update(params)
+        # ICDAR13 challenges are always LTRB and have no LTRB param
+        self.ltrb = self.params.get('LTRB', True)
+        self.gt_cache_file = osp.splitext(gt_path)[0] + '_{:s}_gt.npz'.format(challenge)
+
+        key = None
+        self._gt = None
+        if use_cache:
+            key = self._gt_cache_key(gt_path)
+            self._gt = self._load_gt_cache(key)
+        if self._gt is None:
+            self._gt = self._parse_gt(gt_path)
+            if use_cache:
+                self._save_gt_cache(key)
+
+    def _parse_gt(self, gt_path):
+        rrc_evaluation_funcs = self._script.rrc_evaluation_funcs
+        gt = rrc_evaluation_funcs.load_zip_file(gt_path, self.params['GT_SAMPLE_NAME_2_ID'])
+        return [(sample_id, self._script.parse_gt_contents(gt[sample_id], self.params)) for sample_id in gt]
+
+    def _gt_cache_key(self, gt_path):
+        # The parsed values also depend on the params used to parse the file
+        parse_params = [self.challenge, self.params['GT_SAMPLE_NAME_2_ID'], self.params['CRLF'], self.ltrb]
+        return _file_sha1(gt_path) + ' ' + repr(parse_params)
+
+    def _load_gt_cache(self, key):
+        """
+        The cache holds the points of all the gt rectangles in one array with per-sample offsets.
+        The transcriptions are only used to find the don't care rectangles, only these flags are kept.
+        """
+        if not osp.exists(self.gt_cache_file):
+            return None
+        with np.load(self.gt_cache_file) as cache:
+            if str(cache['key']) != key:
+                return None
+            sample_ids = cache['sample_ids'].tolist()
+            offsets = cache['offsets']
+            points = cache['points'].tolist()
+            dont_care = cache['dont_care'].tolist()
+
+        gt = []
+        for i, sample_id in enumerate(sample_ids):
+            start, end = offsets[i], offsets[i + 1]
+            transcriptions = ['###' if d else '' for d in dont_care[start:end]]
+            gt.append((sample_id, (points[start:end], transcriptions)))
+        print('{} gt loaded from {}'.format(self.challenge, self.gt_cache_file))
+        return gt
+
+    def _save_gt_cache(self, key):
+        num_points = 4 if self.ltrb else 8
+        offsets = np.zeros((len(self._gt) + 1,), dtype=np.int64)
+        offsets[1:] = np.cumsum([len(points) for _, (points, _) in self._gt])
+        points = np.zeros((offsets[-1], num_points), dtype=np.float64)
+        dont_care = np.zeros((offsets[-1],), dtype=np.bool_)
+        for i, (_, (gt_points, transcriptions)) in enumerate(self._gt):
+            if len(gt_points) > 0:
+                points[offsets[i]:offsets[i + 1]] = gt_points
+            dont_care[offsets[i]:offsets[i + 1]] = [t == '###' for t in transcriptions]
+
+        # Written to a temporary file first so a concurrent evaluation never reads a partial cache
+        tmp_file = self.gt_cache_file + '.{:d}.tmp.npz'.format(os.getpid())
+        try:
+            np.savez(tmp_file, key=np.array(key), sample_ids=np.array(self.sample_ids, dtype=np.unicode_),
+                     offsets=offsets, points=points, dont_care=dont_care)
+            os.rename(tmp_file, self.gt_cache_file)
+            print('wrote {} gt to {}'.format(self.challenge, self.gt_cache_file))
+        except (IOError, OSError) as e:
+            print('Could not write the gt cache {}: {}'.format(self.gt_cache_file, e))
+
+    @property
+    def sample_ids(self):
+        return [sample_id for sample_id, _ in self._gt]
+
+    def sample_id(self, im_file):
+        """The sample id of the result file of an image, None if it does not match DET_SAMPLE_NAME_2_ID."""
+        im_name = osp.splitext(osp.basename(im_file))[0]
+        m = re.match(self.params['DET_SAMPLE_NAME_2_ID'], 'res_%s.txt' % im_name)
+        if m is None:
+            return None
+        return m.group(1) if len(m.groups()) > 0 else 'res_%s.txt' % im_name
+
+    def _det_values(self, dets):
+        num_points = 4 if self.ltrb else 8
+        dets = np.asarray(dets, dtype=np.float64)
+        if len(dets) == 0:
+            return [], []
+        # Same values as parsed back from the '%d' of the result files
+        points = np.trunc(dets[:, :num_points])
+        confidences = dets[:, num_points] if self.params.get('CONFIDENCES', False) else np.zeros((0,))
+        if len(confidences) > 0:
+            order = np.argsort(-confidences)
+            points = points[order]
+            confidences = confidences[order]
+        return points.tolist(), confidences.tolist()
+
+    def evaluate(self, detections):
+        """
+        :param detections: {sample id: array} of (N, 4) [xmin, ymin, xmax, ymax] boxes for the LTRB
+            challenges and of (N, 8) clockwise quadrilaterals otherwise, with an extra confidence
+            column when the CONFIDENCES param is set. A missing sample id is evaluated like a
+            missing result file
+        :return: the results dictionary of evaluate_method
+        """
+        gt_ids = set(self.sample_ids)
+        for sample_id in detections:
+            if sample_id not in gt_ids:
+                raise ValueError("The sample %s not present in GT" % sample_id)
+
+        sample_ids = []
+        samples = []
+        for sample_id, (gt_points, gt_transcriptions) in self._gt:
+            det_points, det_confidences = None, []
+            if sample_id in detections:
+                det_points, det_confidences = self._det_values(detections[sample_id])
+            sample_ids.append(sample_id)
+            samples.append((gt_points, gt_transcriptions, det_points, det_confidences, self.params))
+
+        return self._script.evaluate_samples(self._script.evaluate_sample_values, sample_ids, samples, self.params)
@@ -69,6 +69,8 @@ class imdb(object):
         #   gt_overlaps
         #   gt_classes
         #   flipped
+        #   text_lines (optional) (N, 8) quadrilaterals of the boxes, split
+        #     into the gt boxes by the minibatch at the training scale
         if self._roidb is not None:
             return self._roidb
         self._roidb = self.roidb_handler()
@@ -103,7 +105,9 @@ class imdb(object):
         raise NotImplementedError
 
     def _get_widths(self):
-        return [PIL.Image.open(self.image_path_at(i)).size[0]
+        # prepare_roidb has already read the image sizes
+        return [self.roidb[i]['width'] if 'width' in self.roidb[i]
+                else PIL.Image.open(self.image_path_at(i)).size[0]
                 for i in range(self.num_images)]
 
     def append_flipped_images(self):
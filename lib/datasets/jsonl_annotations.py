@@ -0,0 +1,88 @@
+# --------------------------------------------------------
+# Tensorflow CTPN
+# Licensed under The MIT License [see LICENSE for details]
+# --------------------------------------------------------
+"""Compact alternative to the PASCAL VOC XML annotation files.
+
+All the annotations of an image set are in one Annotations/<image_set>.jsonl
+file with one JSON record per image:
+
+    {"image": "<index>", "filename": "<index>.jpg", "size": [width, height, depth],
+     "database": "...", "boxes": [[xmin, ymin, xmax, ymax], ...],
+     "names": ["text", ...], "difficult": [0, ...]}
+
+The records hold the same data as the XML files written by tools/convert_utils,
+they are written one at a time by JsonlAnnotationWriter and read back with a
+single json.loads per image.
+
+A record may also hold the whole text lines instead of their slices:
+"text_lines": [[x1, y1, x2, y2, x3, y3, x4, y4], ...] with one quad per box,
+the boxes are then the bounding boxes of the lines. The training data layer
+splits them into gt boxes at the scale of each minibatch.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import os
+
+
+def annotation_record(index, img_name, img_size, boxes, database, cls='text', text_lines=None):
+    """
+    :param img_size: shape of the image, (height, width, depth)
+    :param boxes: [(xmin, ymin, xmax, ymax)], truncated to int like the XML files
+    :param text_lines: [(x1, y1, x2, y2, x3, y3, x4, y4)] left-top, right-top, right-bottom, left-bottom
+        quad of each box, when the boxes are whole text lines
+    """
+    boxes = [[int(b[0]), int(b[1]), int(b[2]), int(b[3])] for b in boxes]
+    record = {'image': index,
+              'filename': img_name,
+              'size': [int(img_size[1]), int(img_size[0]), int(img_size[2])],
+              'database': database,
+              'boxes': boxes,
+              'names': [cls] * len(boxes),
+              'difficult': [0] * len(boxes)}
+    if text_lines is not None:
+        assert len(text_lines) == len(boxes)
+        record['text_lines'] = [[int(v) for v in quad[:8]] for quad in text_lines]
+    return record
+
+
+class JsonlAnnotationWriter(object):
+    """Writes the records one line at a time to a temporary file, renamed to path by close()."""
+
+    def __init__(self, path):
+        self.path = path
+        self._tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        self._f = open(self._tmp_path, 'w')
+
+    def write(self, record):
+        self._f.write(json.dumps(record, separators=(',', ':')))
+        self._f.write('\n')
+
+    def close(self):
+        self._f.close()
+        os.replace(self._tmp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # Keep the previous annotations
+            self._f.close()
+            os.remove(self._tmp_path)
+
+
+def read_annotations(path):
+    """Returns {image index: record}"""
+    records = {}
+    with open(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                records[record['image']] = record
+    return records
@@ -9,7 +9,11 @@ from __future__ import division
 from __future__ import print_function
 
 import os
+import hashlib
+import multiprocessing
 from datasets.imdb import imdb
+from datasets.columnar_roidb import ColumnarRoidb
+from datasets.jsonl_annotations import read_annotations
 import datasets.ds_utils as ds_utils
 import xml.etree.ElementTree as ET
 import numpy as np
@@ -24,13 +28,22 @@ from model.config import cfg
 
 
 class pascal_voc(imdb):
-    def __init__(self, image_set, year, use_diff=False):
+    def __init__(self, image_set, year, use_diff=False, annotation_format='xml'):
+        """
+        :param annotation_format: 'xml' for one PASCAL VOC file per image, 'jsonl' for
+            the records of Annotations/<image_set>.jsonl (see datasets.jsonl_annotations)
+        """
+        assert annotation_format in ('xml', 'jsonl'), \
+            'Unknown annotation format: {}'.format(annotation_format)
         name = 'voc_' + year + '_' + image_set
         if use_diff:
             name += '_diff'
+        if annotation_format == 'jsonl':
+            name += '_jsonl'
         imdb.__init__(self, name)
         self._year = year
         self._image_set = image_set
+        self._annotation_format = annotation_format
         self._devkit_path = self._get_default_path()
         self._data_path = os.path.join(self._devkit_path, 'VOC' + self._year)
         self._classes = ('__background__',  # always index 0
@@ -95,25 +108,69 @@ class pascal_voc(imdb):
         """
         Return the database of ground-truth regions of interest.
 
-        This function loads/saves from/to a cache file to speed up future calls.
+        The boxes are stored in a columnar cache (see ColumnarRoidb) which is
+        memory-mapped on future calls, and rebuilt when an annotation file changes.
         """
-        cache_file = os.path.join(self.cache_path, self.name + '_gt_roidb.pkl')
-        if os.path.exists(cache_file):
-            with open(cache_file, 'rb') as fid:
-                try:
-                    roidb = pickle.load(fid)
-                except:
-                    roidb = pickle.load(fid, encoding='bytes')
-            print('{} gt roidb loaded from {}'.format(self.name, cache_file))
+        cache_dir = os.path.join(self.cache_path, self.name + '_gt_roidb')
+        key = self._annotations_key()
+        roidb = ColumnarRoidb.load(cache_dir, key, self.num_classes)
+        if roidb is not None:
+            print('{} gt roidb loaded from {}'.format(self.name, cache_dir))
             return roidb
 
-        gt_roidb = [self._load_pascal_annotation(index)
+        roidb = ColumnarRoidb.from_annotations(self._load_annotations(), self.num_classes)
+        roidb.save(cache_dir, key)
+        print('wrote gt roidb to {}'.format(cache_dir))
+
+        return roidb
+
+    def _annotation_path(self, index):
+        return os.path.join(self._data_path, 'Annotations', index + '.xml')
+
+    def _annotations_file(self):
+        return os.path.join(self._data_path, 'Annotations', self._image_set + '.jsonl')
+
+    def _annotations_key(self):
+        """
+        Key of the gt roidb cache, it changes whenever an annotation file
+        is modified, added to or removed from the image set.
+        """
+        sha1 = hashlib.sha1()
+        sha1.update(str(self.config['use_diff']).encode('utf-8'))
+        if self._annotation_format == 'jsonl':
+            mtime = os.path.getmtime(self._annotations_file())
+            sha1.update('jsonl:{}\n{}'.format(mtime, '\n'.join(self.image_index)).encode('utf-8'))
+            return sha1.hexdigest()
+        for index in self.image_index:
+            mtime = os.path.getmtime(self._annotation_path(index))
+            sha1.update('{}:{}\n'.format(index, mtime).encode('utf-8'))
+        return sha1.hexdigest()
+
+    def _load_annotations(self):
+        """
+        Parse the annotation files of all images with a process pool.
+        Returns [(boxes, gt_classes, seg_areas[, text_lines])] in image_index order.
+        """
+        if self._annotation_format == 'jsonl':
+            records = read_annotations(self._annotations_file())
+            return [_annotation_from_record(records[index], self.config['use_diff'], self._class_to_ind)
                     for index in self.image_index]
-        with open(cache_file, 'wb') as fid:
-            pickle.dump(gt_roidb, fid, pickle.HIGHEST_PROTOCOL)
-        print('wrote gt roidb to {}'.format(cache_file))
 
-        return gt_roidb
+        jobs = [(self._annotation_path(index), self.config['use_diff'], self._class_to_ind)
+                for index in self.image_index]
+
+        num_workers = cfg.ROIDB_WORKERS if cfg.ROIDB_WORKERS > 0 else multiprocessing.cpu_count()
+        if num_workers <= 1 or len(jobs) < 2:
+            return [_parse_annotation(job) for job in jobs]
+
+        print('Parsing {:d} annotations with {:d} processes'.format(len(jobs), num_workers))
+        pool = multiprocessing.Pool(num_workers)
+        try:
+            chunksize = max(1, len(jobs) // (num_workers * 4))
+            return pool.map(_parse_annotation, jobs, chunksize=chunksize)
+        finally:
+            pool.close()
+            pool.join()
 
     def rpn_roidb(self):
         if int(self._year) == 2007 or self._image_set != 'test':
@@ -139,53 +196,27 @@ class pascal_voc(imdb):
         Load image and bounding boxes info from XML file in the PASCAL VOC
         format.
         """
-        filename = os.path.join(self._data_path, 'Annotations', index + '.xml')
-        tree = ET.parse(filename)
-        objs = tree.findall('object')
-        if not self.config['use_diff']:
-            # Exclude the samples labeled as difficult
-            non_diff_objs = [
-                obj for obj in objs if int(obj.find('difficult').text) == 0]
-            # if len(non_diff_objs) != len(objs):
-            #     print 'Removed {} difficult objects'.format(
-            #         len(objs) - len(non_diff_objs))
-            objs = non_diff_objs
-        num_objs = len(objs)
-
-        boxes = np.zeros((num_objs, 4), dtype=np.uint16)
-        gt_classes = np.zeros((num_objs), dtype=np.int32)
-        overlaps = np.zeros((num_objs, self.num_classes), dtype=np.float32)
-        # "Seg" area for pascal is just the box area
-        seg_areas = np.zeros((num_objs), dtype=np.float32)
-
-        # Load object bounding boxes into a data frame.
-        for ix, obj in enumerate(objs):
-            bbox = obj.find('bndbox')
-            # Make pixel indexes 0-based
-            # Origin faster rcnn
-            # x1 = float(bbox.find('xmin').text) - 1
-            # y1 = float(bbox.find('ymin').text) - 1
-            # x2 = float(bbox.find('xmax').text) - 1
-            # y2 = float(bbox.find('ymax').text) - 1
-
-            x1 = float(bbox.find('xmin').text)
-            y1 = float(bbox.find('ymin').text)
-            x2 = float(bbox.find('xmax').text)
-            y2 = float(bbox.find('ymax').text)
-
-            cls = self._class_to_ind[obj.find('name').text.lower().strip()]
-            boxes[ix, :] = [x1, y1, x2, y2]
-            gt_classes[ix] = cls
-            overlaps[ix, cls] = 1.0
-            seg_areas[ix] = (x2 - x1 + 1) * (y2 - y1 + 1)
+        text_lines = None
+        if self._annotation_format == 'jsonl':
+            boxes, gt_classes, seg_areas, text_lines = _annotation_from_record(
+                read_annotations(self._annotations_file())[index], self.config['use_diff'], self._class_to_ind)
+        else:
+            boxes, gt_classes, seg_areas = _parse_annotation(
+                (self._annotation_path(index), self.config['use_diff'], self._class_to_ind))
+        num_objs = len(gt_classes)
 
+        overlaps = np.zeros((num_objs, self.num_classes), dtype=np.float32)
+        overlaps[np.arange(num_objs), gt_classes] = 1.0
         overlaps = scipy.sparse.csr_matrix(overlaps)
 
-        return {'boxes': boxes,
-                'gt_classes': gt_classes,
-                'gt_overlaps': overlaps,
-                'flipped': False,
-                'seg_areas': seg_areas}
+        entry = {'boxes': boxes,
+                 'gt_classes': gt_classes,
+                 'gt_overlaps': overlaps,
+                 'flipped': False,
+                 'seg_areas': seg_areas}
+        if text_lines is not None:
+            entry['text_lines'] = text_lines
+        return entry
 
     def _get_comp_id(self):
         comp_id = (self._comp_id + '_' + self._salt if self.config['use_salt']
@@ -227,6 +258,8 @@ class pascal_voc(imdb):
             'VOC' + self._year,
             'Annotations',
             '{:s}.xml')
+        if self._annotation_format == 'jsonl':
+            annopath = self._annotations_file()
         imagesetfile = os.path.join(
             self._devkit_path,
             'VOC' + self._year,
@@ -302,6 +335,66 @@ class pascal_voc(imdb):
             self.config['cleanup'] = True
 
 
+def _parse_annotation(args):
+    """
+    Parse the bounding boxes of one XML file in the PASCAL VOC format.
+    Module level so that it can be sent to the workers of a process pool.
+
+    :param args: (filename, use_diff, class_to_ind)
+    :return: boxes, gt_classes, seg_areas
+    """
+    filename, use_diff, class_to_ind = args
+    tree = ET.parse(filename)
+    objs = tree.findall('object')
+    if not use_diff:
+        # Exclude the samples labeled as difficult
+        objs = [obj for obj in objs if int(obj.find('difficult').text) == 0]
+    num_objs = len(objs)
+
+    boxes = np.zeros((num_objs, 4), dtype=np.uint16)
+    gt_classes = np.zeros((num_objs), dtype=np.int32)
+    # "Seg" area for pascal is just the box area
+    seg_areas = np.zeros((num_objs), dtype=np.float32)
+
+    # Load object bounding boxes into a data frame.
+    for ix, obj in enumerate(objs):
+        bbox = obj.find('bndbox')
+        # Make pixel indexes 0-based
+        # Origin faster rcnn
+        # x1 = float(bbox.find('xmin').text) - 1
+        # y1 = float(bbox.find('ymin').text) - 1
+        # x2 = float(bbox.find('xmax').text) - 1
+        # y2 = float(bbox.find('ymax').text) - 1
+
+        x1 = float(bbox.find('xmin').text)
+        y1 = float(bbox.find('ymin').text)
+        x2 = float(bbox.find('xmax').text)
+        y2 = float(bbox.find('ymax').text)
+
+        boxes[ix, :] = [x1, y1, x2, y2]
+        gt_classes[ix] = class_to_ind[obj.find('name').text.lower().strip()]
+        seg_areas[ix] = (x2 - x1 + 1) * (y2 - y1 + 1)
+
+    return boxes, gt_classes, seg_areas
+
+
+def _annotation_from_record(record, use_diff, class_to_ind):
+    """
+    Same values as _parse_annotation, from a record of a .jsonl annotation file.
+
+    :return: boxes, gt_classes, seg_areas, text_lines (None when the record has no whole text lines)
+    """
+    keep = [i for i, d in enumerate(record['difficult']) if use_diff or d == 0]
+    boxes = np.array([record['boxes'][i] for i in keep], dtype=np.uint16).reshape((-1, 4))
+    gt_classes = np.array([class_to_ind[record['names'][i].lower().strip()] for i in keep], dtype=np.int32)
+    coords = np.array([record['boxes'][i] for i in keep], dtype=np.float64).reshape((-1, 4))
+    seg_areas = ((coords[:, 2] - coords[:, 0] + 1) * (coords[:, 3] - coords[:, 1] + 1)).astype(np.float32)
+    text_lines = None
+    if 'text_lines' in record:
+        text_lines = np.array([record['text_lines'][i] for i in keep], dtype=np.float32).reshape((-1, 8))
+    return boxes, gt_classes, seg_areas, text_lines
+
+
 if __name__ == '__main__':
     from datasets.pascal_voc import pascal_voc
 
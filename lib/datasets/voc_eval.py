@@ -9,9 +9,12 @@ from __future__ import print_function
 
 import xml.etree.ElementTree as ET
 import os
-import pickle
+import hashlib
+import multiprocessing
 import numpy as np
 
+from datasets.jsonl_annotations import read_annotations
+
 
 def parse_rec(filename):
     """ Parse a PASCAL VOC xml file """
@@ -67,6 +70,128 @@ def voc_ap(rec, prec, use_07_metric=False):
     return ap
 
 
+def _parse_columns(filename):
+    objects = parse_rec(filename)
+    return ([obj['name'] for obj in objects],
+            [obj['bbox'] for obj in objects],
+            [obj['difficult'] for obj in objects])
+
+
+def _annots_key(annopath, imagenames):
+    """ Changes whenever an annotation file is modified, added or removed """
+    sha1 = hashlib.sha1()
+    if annopath.endswith('.jsonl'):
+        mtime = os.path.getmtime(annopath)
+        sha1.update('jsonl:{}\n{}'.format(mtime, '\n'.join(imagenames)).encode('utf-8'))
+        return sha1.hexdigest()
+    for imagename in imagenames:
+        mtime = os.path.getmtime(annopath.format(imagename))
+        sha1.update('{}:{}\n'.format(imagename, mtime).encode('utf-8'))
+    return sha1.hexdigest()
+
+
+def load_annots(annopath, imagenames, cachefile):
+    """ offsets, names, bbox, difficult = load_annots(annopath, imagenames, cachefile)
+    Columns of the objects of all images, the objects of imagenames[i]
+    are the rows offsets[i]:offsets[i + 1]. They are cached in the .npz
+    cachefile, which is rebuilt when an annotation file changes.
+    annopath is either the format string of the XML file of an image or
+    a .jsonl file holding all of them (see datasets.jsonl_annotations).
+    """
+    key = _annots_key(annopath, imagenames)
+    if os.path.isfile(cachefile):
+        with np.load(cachefile) as cache:
+            if str(cache['key']) == key:
+                return cache['offsets'], cache['names'], cache['bbox'], cache['difficult']
+
+    filenames = [annopath.format(imagename) for imagename in imagenames]
+    print('Reading annotation for {:d} images'.format(len(filenames)))
+    num_workers = multiprocessing.cpu_count()
+    if annopath.endswith('.jsonl'):
+        records = read_annotations(annopath)
+        recs = [(records[imagename]['names'], records[imagename]['boxes'], records[imagename]['difficult'])
+                for imagename in imagenames]
+    elif num_workers <= 1 or len(filenames) < 2:
+        recs = [_parse_columns(filename) for filename in filenames]
+    else:
+        pool = multiprocessing.Pool(num_workers)
+        try:
+            chunksize = max(1, len(filenames) // (num_workers * 4))
+            recs = pool.map(_parse_columns, filenames, chunksize=chunksize)
+        finally:
+            pool.close()
+            pool.join()
+
+    offsets = np.zeros((len(recs) + 1,), dtype=np.int64)
+    offsets[1:] = np.cumsum([len(rec[0]) for rec in recs])
+    names = np.array([name for rec in recs for name in rec[0]], dtype=np.unicode_)
+    bbox = np.array([b for rec in recs for b in rec[1]], dtype=np.int64).reshape((-1, 4))
+    difficult = np.array([d for rec in recs for d in rec[2]], dtype=np.bool_)
+
+    print('Saving cached annotations to {:s}'.format(cachefile))
+    np.savez(cachefile, key=np.array(key), offsets=offsets, names=names, bbox=bbox, difficult=difficult)
+    return offsets, names, bbox, difficult
+
+
+def _match_detections(BB, gt_start, gt_count, BBGT, difficult, ovthresh):
+    """ tp, fp = _match_detections(BB, gt_start, gt_count, BBGT, difficult, ovthresh)
+    Greedy matching of the detections BB, sorted by decreasing confidence,
+    to the ground truth boxes BBGT. The boxes of the image of BB[d] are the
+    gt_count[d] rows of BBGT from gt_start[d]. The overlaps of every detection
+    with the boxes of its image are computed at once, one segment per detection.
+    """
+    nd = len(BB)
+    tp = np.zeros(nd)
+    fp = np.zeros(nd)
+
+    # one (detection, box of its image) pair per row
+    num_pairs = int(np.sum(gt_count))
+    pair_det = np.repeat(np.arange(nd), gt_count)
+    pair_start = np.cumsum(gt_count) - gt_count
+    pair_local = np.arange(num_pairs) - pair_start[pair_det]
+    pair_gt = gt_start[pair_det] + pair_local
+    bb = BB[pair_det]
+    gt = BBGT[pair_gt]
+
+    # compute overlaps
+    # intersection
+    ixmin = np.maximum(gt[:, 0], bb[:, 0])
+    iymin = np.maximum(gt[:, 1], bb[:, 1])
+    ixmax = np.minimum(gt[:, 2], bb[:, 2])
+    iymax = np.minimum(gt[:, 3], bb[:, 3])
+    iw = np.maximum(ixmax - ixmin + 1., 0.)
+    ih = np.maximum(iymax - iymin + 1., 0.)
+    inters = iw * ih
+
+    # union
+    uni = ((bb[:, 2] - bb[:, 0] + 1.) * (bb[:, 3] - bb[:, 1] + 1.) +
+           (gt[:, 2] - gt[:, 0] + 1.) *
+           (gt[:, 3] - gt[:, 1] + 1.) - inters)
+
+    overlaps = inters / uni
+
+    # max overlap of each detection and its first box, detections of an image without boxes are not matched
+    has_gt = gt_count > 0
+    jmax = np.zeros(nd, dtype=np.int64)
+    matched = np.zeros(nd, dtype=np.bool_)
+    if num_pairs > 0:
+        segments = pair_start[has_gt]
+        ovmax = np.maximum.reduceat(overlaps, segments)
+        is_max = overlaps == ovmax[np.cumsum(has_gt)[pair_det] - 1]
+        jmax[has_gt] = np.minimum.reduceat(np.where(is_max, pair_local, num_pairs), segments)
+        matched[has_gt] = ovmax > ovthresh
+    fp[~matched] = 1.
+
+    # detections of difficult boxes are neither true nor false positives
+    inds = np.where(matched)[0]
+    inds = inds[~difficult[gt_start[inds] + jmax[inds]]]
+    # a box is only detected by its first detection, the next ones are false positives
+    _, first = np.unique(gt_start[inds] + jmax[inds], return_index=True)
+    tp[inds[first]] = 1.
+    fp[inds] = 1. - tp[inds]
+    return tp, fp
+
+
 def voc_eval(detpath,
              annopath,
              imagesetfile,
@@ -87,7 +212,8 @@ def voc_eval(detpath,
     detpath: Path to detections
         detpath.format(classname) should produce the detection results file.
     annopath: Path to annotations
-        annopath.format(imagename) should be the xml annotations file.
+        annopath.format(imagename) should be the xml annotations file,
+        or annopath is a .jsonl file with the annotations of all images.
     imagesetfile: Text file containing the list of images, one image per line.
     classname: Category name (duh)
     cachedir: Directory for caching the annotations
@@ -98,52 +224,30 @@ def voc_eval(detpath,
     # assumes detections are in detpath.format(classname)
     # assumes annotations are in annopath.format(imagename)
     # assumes imagesetfile is a text file with each line an image name
-    # cachedir caches the annotations in a pickle file
+    # cachedir caches the annotations in a npz file
 
     # first load gt
     if not os.path.isdir(cachedir):
         os.mkdir(cachedir)
-    cachefile = os.path.join(cachedir, '%s_annots.pkl' % imagesetfile)
+    cachefile = os.path.join(cachedir, '%s_annots.npz' % os.path.basename(imagesetfile))
     # read list of images
     with open(imagesetfile, 'r') as f:
         lines = f.readlines()
     imagenames = [x.strip() for x in lines]
 
-    if not os.path.isfile(cachefile):
-        # load annotations
-        recs = {}
-        for i, imagename in enumerate(imagenames):
-            recs[imagename] = parse_rec(annopath.format(imagename))
-            if i % 100 == 0:
-                print('Reading annotation for {:d}/{:d}'.format(
-                    i + 1, len(imagenames)))
-        # save
-        print('Saving cached annotations to {:s}'.format(cachefile))
-        with open(cachefile, 'w') as f:
-            pickle.dump(recs, f)
-    else:
-        # load
-        with open(cachefile, 'rb') as f:
-            try:
-                recs = pickle.load(f)
-            except:
-                recs = pickle.load(f, encoding='bytes')
+    offsets, names, bbox, difficult = load_annots(annopath, imagenames, cachefile)
 
     # extract gt objects for this class
-    class_recs = {}
-    npos = 0
-    for imagename in imagenames:
-        R = [obj for obj in recs[imagename] if obj['name'] == classname]
-        bbox = np.array([x['bbox'] for x in R])
-        if use_diff:
-            difficult = np.array([False for x in R]).astype(np.bool)
-        else:
-            difficult = np.array([x['difficult'] for x in R]).astype(np.bool)
-        det = [False] * len(R)
-        npos = npos + sum(~difficult)
-        class_recs[imagename] = {'bbox': bbox,
-                                 'difficult': difficult,
-                                 'det': det}
+    is_class = names == classname
+    if use_diff:
+        difficult = np.zeros_like(difficult)
+    npos = int(np.sum(is_class & ~difficult))
+    # boxes of the class, still grouped by image
+    class_count = np.diff(np.concatenate([[0], np.cumsum(is_class)])[offsets])
+    class_start = np.cumsum(class_count) - class_count
+    BBGT = bbox[is_class].astype(float)
+    difficult = difficult[is_class]
+    image_inds = dict(zip(imagenames, range(len(imagenames))))
 
     # read dets
     detfile = detpath.format(classname)
@@ -162,46 +266,13 @@ def voc_eval(detpath,
     if BB.shape[0] > 0:
         # sort by confidence
         sorted_ind = np.argsort(-confidence)
-        sorted_scores = np.sort(-confidence)
         BB = BB[sorted_ind, :]
         image_ids = [image_ids[x] for x in sorted_ind]
 
-        # go down dets and mark TPs and FPs
-        for d in range(nd):
-            R = class_recs[image_ids[d]]
-            bb = BB[d, :].astype(float)
-            ovmax = -np.inf
-            BBGT = R['bbox'].astype(float)
-
-            if BBGT.size > 0:
-                # compute overlaps
-                # intersection
-                ixmin = np.maximum(BBGT[:, 0], bb[0])
-                iymin = np.maximum(BBGT[:, 1], bb[1])
-                ixmax = np.minimum(BBGT[:, 2], bb[2])
-                iymax = np.minimum(BBGT[:, 3], bb[3])
-                iw = np.maximum(ixmax - ixmin + 1., 0.)
-                ih = np.maximum(iymax - iymin + 1., 0.)
-                inters = iw * ih
-
-                # union
-                uni = ((bb[2] - bb[0] + 1.) * (bb[3] - bb[1] + 1.) +
-                       (BBGT[:, 2] - BBGT[:, 0] + 1.) *
-                       (BBGT[:, 3] - BBGT[:, 1] + 1.) - inters)
-
-                overlaps = inters / uni
-                ovmax = np.max(overlaps)
-                jmax = np.argmax(overlaps)
-
-            if ovmax > ovthresh:
-                if not R['difficult'][jmax]:
-                    if not R['det'][jmax]:
-                        tp[d] = 1.
-                        R['det'][jmax] = 1
-                    else:
-                        fp[d] = 1.
-            else:
-                fp[d] = 1.
+        # the boxes of an image can only be matched by the detections of that image
+        det_image = np.array([image_inds[image_id] for image_id in image_ids], dtype=np.int64)
+        tp, fp = _match_detections(BB, class_start[det_image], class_count[det_image],
+                                   BBGT, difficult, ovthresh)
 
     # compute precision recall
     fp = np.cumsum(fp)
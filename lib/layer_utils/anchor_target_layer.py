@@ -18,27 +18,58 @@ from model.bbox_transform import bbox_transform
 
 def anchor_target_layer(rpn_cls_score, gt_boxes, im_info, all_anchors, num_anchors):
     """
-    Same as the anchor target layer in original Fast/er RCNN
+    Same as the anchor target layer in original Fast/er RCNN, the targets of
+    every image in the batch are computed separately
     :param
-      rpn_cls_score: (1, H, W, Ax2) bg/fg scores of previous conv layer
-      gt_boxes: (G, 5) vstack of [x1, y1, x2, y2, class]
-      im_info: [image_height, image_width]
+      rpn_cls_score: (N, H, W, Ax2) bg/fg scores of previous conv layer
+      gt_boxes: (G, 6) vstack of [x1, y1, x2, y2, class, batch index]
+      im_info: (N, 3) [image_height, image_width, scale] of each image,
+        without the padding of the batch
       all_anchors: all anchors pre generated
       num_anchors:
     :returns
-        rpn_labels: (1, H, W, A)
-        rpn_bbox_targets: (1, H, W, Ax4)
+        rpn_labels: (N, H, W, A)
+        rpn_bbox_targets: (N, H, W, Ax4)
     """
     A = num_anchors
+    num_images = rpn_cls_score.shape[0]
+
+    # map of shape (..., H, W), height/width for feature map
+    height, width = rpn_cls_score.shape[1:3]
+
+    targets = [_anchor_target_image(gt_boxes[gt_boxes[:, 5] == i, :5], im_info[i], all_anchors)
+               for i in range(num_images)]
+    labels, bbox_targets, bbox_inside_weights, bbox_outside_weights = zip(*targets)
+
+    # labels
+    rpn_labels = np.stack(labels).reshape((num_images, height, width, A))
+
+    # bbox_targets
+    rpn_bbox_targets = np.stack(bbox_targets).reshape((num_images, height, width, A * 4))
+
+    # bbox_inside_weights
+    rpn_bbox_inside_weights = np.stack(bbox_inside_weights).reshape((num_images, height, width, A * 4))
+
+    # bbox_outside_weights
+    rpn_bbox_outside_weights = np.stack(bbox_outside_weights).reshape((num_images, height, width, A * 4))
+
+    return rpn_labels, rpn_bbox_targets, rpn_bbox_inside_weights, rpn_bbox_outside_weights
+
+
+def _anchor_target_image(gt_boxes, im_info, all_anchors):
+    """
+    Anchor targets of a single image
+    :param
+      gt_boxes: (G, 5) vstack of [x1, y1, x2, y2, class]
+      im_info: [image_height, image_width, scale]
+    :returns
+      labels: (K x A,), bbox_targets, bbox_inside_weights, bbox_outside_weights: (K x A, 4)
+    """
     total_anchors = all_anchors.shape[0]
-    K = total_anchors / num_anchors
 
     # allow boxes to sit over the edge by a small amount
     _allowed_border = 0
 
-    # map of shape (..., H, W), height/width for feature map
-    height, width = rpn_cls_score.shape[1:3]
-
     # print("rpn: gt_boxes.shape %d" % gt_boxes.shape)
     # print("rpn: gt_boxes", gt_boxes)
     # only keep anchors inside the image
@@ -60,15 +91,22 @@ def anchor_target_layer(rpn_cls_score, gt_boxes, im_info, all_anchors, num_ancho
 
     # overlaps between the anchors and the gt boxes
     # overlaps (ex, gt)
-    overlaps = bbox_overlaps(
-        np.ascontiguousarray(anchors, dtype=np.float),
-        np.ascontiguousarray(gt_boxes, dtype=np.float))
-    argmax_overlaps = overlaps.argmax(axis=1)
-    max_overlaps = overlaps[np.arange(len(inds_inside)), argmax_overlaps]
-    gt_argmax_overlaps = overlaps.argmax(axis=0)
-    gt_max_overlaps = overlaps[gt_argmax_overlaps,
-                               np.arange(overlaps.shape[1])]
-    gt_argmax_overlaps = np.where(overlaps == gt_max_overlaps)[0]
+    if len(gt_boxes) == 0:
+        # an image without text only provides negative anchors
+        gt_boxes = np.zeros((1, 5), dtype=np.float32)
+        argmax_overlaps = np.zeros((len(inds_inside),), dtype=np.int64)
+        max_overlaps = np.zeros((len(inds_inside),), dtype=np.float32)
+        gt_argmax_overlaps = np.zeros((0,), dtype=np.int64)
+    else:
+        overlaps = bbox_overlaps(
+            np.ascontiguousarray(anchors, dtype=np.float),
+            np.ascontiguousarray(gt_boxes, dtype=np.float))
+        argmax_overlaps = overlaps.argmax(axis=1)
+        max_overlaps = overlaps[np.arange(len(inds_inside)), argmax_overlaps]
+        gt_argmax_overlaps = overlaps.argmax(axis=0)
+        gt_max_overlaps = overlaps[gt_argmax_overlaps,
+                                   np.arange(overlaps.shape[1])]
+        gt_argmax_overlaps = np.where(overlaps == gt_max_overlaps)[0]
 
     if not cfg.TRAIN.RPN_CLOBBER_POSITIVES:
         # assign bg labels first so that positive labels can clobber them
@@ -137,23 +175,7 @@ def anchor_target_layer(rpn_cls_score, gt_boxes, im_info, all_anchors, num_ancho
     bbox_inside_weights = _unmap(bbox_inside_weights, total_anchors, inds_inside, fill=0)
     bbox_outside_weights = _unmap(bbox_outside_weights, total_anchors, inds_inside, fill=0)
 
-    # labels
-    labels = labels.reshape((1, height, width, A))
-    rpn_labels = labels
-
-    # bbox_targets
-    bbox_targets = bbox_targets.reshape((1, height, width, A * 4))
-    rpn_bbox_targets = bbox_targets
-
-    # bbox_inside_weights
-    bbox_inside_weights = bbox_inside_weights.reshape((1, height, width, A * 4))
-    rpn_bbox_inside_weights = bbox_inside_weights
-
-    # bbox_outside_weights
-    bbox_outside_weights = bbox_outside_weights.reshape((1, height, width, A * 4))
-    rpn_bbox_outside_weights = bbox_outside_weights
-
-    return rpn_labels, rpn_bbox_targets, rpn_bbox_inside_weights, rpn_bbox_outside_weights
+    return labels, bbox_targets, bbox_inside_weights, bbox_outside_weights
 
 
 def _unmap(data, count, inds, fill=0):
@@ -17,10 +17,15 @@ def proposal_top_layer(rpn_cls_prob, rpn_bbox_pred, im_info, anchors, num_anchor
     """A layer that just selects the top region proposals
        without using non-maximal suppression,
        For details please see the technical report
+    :param
+      rpn_cls_prob: (1, H, W, Ax2) softmax result of rpn scores, same layout as in proposal_layer
+      rpn_bbox_pred: (1, H, W, Ax4) 1x1 conv result for rpn bbox
     """
     rpn_top_n = cfg.TEST.RPN_TOP_N
 
-    scores = rpn_cls_prob[:, :, :, num_anchors:]
+    # Scores of text, see proposal_layer
+    height, width = rpn_cls_prob.shape[1:3]
+    scores = np.reshape(rpn_cls_prob, [1, height, width, num_anchors, 2])[:, :, :, :, 1]
 
     rpn_bbox_pred = rpn_bbox_pred.reshape((-1, 4))
     scores = scores.reshape((-1, 1))
@@ -46,9 +51,7 @@ def proposal_top_layer(rpn_cls_prob, rpn_bbox_pred, im_info, anchors, num_anchor
     # Clip predicted boxes to image
     proposals = clip_boxes(proposals, im_info[:2])
 
-    # Output rois blob
-    # Our RPN implementation only supports a single input image, so all
-    # batch inds are 0
-    batch_inds = np.zeros((proposals.shape[0], 1), dtype=np.float32)
-    blob = np.hstack((batch_inds, proposals.astype(np.float32, copy=False)))
+    # Output rois blob [score, x1, y1, x2, y2] like proposal_layer
+    # Only support single image as input
+    blob = np.hstack((scores.astype(np.float32, copy=False), proposals.astype(np.float32, copy=False)))
     return blob, scores
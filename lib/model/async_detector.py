@@ -0,0 +1,163 @@
+# --------------------------------------------------------
+# Tensorflow CTPN
+# Licensed under The MIT License [see LICENSE for details]
+# --------------------------------------------------------
+"""asyncio API of the text line detection.
+
+The blocking parts of a detection are run in executors: the image blob and
+the post-processing (proposals and TextDetector) in a thread pool, the
+network in a single thread that owns the session. The images awaiting the
+network are coalesced into micro-batches: a batch waits at most
+batch_timeout for max_batch_size images, then the images of the same blob
+shape are run in one sess.run (the other shapes are run one by one, padding
+them would change the outputs of the BiLSTM).
+
+A detection is cancelled like any coroutine or by its timeout, a cancelled
+image still waiting for its batch is not run. close() cancels the detections
+waiting for or in a batch.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from model.config import cfg
+from model.test import _get_blobs, _rpn_outputs, _rpn_detections, im_detect_rpn, recover_scale
+from text_connector import TextDetector
+
+
+class AsyncTextDetector(object):
+    def __init__(self, rpn_fn, oriented=False, config=None, max_batch_size=8, batch_timeout=0.005,
+                 num_workers=None):
+        """
+        :param rpn_fn: (N, H, W, 3) image blob -> {'rpn_cls_prob': (N, H', W', Ax2), 'rpn_bbox_pred': (N, H', W', Ax4)},
+            e.g. Network.test_rpn of a loaded session, see from_session
+        :param config: default text_connect_cfg.Config of the detections
+        :param batch_timeout: longest wait for the other images of a batch, in seconds
+        :param num_workers: threads of the blobs and post-processing
+        """
+        self._rpn_fn = rpn_fn
+        self._line_detector = TextDetector(oriented, config)
+        self.max_batch_size = max_batch_size
+        self.batch_timeout = batch_timeout
+        # One thread runs the network, the session is never run by two batches at once
+        self._run_executor = ThreadPoolExecutor(1)
+        self._executor = ThreadPoolExecutor(num_workers)
+        self._queue = None
+        self._batcher = None
+        self._closed = False
+
+    @classmethod
+    def from_session(cls, sess, net, **kwargs):
+        """:param net: a network whose TEST architecture is created and restored in sess"""
+        return cls(lambda image: net.test_rpn(sess, image), **kwargs)
+
+    async def detect(self, im, config=None, timeout=None):
+        """
+        :param im: RGB image, as read by utils.helper.read_rgb_img
+        :param config: text_connect_cfg.Config of this detection, the one of the detector when None
+        :param timeout: seconds before asyncio.TimeoutError, no limit when None
+        :return: text lines [x1, y1, x2, y2, x3, y3, x4, y4, score] on the image
+        """
+        return await asyncio.wait_for(self._detect(im, config), timeout)
+
+    async def _detect(self, im, config):
+        loop = asyncio.get_event_loop()
+        if cfg.TEST.GATE or cfg.TEST.CROP or len(cfg.TEST.SCALES) > 1:
+            # Several passes per image, not batched with the other images
+            scores, boxes, resized_im_shape, im_scale = await loop.run_in_executor(
+                self._run_executor, im_detect_rpn, self._rpn_fn, im)
+        else:
+            blobs, im_scales = await loop.run_in_executor(self._executor, _get_blobs, im)
+            blob, im_scale = blobs['data'], im_scales[0]
+            outputs = await self._run_batched(blob)
+            resized_im_shape = blob.shape[1:3]
+            scores, boxes = await loop.run_in_executor(self._executor, _rpn_detections,
+                                                       outputs, resized_im_shape, im_scale)
+
+        return await loop.run_in_executor(self._executor, self._text_lines,
+                                          scores, boxes, resized_im_shape, im_scale, config)
+
+    def _text_lines(self, scores, boxes, resized_im_shape, im_scale, config):
+        text_lines = self._line_detector.detect(boxes, scores[:, np.newaxis], resized_im_shape, config)
+        if len(text_lines) != 0:
+            text_lines = recover_scale(text_lines, im_scale)
+        return text_lines
+
+    async def _run_batched(self, blob):
+        """RPN predictions of the blob, run in the next batch"""
+        if self._closed:
+            raise RuntimeError('The detector is closed')
+        if self._batcher is None:
+            self._queue = asyncio.Queue()
+            self._batcher = asyncio.ensure_future(self._batch_loop())
+        future = asyncio.get_event_loop().create_future()
+        self._queue.put_nowait((blob, future))
+        return await future
+
+    async def _batch_loop(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            batch = [await self._queue.get()]
+            try:
+                await self._run_batch(loop, batch)
+            except asyncio.CancelledError:
+                # Closed while the batch was collected or run, its detections would never return
+                for _, future in batch:
+                    if not future.done():
+                        future.cancel()
+                raise
+
+    async def _run_batch(self, loop, batch):
+        """Completes batch with the next images of the queue and sets the RPN predictions of its futures"""
+        if self._queue.qsize() < self.max_batch_size - 1:
+            await asyncio.sleep(self.batch_timeout)
+        while len(batch) < self.max_batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+
+        # The cancelled detections are not run
+        running = [(blob, future) for blob, future in batch if not future.done()]
+        if len(running) == 0:
+            return
+        try:
+            outputs = await loop.run_in_executor(self._run_executor, _rpn_outputs, self._rpn_fn,
+                                                 [blob for blob, _ in running])
+        except asyncio.CancelledError:
+            # An Exception before Python 3.8, the cancellation of close() must reach _batch_loop
+            raise
+        except Exception as e:
+            for _, future in running:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), output in zip(running, outputs):
+            if not future.done():
+                future.set_result(output)
+
+    async def close(self):
+        """Stop the batching, the detections waiting for or in a batch are cancelled"""
+        self._closed = True
+        if self._batcher is not None:
+            self._batcher.cancel()
+            try:
+                await self._batcher
+            except asyncio.CancelledError:
+                pass
+            while not self._queue.empty():
+                _, future = self._queue.get_nowait()
+                future.cancel()
+            self._batcher = None
+        # The session may be closed once this returns, wait for the batch still running in it
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self._run_executor.shutdown)
+        await loop.run_in_executor(None, self._executor.shutdown)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
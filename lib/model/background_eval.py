@@ -0,0 +1,125 @@
+# --------------------------------------------------------
+# Tensorflow CTPN
+# Licensed under The MIT License [see LICENSE for details]
+# --------------------------------------------------------
+"""Evaluate the training snapshots on a held-out set in a background process.
+
+The process has its own graph and session. It restores each snapshot it is
+given, detects the text lines of the held-out images like tools/icdar.py and
+writes the ICDAR precision, recall and hmean to TensorBoard, while the
+training loop goes on.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import copy
+import glob
+import multiprocessing
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from model.config import cfg
+from model.test import im_detect, recover_scale
+from text_connector import TextDetector
+from datasets.icdar_eval import IcdarEvaluator, text_lines_to_points
+from utils import helper
+
+
+def _detect_points(sess, net, im_file, line_detector, ltrb):
+    im = helper.read_rgb_img(im_file)
+    scores, boxes, resized_im_shape, im_scale = im_detect(sess, net, im)
+    text_lines = line_detector.detect(boxes, scores[:, np.newaxis], resized_im_shape)
+    if len(text_lines) != 0:
+        text_lines = recover_scale(text_lines, im_scale)
+    return text_lines_to_points(text_lines, ltrb)
+
+
+def _evaluate_snapshots(queue, network, num_classes, config, tbdir):
+    """Body of the evaluation process, evaluates the snapshots of the queue until it gets None."""
+    # The process is spawned, the config of the training has to be set again
+    cfg.update(config)
+
+    evaluator = IcdarEvaluator(cfg.TRAIN.EVAL_CHALLENGE, cfg.TRAIN.EVAL_GT)
+    im_files = []
+    for im_file in sorted(glob.glob(os.path.join(cfg.TRAIN.EVAL_IMG_DIR, '*.*'))):
+        sample_id = evaluator.sample_id(im_file)
+        if sample_id is not None:
+            im_files.append((sample_id, im_file))
+
+    tfconfig = tf.ConfigProto(allow_soft_placement=True)
+    tfconfig.gpu_options.allow_growth = True
+
+    with tf.Graph().as_default(), tf.Session(config=tfconfig) as sess:
+        network.create_architecture('TEST', num_classes, tag='default',
+                                    anchor_width=cfg.CTPN.ANCHOR_WIDTH,
+                                    anchor_h_ratio_step=cfg.CTPN.H_RADIO_STEP,
+                                    num_anchors=cfg.CTPN.NUM_ANCHORS)
+        saver = tf.train.Saver()
+        writer = tf.summary.FileWriter(tbdir)
+        line_detector = TextDetector(cfg.TRAIN.EVAL_ORIENTED)
+
+        item = queue.get()
+        while item is not None:
+            # Only the last snapshot is evaluated when the training is faster than the evaluation
+            while not queue.empty():
+                next_item = queue.get()
+                if next_item is None:
+                    queue.put(None)
+                    break
+                item = next_item
+
+            filename, iter = item
+            # The snapshot may have been removed by remove_snapshot meanwhile
+            if os.path.exists(filename + '.index') or os.path.exists(filename):
+                saver.restore(sess, filename)
+                detections = {}
+                for sample_id, im_file in im_files:
+                    detections[sample_id] = _detect_points(sess, network, im_file, line_detector, evaluator.ltrb)
+                metrics = evaluator.evaluate(detections)['method']
+
+                summary = tf.Summary(value=[tf.Summary.Value(tag='{}/{}'.format(evaluator.challenge, key),
+                                                             simple_value=metrics[key])
+                                            for key in ('precision', 'recall', 'hmean')])
+                writer.add_summary(summary, float(iter))
+                writer.flush()
+                print('Snapshot {:s} {:s}: precision {:.4f} recall {:.4f} hmean {:.4f}'.format(
+                    os.path.basename(filename), evaluator.challenge,
+                    metrics['precision'], metrics['recall'], metrics['hmean']))
+            else:
+                print('Snapshot {:s} not found, not evaluated'.format(filename))
+
+            item = queue.get()
+
+        writer.close()
+
+
+class BackgroundEvaluator(object):
+    """
+      Evaluates the snapshots submitted by the training in a separate process
+    """
+
+    def __init__(self, network, num_classes, tbdir):
+        """
+        :param network: a network whose architecture is not created yet, the process builds a copy for testing
+        :param tbdir: TensorBoard directory of the summaries
+        """
+        # TensorFlow is not fork-safe, the process starts from a fresh interpreter
+        ctx = multiprocessing.get_context('spawn')
+        self._queue = ctx.Queue()
+        self._process = ctx.Process(target=_evaluate_snapshots,
+                                    args=(self._queue, copy.deepcopy(network), num_classes,
+                                          copy.deepcopy(cfg), tbdir))
+        self._process.daemon = True
+        self._process.start()
+
+    def submit(self, filename, iter):
+        """Queue the snapshot written at iteration iter, returns immediately."""
+        self._queue.put((filename, iter))
+
+    def close(self):
+        """Wait for the evaluation of the snapshots already submitted."""
+        self._queue.put(None)
+        self._process.join()
@@ -24,6 +24,19 @@ __C.TRAIN.LEARNING_RATE = 0.001
 # Optimizer Adam, Momentum, RMS
 __C.TRAIN.OPTIMIZER = 'Adam'
 
+# Number of data-parallel replicas of the network, each tower gets its own
+# IMS_PER_BATCH images from a shard of the roidb and the gradients are averaged
+__C.TRAIN.NUM_TOWERS = 1
+
+# Device of each tower, formatted with the tower index. Use '/cpu:{}' to run
+# the towers on NUM_TOWERS virtual CPU devices
+__C.TRAIN.TOWER_DEVICE = '/gpu:{}'
+
+# Train with float16 compute and float32 master weights, the loss is scaled
+# dynamically to keep small gradients representable. Only rewrites GPU kernels,
+# needs TensorFlow 1.14 or later
+__C.TRAIN.MIXED_PRECISION = False
+
 # Momentum
 __C.TRAIN.MOMENTUM = 0.9
 
@@ -52,7 +65,7 @@ __C.TRAIN.BIAS_DECAY = False
 __C.TRAIN.USE_GT = False
 
 # Whether to use aspect-ratio grouping of training images, introduced merely for saving
-# GPU memory
+# GPU memory: the images of a minibatch have the same orientation so less padding is needed
 __C.TRAIN.ASPECT_GROUPING = False
 
 # The number of snapshots kept, older ones are deleted to save space
@@ -68,7 +81,8 @@ __C.TRAIN.SCALES = (600,)
 # Max pixel size of the longest side of a scaled input image
 __C.TRAIN.MAX_SIZE = 1200
 
-# Images to use per minibatch
+# Images to use per minibatch, they are padded to the size of the largest one.
+# The BiLSTM stops at the last column of each image, the padding does not change its outputs
 __C.TRAIN.IMS_PER_BATCH = 1
 
 # Fraction of minibatch that is labeled foreground (i.e. class > 0)
@@ -82,6 +96,8 @@ __C.TRAIN.FG_THRESH = 0.5
 __C.TRAIN.BG_THRESH_HI = 0.5
 __C.TRAIN.BG_THRESH_LO = 0.1
 
+# Use horizontally-flipped images during training, each sample is flipped
+# with a probability of 0.5 when it is loaded by the data layer
 __C.TRAIN.USE_FLIPPED = True
 
 # Train bounding-box regressors
@@ -94,6 +110,17 @@ __C.TRAIN.BBOX_THRESH = 0.5
 # Iterations between snapshots
 __C.TRAIN.SNAPSHOT_ITERS = 5000
 
+# Evaluate each snapshot on a held-out set of images in a background process and
+# write the ICDAR precision, recall and hmean to the validation TensorBoard.
+# Disabled when EVAL_IMG_DIR is empty. EVAL_GT is the ground truth ZIP file
+# of the challenge, see datasets.icdar_eval
+__C.TRAIN.EVAL_IMG_DIR = ''
+__C.TRAIN.EVAL_GT = ''
+__C.TRAIN.EVAL_CHALLENGE = 'ICDAR15'
+
+# Use the oriented text proposal connector for the snapshot evaluation
+__C.TRAIN.EVAL_ORIENTED = False
+
 # solver.prototxt specifies the snapshot path prefix, this adds an optional
 # infix to yield the path: <prefix>[_<infix>]_iters_XYZ.caffemodel
 __C.TRAIN.SNAPSHOT_PREFIX = 'res101_faster_rcnn'
@@ -161,10 +188,39 @@ __C.TRAIN.USE_ALL_GT = True
 #
 __C.TEST = edict()
 
-# Scale to use during testing (can NOT list multiple scales)
+# Scales to use during testing, several scales are run by im_detect_multiscale
 # The scale is the pixel size of an image's shortest side
 __C.TEST.SCALES = (600,)
 
+# Height range of the proposals kept from each scale of a multi-scale test, in pixels
+# of the resized image. The default is the range of the anchor heights
+__C.TEST.MULTI_SCALE_HEIGHTS = (11, 283)
+
+# Run the RPN at a low resolution first and skip the images without text
+__C.TEST.GATE = False
+
+# Scale and max size of the low resolution pass of the gate and the crops
+__C.TEST.GATE_SCALE = 300
+__C.TEST.GATE_MAX_SIZE = 600
+
+# The image is detected at full resolution when at least GATE_MIN_CELLS cells
+# of the feature map have a text anchor scored GATE_SCORE or more
+__C.TEST.GATE_SCORE = 0.7
+__C.TEST.GATE_MIN_CELLS = 2
+
+# Detect at full resolution only the crops of the image around the text found
+# by the low resolution pass
+__C.TEST.CROP = False
+
+# Score of the text cells of the low resolution heatmap
+__C.TEST.CROP_SCORE = 0.5
+
+# Margin around the text cells, in pixels of the resized image
+__C.TEST.CROP_MARGIN = 48
+
+# Detect the whole image when the crops cover more than this fraction of it
+__C.TEST.CROP_MAX_AREA = 0.6
+
 # Max pixel size of the longest side of a scaled input image
 __C.TEST.MAX_SIZE = 1200
 
@@ -244,6 +300,10 @@ __C.ROOT_DIR = osp.abspath(osp.join(osp.dirname(__file__), '..', '..'))
 # Data directory
 __C.DATA_DIR = osp.abspath(osp.join(__C.ROOT_DIR, 'data'))
 
+# Number of processes used to parse the annotation files when the gt roidb
+# cache is built, 0 to use one process per CPU core
+__C.ROIDB_WORKERS = 0
+
 # Name (or path to) the matlab executable
 __C.MATLAB = 'matlab'
 
@@ -272,6 +332,12 @@ __C.CTPN.NUM_ANCHORS = 10
 __C.CTPN.ANCHOR_WIDTH = 16
 __C.CTPN.H_RADIO_STEP = 0.7
 
+# Implementation of the BiLSTM of the RPN head
+#   'dynamic': bidirectional_dynamic_rnn of LSTMCells, steps through the feature columns in a while_loop
+#   'fused': one LSTMBlockFusedCell op per direction, much faster on CPU
+# Both have the same variables, a checkpoint trained with one can be restored with the other
+__C.CTPN.LSTM = 'dynamic'
+
 
 def get_output_dir(imdb, weights_filename):
     """Return the directory where experimental artifacts are placed.
@@ -11,6 +11,15 @@ from __future__ import print_function
 from model.config import cfg
 
 
+def _cpu_nms():
+    try:
+        from nms.cpu_nms import cpu_nms
+    except ImportError:
+        # The Cython extensions of lib/ are not built, e.g. with the numpy runtime of an exported model
+        from nms.py_cpu_nms import py_cpu_nms as cpu_nms
+    return cpu_nms
+
+
 def nms(dets, thresh, force_cpu=False):
     """Dispatch to either CPU or GPU NMS implementations."""
 
@@ -20,5 +29,4 @@ def nms(dets, thresh, force_cpu=False):
         from nms.gpu_nms import gpu_nms
         return gpu_nms(dets, thresh, device_id=0)
     else:
-        from nms.cpu_nms import cpu_nms
-        return cpu_nms(dets, thresh)
+        return _cpu_nms()(dets, thresh)
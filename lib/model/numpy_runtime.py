@@ -0,0 +1,84 @@
+# --------------------------------------------------------
+# Tensorflow CTPN
+# Licensed under The MIT License [see LICENSE for details]
+# --------------------------------------------------------
+"""Run a CTPN exported by tools/export_model.py without TensorFlow.
+
+The ONNX model computes the RPN predictions of the image blob, the
+rest of the detection is done with numpy like in the TEST graph: the anchors,
+proposal_layer and the box clipping of model.test.im_detect. TextDetector then
+connects the proposals into text lines. NMS falls back to nms/py_cpu_nms.py
+when the Cython extensions of lib/ are not built, so numpy, cv2 and the
+runtime of the model are the only dependencies.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+import numpy as np
+
+from model.test import im_detect_rpn, recover_scale
+from text_connector import TextDetector
+
+
+def _output_key(name):
+    """RPN/rpn_cls_prob:0 -> rpn_cls_prob"""
+    return name.split(':')[0].split('/')[-1]
+
+
+class OnnxModel(object):
+    def __init__(self, model_file, num_threads=0):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        self._session = onnxruntime.InferenceSession(model_file, options, providers=['CPUExecutionProvider'])
+        self._input_name = self._session.get_inputs()[0].name
+        self._output_names = [output.name for output in self._session.get_outputs()]
+
+    def __call__(self, image):
+        """:return: {prediction key: output}"""
+        outputs = self._session.run(self._output_names, {self._input_name: image})
+        return dict((_output_key(name), output) for name, output in zip(self._output_names, outputs))
+
+
+def load_model(model_file, num_threads=None):
+    ext = os.path.splitext(model_file)[1]
+    if ext == '.onnx':
+        return OnnxModel(model_file, num_threads or 0)
+    else:
+        raise ValueError('Unknown model format: {:s}'.format(model_file))
+
+
+def _run_batch(model, images):
+    """The exported models take one image, a batch is run one image at a time"""
+    outputs = [model(images[n:n + 1]) for n in range(len(images))]
+    return dict((key, np.concatenate([output[key] for output in outputs])) for key in outputs[0])
+
+
+def im_detect(model, im):
+    """model.test.im_detect with an exported model"""
+    return im_detect_rpn(lambda images: _run_batch(model, images), im)
+
+
+class ExportedTextDetector(object):
+    """
+      Detects the text lines of an image with an exported model, as tools/demo.py does with a checkpoint
+    """
+
+    def __init__(self, model_file, oriented=False, num_threads=None):
+        self.model = load_model(model_file, num_threads)
+        self.line_detector = TextDetector(oriented)
+
+    def detect(self, im):
+        """
+        :param im: RGB image, as read by utils.helper.read_rgb_img
+        :return: text lines [x1, y1, x2, y2, x3, y3, x4, y4, score] on the image
+        """
+        scores, boxes, resized_im_shape, im_scale = im_detect(self.model, im)
+        text_lines = self.line_detector.detect(boxes, scores[:, np.newaxis], resized_im_shape)
+        if len(text_lines) != 0:
+            text_lines = recover_scale(text_lines, im_scale)
+        return text_lines
@@ -0,0 +1,108 @@
+# --------------------------------------------------------
+# Tensorflow CTPN
+# Licensed under The MIT License [see LICENSE for details]
+# --------------------------------------------------------
+"""On-disk cache of the RPN predictions of the test images.
+
+The rpn_cls_prob, rpn_bbox_pred and im_info of each image are saved in a
+compressed <cache_dir>/<model key>/<image key>.npz file. The model key is the
+hash of the checkpoint and of the test config the predictions depend on, the
+image key the hash of the pixels of the image. im_detect_cached computes the
+proposals from the cached predictions with numpy like the TEST graph, so the
+settings of proposal_layer and TextDetector can be tuned over a whole set
+without running the network again.
+
+Only the single pass at TEST.SCALES[0] is cached, RpnCache refuses the test
+modes running several passes per image (TEST.GATE, TEST.CROP, several
+TEST.SCALES) rather than replaying detections they would not give.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import hashlib
+import os
+import os.path as osp
+
+import numpy as np
+
+from model.config import cfg
+from model.test import _get_scaled_ims, _rpn_detections
+from utils.blob import im_list_to_blob
+
+
+def _file_sha1(path):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def model_key(ckpt_file):
+    """
+    Hash of the checkpoint and of the test config of the network input. The index file of a V2 checkpoint
+    holds the checksums of all the variables, it is hashed instead of the data files
+    """
+    index_file = ckpt_file + '.index'
+    sha1 = hashlib.sha1()
+    sha1.update(_file_sha1(index_file if osp.exists(index_file) else ckpt_file).encode())
+    sha1.update(repr([cfg.TEST.SCALES[0], cfg.TEST.MAX_SIZE, cfg.PIXEL_MEANS.tolist()]).encode())
+    return sha1.hexdigest()[:16]
+
+
+def image_key(im):
+    sha1 = hashlib.sha1(repr(im.shape).encode())
+    sha1.update(np.ascontiguousarray(im).data)
+    return sha1.hexdigest()
+
+
+class RpnCache(object):
+    def __init__(self, cache_dir, ckpt_file):
+        if cfg.TEST.GATE or cfg.TEST.CROP or len(cfg.TEST.SCALES) > 1:
+            raise ValueError('The RPN cache only holds the pass at TEST.SCALES[0], '
+                             'it cannot be used with TEST.GATE, TEST.CROP or several TEST.SCALES')
+        self.cache_dir = osp.join(cache_dir, model_key(ckpt_file))
+        if not osp.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    def _cache_file(self, im):
+        return osp.join(self.cache_dir, image_key(im) + '.npz')
+
+    def load(self, im):
+        """:return: {'rpn_cls_prob', 'rpn_bbox_pred', 'im_info'} or None when the image is not cached"""
+        cache_file = self._cache_file(im)
+        if not osp.exists(cache_file):
+            return None
+        with np.load(cache_file) as cache:
+            return dict((key, cache[key]) for key in ('rpn_cls_prob', 'rpn_bbox_pred', 'im_info'))
+
+    def save(self, im, outputs):
+        cache_file = self._cache_file(im)
+        # Written to a temporary file first so a concurrent replay never reads a partial file
+        tmp_file = cache_file + '.{:d}.tmp.npz'.format(os.getpid())
+        np.savez_compressed(tmp_file, **outputs)
+        os.replace(tmp_file, cache_file)
+
+
+def im_detect_cached(cache, im, rpn_fn=None):
+    """
+    im_detect at the first test scale from the cached predictions of the image
+    :param rpn_fn: computes the predictions of the images missing from the cache, e.g. Network.test_rpn,
+        (1, H, W, 3) image blob -> {'rpn_cls_prob': (1, H', W', Ax2), 'rpn_bbox_pred': (1, H', W', Ax4)}
+    """
+    outputs = cache.load(im)
+    if outputs is None:
+        if rpn_fn is None:
+            raise KeyError('Image {:s} is not in the cache {:s}'.format(image_key(im), cache.cache_dir))
+        processed_ims, im_scales = _get_scaled_ims(im, cfg.TEST.SCALES[:1], cfg.TEST.MAX_SIZE)
+        blob = im_list_to_blob(processed_ims)
+        outputs = dict(rpn_fn(blob))
+        # The scale is kept in float64 so that the text lines are recovered exactly
+        outputs['im_info'] = np.array([blob.shape[1], blob.shape[2], im_scales[0]], dtype=np.float64)
+        cache.save(im, outputs)
+
+    im_info = outputs['im_info']
+    resized_im_shape = (int(im_info[0]), int(im_info[1]))
+    scores, boxes = _rpn_detections(outputs, resized_im_shape, im_info[2])
+    return scores, boxes, resized_im_shape, im_info[2]
@@ -23,41 +23,61 @@ from utils.blob import im_list_to_blob
 from model.config import cfg, get_output_dir
 from model.bbox_transform import clip_boxes, bbox_transform_inv
 from model.nms_wrapper import nms
+from layer_utils.generate_anchors import generate_anchors_pre
+from layer_utils.proposal_layer import proposal_layer
+from layer_utils.proposal_top_layer import proposal_top_layer
 
+# Stride of the feature map of all the networks
+FEAT_STRIDE = 16
 
-def _get_image_blob(im):
-    """Converts an image into a network input.
-    Arguments:
-      im (ndarray): a color image in BGR order
-    Returns:
-      blob (ndarray): a data blob holding an image pyramid
-      im_scale_factors (list): list of image scales (relative to im) used
-        in the image pyramid
-    """
-    im_orig = im.astype(np.float32, copy=True)
-    im_orig -= cfg.PIXEL_MEANS
 
-    im_shape = im_orig.shape
+def _im_scale(im_shape, target_size, max_size):
     im_size_min = np.min(im_shape[0:2])
     im_size_max = np.max(im_shape[0:2])
+    im_scale = float(target_size) / float(im_size_min)
+    # Prevent the biggest axis from being more than MAX_SIZE
+    if np.round(im_scale * im_size_max) > max_size:
+        im_scale = float(max_size) / float(im_size_max)
+    return im_scale
+
+
+def _get_scaled_ims(im, scales, max_size):
+    """
+    The image with the mean pixel removed, resized to each scale
+    :param scales: pixel sizes of the shortest side, like cfg.TEST.SCALES
+    :return: list of resized images and the array of their scale factors
+    """
+    im_orig = im.astype(np.float32, copy=True)
+    im_orig -= cfg.PIXEL_MEANS
 
     processed_ims = []
     im_scale_factors = []
 
-    for target_size in cfg.TEST.SCALES:
-        im_scale = float(target_size) / float(im_size_min)
-        # Prevent the biggest axis from being more than MAX_SIZE
-        if np.round(im_scale * im_size_max) > cfg.TEST.MAX_SIZE:
-            im_scale = float(cfg.TEST.MAX_SIZE) / float(im_size_max)
+    for target_size in scales:
+        im_scale = _im_scale(im_orig.shape, target_size, max_size)
         im = cv2.resize(im_orig, None, None, fx=im_scale, fy=im_scale,
                         interpolation=cv2.INTER_LINEAR)
         im_scale_factors.append(im_scale)
         processed_ims.append(im)
 
+    return processed_ims, np.array(im_scale_factors)
+
+
+def _get_image_blob(im):
+    """Converts an image into a network input.
+    Arguments:
+      im (ndarray): a color image in BGR order
+    Returns:
+      blob (ndarray): a data blob holding an image pyramid
+      im_scale_factors (list): list of image scales (relative to im) used
+        in the image pyramid
+    """
+    processed_ims, im_scale_factors = _get_scaled_ims(im, cfg.TEST.SCALES, cfg.TEST.MAX_SIZE)
+
     # Create a blob to hold the input images
     blob = im_list_to_blob(processed_ims)
 
-    return blob, np.array(im_scale_factors)
+    return blob, im_scale_factors
 
 
 def _get_blobs(im):
@@ -83,7 +103,249 @@ def _clip_boxes(boxes, im_shape):
     return boxes
 
 
+def recover_scale(boxes, scale):
+    """
+    :param boxes: [(x1, y1, x2, y2)]
+    :param scale: image scale
+    :return:
+    """
+    tmp_boxes = []
+    for b in boxes:
+        tmp_boxes.append([int(x / scale) for x in b])
+    return np.asarray(tmp_boxes).astype(np.float32)
+
+
+def rpn_proposals(rpn_cls_prob, rpn_bbox_pred, im_info):
+    """
+    The rois of the TEST graph from the RPN predictions of one image: anchors of the feature map, then
+    proposal_layer, or proposal_top_layer when cfg.TEST.MODE is 'top'
+    :param rpn_cls_prob: (1, H, W, Ax2)
+    :param rpn_bbox_pred: (1, H, W, Ax4)
+    :return: (N, 5) [score, x1, y1, x2, y2]
+    """
+    height, width = rpn_cls_prob.shape[1:3]
+    anchors, _ = generate_anchors_pre(height, width, [FEAT_STRIDE],
+                                      cfg.CTPN.NUM_ANCHORS, cfg.CTPN.ANCHOR_WIDTH, cfg.CTPN.H_RADIO_STEP)
+    if cfg.TEST.MODE == 'nms':
+        rois, _ = proposal_layer(rpn_cls_prob, rpn_bbox_pred, im_info, 'TEST', anchors, cfg.CTPN.NUM_ANCHORS)
+    elif cfg.TEST.MODE == 'top':
+        rois, _ = proposal_top_layer(rpn_cls_prob, rpn_bbox_pred, im_info, anchors, cfg.CTPN.NUM_ANCHORS)
+    else:
+        raise NotImplementedError
+    return rois
+
+
+def _rpn_outputs(rpn_fn, blobs):
+    """
+    RPN predictions of each blob, the blobs of the same shape are run in one batch
+    :param rpn_fn: (N, H, W, 3) image blob -> {'rpn_cls_prob': (N, ...), 'rpn_bbox_pred': (N, ...)}
+    :return: list of the predictions of each blob, with a batch of 1
+    """
+    outputs = [None] * len(blobs)
+    groups = {}
+    for i, blob in enumerate(blobs):
+        groups.setdefault(blob.shape, []).append(i)
+
+    for inds in groups.values():
+        batch = rpn_fn(np.concatenate([blobs[i] for i in inds]))
+        for n, i in enumerate(inds):
+            outputs[i] = dict((key, output[n:n + 1]) for key, output in batch.items())
+    return outputs
+
+
+def _rpn_detections(outputs, im_shape, im_scale):
+    """Scores and boxes of im_detect from the RPN predictions of one blob of shape im_shape"""
+    im_info = np.array([im_shape[0], im_shape[1], im_scale], dtype=np.float32)
+    rois = rpn_proposals(outputs['rpn_cls_prob'], outputs['rpn_bbox_pred'], im_info)
+
+    boxes = rois[:, 1:5]
+    boxes = _clip_boxes(boxes, im_shape)
+
+    scores = rois[:, 0]
+    return scores, boxes
+
+
+def _merge_scales(detections, ref_scale):
+    """
+    Scale-aware NMS of the proposals of several scales. Each scale only gives the proposals whose height on
+    its resized image is in cfg.TEST.MULTI_SCALE_HEIGHTS, then the proposals of all the scales are merged
+    by NMS on the image resized by ref_scale
+    :param detections: [(scores, boxes, im_scale)], the boxes on the image resized by im_scale
+    :return: scores and boxes on the image resized by ref_scale, sorted by score
+    """
+    min_height, max_height = cfg.TEST.MULTI_SCALE_HEIGHTS
+    all_scores = []
+    all_boxes = []
+    for scores, boxes, im_scale in detections:
+        heights = boxes[:, 3] - boxes[:, 1] + 1
+        keep = np.where((heights >= min_height) & (heights <= max_height))[0]
+        all_scores.append(scores[keep])
+        all_boxes.append(boxes[keep] * np.float32(ref_scale / im_scale))
+
+    scores = np.concatenate(all_scores)
+    boxes = np.concatenate(all_boxes)
+    order = np.argsort(-scores, kind='mergesort')
+    scores, boxes = scores[order], boxes[order]
+
+    keep = nms(np.hstack((boxes, scores[:, np.newaxis])), cfg.TEST.RPN_NMS_THRESH)
+    # As many proposals as proposal_layer gives for one scale
+    if cfg.TEST.RPN_POST_NMS_TOP_N > 0:
+        keep = keep[:cfg.TEST.RPN_POST_NMS_TOP_N]
+    return scores[keep], boxes[keep]
+
+
+def text_heatmap(rpn_cls_prob):
+    """
+    Text presence of each cell of the feature map: the highest text probability of its anchors
+    :param rpn_cls_prob: (1, H, W, Ax2)
+    :return: (H, W)
+    """
+    height, width = rpn_cls_prob.shape[1:3]
+    return np.reshape(rpn_cls_prob, [height, width, -1, 2])[:, :, :, 1].max(axis=2)
+
+
+def low_res_heatmap(rpn_fn, im):
+    """
+    text_heatmap of the RPN at the low resolution of cfg.TEST.GATE_SCALE
+    :return: the heatmap and the scale factor of the low resolution image
+    """
+    processed_ims, im_scales = _get_scaled_ims(im, (cfg.TEST.GATE_SCALE,), cfg.TEST.GATE_MAX_SIZE)
+    outputs = rpn_fn(im_list_to_blob(processed_ims))
+    return text_heatmap(outputs['rpn_cls_prob']), im_scales[0]
+
+
+def has_text(heatmap):
+    """
+    Gate of cfg.TEST.GATE: at least GATE_MIN_CELLS cells of the low resolution heatmap have a text anchor
+    scored GATE_SCORE or more
+    """
+    return np.count_nonzero(heatmap >= cfg.TEST.GATE_SCORE) >= cfg.TEST.GATE_MIN_CELLS
+
+
+def heatmap_regions(heatmap, cell_size, im_shape):
+    """
+    Regions of the image around the connected text cells of a heatmap. The cells closer than
+    cfg.TEST.CROP_MARGIN are in the same region
+    :param cell_size: size of a heatmap cell in pixels of the image
+    :param im_shape: (height, width) of the image
+    :return: (N, 4) int [x1, y1, x2, y2], x2 and y2 excluded, aligned to FEAT_STRIDE so that the anchors of
+        the crops are the anchors of the image
+    """
+    mask = (heatmap >= cfg.TEST.CROP_SCORE).astype(np.uint8)
+    margin = int(np.ceil(cfg.TEST.CROP_MARGIN / cell_size))
+    mask = cv2.dilate(mask, np.ones((2 * margin + 1, 2 * margin + 1), dtype=np.uint8))
+    _, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+
+    # The first component is the background
+    x = stats[1:, cv2.CC_STAT_LEFT]
+    y = stats[1:, cv2.CC_STAT_TOP]
+    regions = np.stack([x, y, x + stats[1:, cv2.CC_STAT_WIDTH], y + stats[1:, cv2.CC_STAT_HEIGHT]], axis=1)
+    regions = regions * cell_size
+    regions[:, :2] = np.floor(regions[:, :2] / FEAT_STRIDE) * FEAT_STRIDE
+    regions[:, 2:] = np.ceil(regions[:, 2:] / FEAT_STRIDE) * FEAT_STRIDE
+    regions = np.minimum(regions, [im_shape[1], im_shape[0], im_shape[1], im_shape[0]]).astype(np.int64)
+    return regions[(regions[:, 2] > regions[:, 0]) & (regions[:, 3] > regions[:, 1])]
+
+
+def _no_detections(im):
+    """Result of im_detect for an image without text, without resizing it"""
+    im_scale = _im_scale(im.shape, cfg.TEST.SCALES[0], cfg.TEST.MAX_SIZE)
+    # Size of the image resized by cv2.resize
+    resized_im_shape = (int(round(im.shape[0] * im_scale)), int(round(im.shape[1] * im_scale)))
+    return np.zeros((0,), dtype=np.float32), np.zeros((0, 4), dtype=np.float32), resized_im_shape, im_scale
+
+
+def im_detect_multiscale(rpn_fn, im):
+    """
+    im_detect with the scale pyramid of cfg.TEST.SCALES. Every scale is run by the same network, the
+    proposals are mapped to the image resized by the first scale and merged by _merge_scales, so that
+    TextDetector.detect gets them on the image size it is tuned for
+    :param rpn_fn: (N, H, W, 3) image blob -> {'rpn_cls_prob': (N, H', W', Ax2), 'rpn_bbox_pred': (N, H', W', Ax4)}
+    """
+    processed_ims, im_scales = _get_scaled_ims(im, cfg.TEST.SCALES, cfg.TEST.MAX_SIZE)
+    # The scales are not padded to one blob, the padding would change the outputs of the BiLSTM
+    blobs = [im_list_to_blob([processed_im]) for processed_im in processed_ims]
+    outputs = _rpn_outputs(rpn_fn, blobs)
+
+    detections = []
+    for blob, output, im_scale in zip(blobs, outputs, im_scales):
+        scores, boxes = _rpn_detections(output, blob.shape[1:3], im_scale)
+        detections.append((scores, boxes, im_scale))
+
+    resized_im_shape = blobs[0].shape[1:3]
+    scores, boxes = _merge_scales(detections, im_scales[0])
+    boxes = _clip_boxes(boxes, resized_im_shape)
+
+    return scores, boxes, resized_im_shape, im_scales[0]
+
+
+def im_detect_crops(rpn_fn, im, heatmap, heatmap_scale):
+    """
+    im_detect of the crops of the image resized by the first scale around the text of the heatmap. The
+    crops of the same size are run in one batch, their proposals are moved to the resized image and
+    merged by NMS. The whole image is detected when the crops cover more than cfg.TEST.CROP_MAX_AREA of it
+    :param heatmap: low_res_heatmap of the image, of scale factor heatmap_scale
+    """
+    processed_ims, im_scales = _get_scaled_ims(im, cfg.TEST.SCALES[:1], cfg.TEST.MAX_SIZE)
+    resized_im, im_scale = processed_ims[0], im_scales[0]
+    resized_im_shape = resized_im.shape[:2]
+
+    regions = heatmap_regions(heatmap, FEAT_STRIDE * im_scale / heatmap_scale, resized_im_shape)
+    areas = (regions[:, 2] - regions[:, 0]) * (regions[:, 3] - regions[:, 1])
+    if np.sum(areas) > cfg.TEST.CROP_MAX_AREA * resized_im_shape[0] * resized_im_shape[1]:
+        regions = np.array([[0, 0, resized_im_shape[1], resized_im_shape[0]]])
+
+    blobs = [im_list_to_blob([resized_im[y1:y2, x1:x2]]) for x1, y1, x2, y2 in regions]
+    outputs = _rpn_outputs(rpn_fn, blobs)
+
+    all_scores = [np.zeros((0,), dtype=np.float32)]
+    all_boxes = [np.zeros((0, 4), dtype=np.float32)]
+    for blob, output, region in zip(blobs, outputs, regions):
+        scores, boxes = _rpn_detections(output, blob.shape[1:3], im_scale)
+        all_scores.append(scores)
+        all_boxes.append(boxes + region[[0, 1, 0, 1]].astype(np.float32))
+
+    scores = np.concatenate(all_scores)
+    boxes = np.concatenate(all_boxes)
+    if len(regions) > 1:
+        # The crops may overlap
+        order = np.argsort(-scores, kind='mergesort')
+        scores, boxes = scores[order], boxes[order]
+        keep = nms(np.hstack((boxes, scores[:, np.newaxis])), cfg.TEST.RPN_NMS_THRESH)
+        if cfg.TEST.RPN_POST_NMS_TOP_N > 0:
+            keep = keep[:cfg.TEST.RPN_POST_NMS_TOP_N]
+        scores, boxes = scores[keep], boxes[keep]
+
+    return scores, boxes, resized_im_shape, im_scale
+
+
+def im_detect_rpn(rpn_fn, im):
+    """
+    im_detect with the proposals computed with numpy from the RPN predictions of rpn_fn, for the exported
+    models and the test modes the TEST graph has no proposal layer for: the gate and crops of the low
+    resolution pass and the scale pyramid. The crops are detected at the first scale only
+    :param rpn_fn: (N, H, W, 3) image blob -> {'rpn_cls_prob': (N, H', W', Ax2), 'rpn_bbox_pred': (N, H', W', Ax4)}
+    """
+    if cfg.TEST.GATE or cfg.TEST.CROP:
+        heatmap, heatmap_scale = low_res_heatmap(rpn_fn, im)
+        if cfg.TEST.GATE and not has_text(heatmap):
+            return _no_detections(im)
+        if cfg.TEST.CROP:
+            return im_detect_crops(rpn_fn, im, heatmap, heatmap_scale)
+    if len(cfg.TEST.SCALES) > 1:
+        return im_detect_multiscale(rpn_fn, im)
+
+    blobs, im_scales = _get_blobs(im)
+    resized_im_blob = blobs['data']
+    scores, boxes = _rpn_detections(rpn_fn(resized_im_blob), resized_im_blob.shape[1:3], im_scales[0])
+
+    return scores, boxes, resized_im_blob.shape[1:3], im_scales[0]
+
+
 def im_detect(sess, net, im):
+    if cfg.TEST.GATE or cfg.TEST.CROP or len(cfg.TEST.SCALES) > 1:
+        return im_detect_rpn(lambda image: net.test_rpn(sess, image), im)
+
     blobs, im_scales = _get_blobs(im)
     assert len(im_scales) == 1, "Only single-image batch implemented"
 
@@ -10,6 +10,7 @@ from __future__ import print_function
 from model.config import cfg
 import roi_data_layer.roidb as rdl_roidb
 from roi_data_layer.layer import RoIDataLayer
+from model.background_eval import BackgroundEvaluator
 from utils.timer import Timer
 import utils.common as common
 
@@ -20,11 +21,13 @@ except ImportError:
 import numpy as np
 import os
 import sys
+import copy
 import glob
 import time
 
 import tensorflow as tf
 from tensorflow.python import pywrap_tensorflow
+from tensorflow.core.protobuf import rewriter_config_pb2
 
 
 # noinspection PyAttributeOutsideInit
@@ -44,6 +47,8 @@ class SolverWrapper(object):
         self.tbvaldir = tbdir + '_val'
         common.check_dir(self.tbvaldir)
         self.pretrained_model = pretrained_model
+        # Evaluates the snapshots in the background when TRAIN.EVAL_IMG_DIR is set
+        self.evaluator = None
 
     def snapshot(self, sess, iter):
         net = self.net
@@ -56,16 +61,18 @@ class SolverWrapper(object):
         filename = os.path.join(self.output_dir, filename)
         self.saver.save(sess, filename)
         print('Wrote snapshot to: {:s}'.format(filename))
+        if self.evaluator is not None:
+            self.evaluator.submit(filename, iter)
 
         # Also store some meta information, random state, etc.
         nfilename = cfg.TRAIN.SNAPSHOT_PREFIX + '_iter_{:d}'.format(iter) + '.pkl'
         nfilename = os.path.join(self.output_dir, nfilename)
         # current state of numpy random
         st0 = np.random.get_state()
-        # current position in the database
-        cur = self.data_layer._cur
+        # current position in the database, one entry per tower
+        cur = [data_layer._cur for data_layer in self.data_layers]
         # current shuffled indexes of the database
-        perm = self.data_layer._perm
+        perm = [data_layer._perm for data_layer in self.data_layers]
         # current position in the validation database
         cur_val = self.data_layer_val._cur
         # current shuffled indexes of the validation database
@@ -98,8 +105,14 @@ class SolverWrapper(object):
             last_snapshot_iter = pickle.load(fid)
 
             np.random.set_state(st0)
-            self.data_layer._cur = cur
-            self.data_layer._perm = perm
+            # snapshots of a single tower store the position directly
+            if not isinstance(cur, list):
+                cur, perm = [cur], [perm]
+            assert len(cur) == len(self.data_layers), \
+                'The snapshot was taken with {:d} towers'.format(len(cur))
+            for data_layer, data_cur, data_perm in zip(self.data_layers, cur, perm):
+                data_layer._cur = data_cur
+                data_layer._perm = data_perm
             self.data_layer_val._cur = cur_val
             self.data_layer_val._perm = perm_val
 
@@ -116,17 +129,77 @@ class SolverWrapper(object):
                 print("It's likely that your checkpoint file has been compressed "
                       "with SNAPPY.")
 
+    def _create_architecture(self, net):
+        return net.create_architecture('TRAIN', self.imdb.num_classes, tag='default',
+                                       anchor_width=cfg.CTPN.ANCHOR_WIDTH,
+                                       anchor_h_ratio_step=cfg.CTPN.H_RADIO_STEP,
+                                       num_anchors=cfg.CTPN.NUM_ANCHORS)
+
+    def _build_tower(self, net, i):
+        """
+        Build the network of the i-th tower. The first tower creates the variables
+        and the summaries, the others reuse the variables and live in their own name scope.
+        """
+        if len(self.towers) == 1:
+            return self._create_architecture(net)
+
+        with tf.device(cfg.TRAIN.TOWER_DEVICE.format(i)), \
+                tf.variable_scope(tf.get_variable_scope(), reuse=i > 0):
+            if i == 0:
+                return self._create_architecture(net)
+            with tf.name_scope('tower_{:d}'.format(i)):
+                return self._create_architecture(net)
+
+    def _average_gradients(self, tower_grads):
+        """
+        Average the gradients of each variable over the towers
+        :param tower_grads: one list of (gradient, variable) per tower
+        """
+        average_grads = []
+        for grads_and_vars in zip(*tower_grads):
+            grads = [g for g, _ in grads_and_vars if g is not None]
+            var = grads_and_vars[0][1]
+            if len(grads) == 0:
+                continue
+            if len(grads) == 1:
+                average_grads.append((grads[0], var))
+            else:
+                average_grads.append((tf.add_n(grads) / len(grads), var))
+        return average_grads
+
+    def _average_losses(self, tower_layers):
+        """
+        Display and summarize the losses averaged over the towers instead of the ones of
+        the first tower, which only cover its shard of the minibatches
+        """
+        summaries = []
+        with tf.device('/cpu:0'), tf.name_scope('tower_mean'):
+            for key in list(self.net._losses):
+                mean = tf.add_n([layers[key] for layers in tower_layers]) / len(tower_layers)
+                self.net._losses[key] = mean
+                summaries.append(tf.summary.scalar(key, mean))
+        self.net._summary_op = tf.summary.merge([self.net._summary_op] + summaries)
+
     def construct_graph(self, sess):
         with sess.graph.as_default():
             # Set the random seed for tensorflow
             tf.set_random_seed(cfg.RNG_SEED)
-            # Build the main computation graph
-            layers = self.net.create_architecture('TRAIN', self.imdb.num_classes, tag='default',
-                                                  anchor_width=cfg.CTPN.ANCHOR_WIDTH,
-                                                  anchor_h_ratio_step=cfg.CTPN.H_RADIO_STEP,
-                                                  num_anchors=cfg.CTPN.NUM_ANCHORS)
+            # One replica of the network per tower, they share the variables
+            self.towers = [self.net] + [copy.deepcopy(self.net) for _ in range(1, cfg.TRAIN.NUM_TOWERS)]
+            # Build the main computation graph, the first tower is self.net
+            tower_layers = []
+            update_ops = []
+            for i, net in enumerate(self.towers):
+                layers = self._build_tower(net, i)
+                tower_layers.append(layers)
+                if i == 0:
+                    # batch norm statistics are only updated from the first tower
+                    update_ops = tf.get_collection(tf.GraphKeys.UPDATE_OPS)
             # Define the loss
-            total_loss = layers['total_loss']
+            tower_losses = [layers['total_loss'] for layers in tower_layers]
+            if len(self.towers) > 1:
+                self._average_losses(tower_layers)
+            total_loss = self.net._losses['total_loss']
             # Set learning rate and momentum
             lr = tf.Variable(cfg.TRAIN.LEARNING_RATE, trainable=False)
 
@@ -140,9 +213,23 @@ class SolverWrapper(object):
             else:
                 raise NotImplementedError
 
+            if cfg.TRAIN.MIXED_PRECISION:
+                check_mixed_precision()
+                # The float16 rewrite itself is enabled in the session config
+                self.optimizer = tf.train.experimental.MixedPrecisionLossScaleOptimizer(self.optimizer, 'dynamic')
+
             global_step = tf.Variable(0, trainable=False)
             with_clip = False
-            if with_clip:
+            if len(self.towers) > 1:
+                tvars = tf.trainable_variables()
+                tower_grads = []
+                for i, loss in enumerate(tower_losses):
+                    with tf.device(cfg.TRAIN.TOWER_DEVICE.format(i)):
+                        tower_grads.append(self.optimizer.compute_gradients(loss, tvars))
+                grads_and_vars = self._average_gradients(tower_grads)
+                with tf.control_dependencies(update_ops):
+                    train_op = self.optimizer.apply_gradients(grads_and_vars, global_step=global_step)
+            elif with_clip:
                 tvars = tf.trainable_variables()
                 grads, norm = tf.clip_by_global_norm(tf.gradients(total_loss, tvars), 10.0)
                 train_op = self.optimizer.apply_gradients(list(zip(grads, tvars)), global_step=global_step)
@@ -150,7 +237,6 @@ class SolverWrapper(object):
                 # required by tf.layers.batch_normalization()
                 # add update ops(for moving_mean and moving_variance) as a dependency to the train_op
                 # https://www.tensorflow.org/api_docs/python/tf/layers/batch_normalization
-                update_ops = tf.get_collection(tf.GraphKeys.UPDATE_OPS)
                 with tf.control_dependencies(update_ops):
                     train_op = self.optimizer.minimize(total_loss, global_step=global_step)
 
@@ -272,10 +358,20 @@ class SolverWrapper(object):
             ss_paths.remove(sfile)
 
     def train_model(self, sess, max_iters):
-        # Build data layers for both training and validation set
-        self.data_layer = RoIDataLayer(self.roidb, self.imdb.num_classes)
+        num_towers = cfg.TRAIN.NUM_TOWERS
+
+        # Build data layers for both training and validation set,
+        # each tower reads its own shard of the training set
+        self.data_layers = [RoIDataLayer(self.roidb[i::num_towers], self.imdb.num_classes,
+                                         augment=cfg.TRAIN.USE_FLIPPED)
+                            for i in range(num_towers)]
+        self.data_layer = self.data_layers[0]
         self.data_layer_val = RoIDataLayer(self.valroidb, self.imdb.num_classes, random=True)
 
+        if cfg.TRAIN.EVAL_IMG_DIR:
+            # Started before the graph is built, the evaluation process builds its own copy of the network
+            self.evaluator = BackgroundEvaluator(self.net, self.imdb.num_classes, self.tbvaldir)
+
         # Construct the computation graph
         lr, train_op = self.construct_graph(sess)
 
@@ -306,14 +402,17 @@ class SolverWrapper(object):
                 next_stepsize = stepsizes.pop()
 
             timer.tic()
-            # Get training data, one batch at a time
+            # Get training data, one batch at a time for each tower
             blobs = self.data_layer.forward()
+            extra_feed_dict = {}
+            for net, data_layer in zip(self.towers[1:], self.data_layers[1:]):
+                extra_feed_dict.update(net.get_feed_dict(data_layer.forward()))
 
             now = time.time()
             if iter == 1 or now - last_summary_time > cfg.TRAIN.SUMMARY_INTERVAL:
                 # Compute the graph with summary
                 rpn_loss_cls, rpn_loss_box, rpn_loss, total_loss, summary = \
-                    self.net.train_step_with_summary(sess, blobs, train_op)
+                    self.net.train_step_with_summary(sess, blobs, train_op, extra_feed_dict)
                 self.writer.add_summary(summary, float(iter))
                 # Also check the summary on the validation set
                 blobs_val = self.data_layer_val.forward()
@@ -323,7 +422,7 @@ class SolverWrapper(object):
             else:
                 # Compute the graph without summary
                 rpn_loss_cls, rpn_loss_box, rpn_loss, total_loss, _ = \
-                    self.net.train_step(sess, blobs, train_op)
+                    self.net.train_step(sess, blobs, train_op, extra_feed_dict)
             timer.toc()
 
             print('%d/%d time: %.3f total_loss: %.3f rpn_loss: %.3f rpn_loss_cls: %.3f '
@@ -348,15 +447,14 @@ class SolverWrapper(object):
 
         self.writer.close()
         self.valwriter.close()
+        if self.evaluator is not None:
+            print('Waiting for the evaluation of the last snapshot...')
+            self.evaluator.close()
 
 
 def get_training_roidb(imdb):
     """Returns a roidb (Region of Interest database) for use in training."""
-    if cfg.TRAIN.USE_FLIPPED:
-        print('Appending horizontally-flipped training examples...')
-        imdb.append_flipped_images()
-        print('done')
-
+    # Horizontal flipping is applied on the fly by the data layer
     print('Preparing training data...')
     rdl_roidb.prepare_roidb(imdb)
     print('done')
@@ -388,14 +486,35 @@ def filter_roidb(roidb):
     return filtered_roidb
 
 
+def check_mixed_precision():
+    """The loss scale optimizer and the auto_mixed_precision rewrite of TRAIN.MIXED_PRECISION came in TensorFlow 1.14"""
+    if not hasattr(getattr(tf.train, 'experimental', None), 'MixedPrecisionLossScaleOptimizer') or \
+            'auto_mixed_precision' not in rewriter_config_pb2.RewriterConfig.DESCRIPTOR.fields_by_name:
+        raise RuntimeError('TRAIN.MIXED_PRECISION needs TensorFlow 1.14 or later, found {:s}'.format(
+            tf.__version__))
+
+
+def get_session_config():
+    """Session config for training."""
+    tfconfig = tf.ConfigProto(allow_soft_placement=True)
+    tfconfig.gpu_options.allow_growth = True
+    if cfg.TRAIN.TOWER_DEVICE.startswith('/cpu'):
+        # Expose one CPU device per tower
+        tfconfig.device_count['CPU'] = cfg.TRAIN.NUM_TOWERS
+    if cfg.TRAIN.MIXED_PRECISION:
+        check_mixed_precision()
+        # Let grappler cast the float16-safe ops of the graph (convolutions, LSTM matmuls)
+        tfconfig.graph_options.rewrite_options.auto_mixed_precision = rewriter_config_pb2.RewriterConfig.ON
+    return tfconfig
+
+
 def train_net(network, imdb, roidb, valroidb, output_dir, tb_dir,
               pretrained_model=None,
               max_iters=40000):
     roidb = filter_roidb(roidb)
     valroidb = filter_roidb(valroidb)
 
-    tfconfig = tf.ConfigProto(allow_soft_placement=True)
-    tfconfig.gpu_options.allow_growth = True
+    tfconfig = get_session_config()
 
     with tf.Session(config=tfconfig) as sess:
         sw = SolverWrapper(sess, network, imdb, roidb, valroidb, output_dir, tb_dir,
@@ -0,0 +1,31 @@
+# --------------------------------------------------------
+# Tensorflow CTPN
+# Licensed under The MIT License [see LICENSE for details]
+# --------------------------------------------------------
+
+"""Factory method for getting networks by name."""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from nets.vgg16 import vgg16
+from nets.resnet_v1 import Resnetv1
+from nets.squeezenet import SqueezeNet
+from nets.mobilenet_v2 import MobileNetV2
+
+
+def get_network(name):
+    if name == 'vgg16':
+        return vgg16()
+    elif name == 'res50':
+        return Resnetv1(num_layers=50)
+    elif name == 'res101':
+        return Resnetv1(num_layers=101)
+    elif name == 'res152':
+        return Resnetv1(num_layers=152)
+    elif name == 'mobile':
+        return MobileNetV2()
+    elif name == 'squeeze':
+        return SqueezeNet()
+    else:
+        raise NotImplementedError
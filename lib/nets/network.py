@@ -39,18 +39,22 @@ class Network(object):
         self._variables_to_fix = {}
 
     def _add_gt_image(self):
+        # only the first image of the batch is visualized, without its padding
+        im_info = self._im_info[0]
+        image = self._image[:1, :tf.to_int32(im_info[0]), :tf.to_int32(im_info[1]), :]
         # add back mean
-        image = self._image + cfg.PIXEL_MEANS
+        image = image + cfg.PIXEL_MEANS
         # BGR to RGB (opencv uses BGR)
-        resized = tf.image.resize_bilinear(image, tf.to_int32(self._im_info[:2] / self._im_info[2]))
+        resized = tf.image.resize_bilinear(image, tf.to_int32(im_info[:2] / im_info[2]))
         self._gt_image = tf.reverse(resized, axis=[-1])
 
     def _add_gt_image_summary(self):
         # use a customized visualization function to visualize the boxes
         if self._gt_image is None:
             self._add_gt_image()
+        gt_boxes = tf.boolean_mask(self._gt_boxes, tf.equal(self._gt_boxes[:, 5], 0))
         image = tf.py_func(draw_bounding_boxes,
-                           [self._gt_image, self._gt_boxes, self._im_info],
+                           [self._gt_image, gt_boxes, self._im_info[0]],
                            tf.float32, name="gt_boxes")
 
         return tf.summary.image('GROUND_TRUTH', image)
@@ -74,9 +78,8 @@ class Network(object):
         return tf.reshape(input, [input_shape[0], input_shape[1], -1, num_dim], name=name)
 
     def _softmax_layer(self, input, name):
-        input_shape = tf.shape(input)
-        return tf.reshape(tf.nn.softmax(tf.reshape(input, [-1, input_shape[3]])),
-                          [-1, input_shape[1], input_shape[2], input_shape[3]], name=name)
+        # Softmax of the last dim, tf2onnx merges a flattening reshape before it into the next reshape
+        return tf.nn.softmax(input, name=name)
 
     def _proposal_top_layer(self, rpn_cls_prob, rpn_bbox_pred, name):
         with tf.variable_scope(name) as scope:
@@ -120,10 +123,10 @@ class Network(object):
                 [tf.float32, tf.float32, tf.float32, tf.float32],
                 name="anchor_target")
 
-            rpn_labels.set_shape([1, None, None, self._num_anchors])
-            rpn_bbox_targets.set_shape([1, None, None, self._num_anchors * 4])
-            rpn_bbox_inside_weights.set_shape([1, None, None, self._num_anchors * 4])
-            rpn_bbox_outside_weights.set_shape([1, None, None, self._num_anchors * 4])
+            rpn_labels.set_shape([None, None, None, self._num_anchors])
+            rpn_bbox_targets.set_shape([None, None, None, self._num_anchors * 4])
+            rpn_bbox_inside_weights.set_shape([None, None, None, self._num_anchors * 4])
+            rpn_bbox_outside_weights.set_shape([None, None, None, self._num_anchors * 4])
 
             rpn_labels = tf.to_int32(rpn_labels, name="to_int32")
             self._anchor_targets['rpn_labels'] = rpn_labels
@@ -177,6 +180,7 @@ class Network(object):
 
     def _build_losses(self, sigma_rpn=3.0):
         with tf.variable_scope('LOSS_' + self._tag) as scope:
+            # The losses are averaged over the sampled anchors of the whole batch
             # RPN, class loss
             # (N, H, W x num_anchors, 2) -> (N x H x W x num_anchors, 2)
             rpn_cls_score = tf.reshape(self._predictions['rpn_cls_score_reshape'], [-1, 2])
@@ -194,7 +198,7 @@ class Network(object):
                 tf.nn.sparse_softmax_cross_entropy_with_logits(labels=rpn_label, logits=rpn_cls_score))
 
             # RPN, bbox loss
-            rpn_bbox_pred = self._predictions['rpn_bbox_pred']  # shape (1, H, W, Ax4)
+            rpn_bbox_pred = self._predictions['rpn_bbox_pred']  # shape (N, H, W, Ax4)
             rpn_bbox_targets = self._anchor_targets['rpn_bbox_targets']
             rpn_bbox_inside_weights = self._anchor_targets['rpn_bbox_inside_weights']
             rpn_bbox_outside_weights = self._anchor_targets['rpn_bbox_outside_weights']
@@ -235,16 +239,57 @@ class Network(object):
             img = tf.reshape(img, [N * H, W, C])
             img.set_shape([None, None, d_i])
 
-            lstm_fw_cell = tf.contrib.rnn.LSTMCell(hidden_num, state_is_tuple=True)
-            lstm_bw_cell = tf.contrib.rnn.LSTMCell(hidden_num, state_is_tuple=True)
+            sequence_length = None
+            if self._mode == 'TRAIN':
+                # The images of a batch are padded to the largest one, the rows stop at the last column
+                # of their image so that the padding never reaches the outputs of the real columns
+                widths = tf.to_int32(tf.ceil(self._im_info[:, 1] / np.float32(self._feat_stride[0])))
+                widths = tf.minimum(widths, W)
+                sequence_length = tf.reshape(tf.tile(widths[:, tf.newaxis], [1, H]), [-1])
+
+            if cfg.CTPN.LSTM == 'fused':
+                lstm_out = self._fused_bilstm(img, hidden_num, sequence_length)
+            else:
+                lstm_fw_cell = tf.contrib.rnn.LSTMCell(hidden_num, state_is_tuple=True)
+                lstm_bw_cell = tf.contrib.rnn.LSTMCell(hidden_num, state_is_tuple=True)
 
-            lstm_out, last_state = tf.nn.bidirectional_dynamic_rnn(lstm_fw_cell, lstm_bw_cell, img, dtype=tf.float32)
-            lstm_out = tf.concat(lstm_out, axis=-1)
+                # The outputs past sequence_length are zeros
+                lstm_out, last_state = tf.nn.bidirectional_dynamic_rnn(lstm_fw_cell, lstm_bw_cell, img,
+                                                                       sequence_length=sequence_length,
+                                                                       dtype=tf.float32)
+                lstm_out = tf.concat(lstm_out, axis=-1)
 
             lstm_out = tf.reshape(lstm_out, [N * H * W, 2 * hidden_num])
 
             return lstm_out
 
+    def _fused_bilstm(self, img, hidden_num, sequence_length=None):
+        """
+        Same outputs as bidirectional_dynamic_rnn with LSTMCells, with one fused op per direction.
+        The cells are created in the scopes of bidirectional_dynamic_rnn, their kernel and bias have
+        the names and the [i, j, f, o] gate layout of the LSTMCell variables
+        :param img: (batch, time, depth)
+        :param sequence_length: (batch,) length of each sequence, all of them are time long when None
+        :return: (batch, time, 2 * hidden_num)
+        """
+        # The fused cell is time major
+        img = tf.transpose(img, [1, 0, 2])
+        with tf.variable_scope('bidirectional_rnn'):
+            with tf.variable_scope('fw'):
+                lstm_fw_cell = tf.contrib.rnn.LSTMBlockFusedCell(hidden_num, name='lstm_cell')
+                fw_out, _ = lstm_fw_cell(img, dtype=tf.float32, sequence_length=sequence_length)
+            with tf.variable_scope('bw'):
+                lstm_bw_cell = tf.contrib.rnn.LSTMBlockFusedCell(hidden_num, name='lstm_cell')
+                # The backward pass runs on the reversed columns, from the last one of each sequence
+                if sequence_length is None:
+                    bw_out, _ = lstm_bw_cell(tf.reverse(img, axis=[0]), dtype=tf.float32)
+                    bw_out = tf.reverse(bw_out, axis=[0])
+                else:
+                    bw_in = tf.reverse_sequence(img, sequence_length, seq_axis=0, batch_axis=1)
+                    bw_out, _ = lstm_bw_cell(bw_in, dtype=tf.float32, sequence_length=sequence_length)
+                    bw_out = tf.reverse_sequence(bw_out, sequence_length, seq_axis=0, batch_axis=1)
+        return tf.transpose(tf.concat([fw_out, bw_out], axis=-1), [1, 0, 2])
+
     def _l2_regularizer(self, weight_decay=0.0005, scope=None):
         def regularizer(tensor):
             with tf.name_scope(scope, default_name='l2_regularizer', values=[tensor]):
@@ -294,7 +339,7 @@ class Network(object):
             if cfg.TEST.MODE == 'nms':
                 rois, _ = self._proposal_layer(rpn_cls_prob_reshape, rpn_bbox_pred, "rois")
             elif cfg.TEST.MODE == 'top':
-                rois, _ = self._proposal_top_layer(rpn_cls_prob, rpn_bbox_pred, "rois")
+                rois, _ = self._proposal_top_layer(rpn_cls_prob_reshape, rpn_bbox_pred, "rois")
             else:
                 raise NotImplementedError
             self._predictions["rois"] = rois
@@ -313,9 +358,14 @@ class Network(object):
 
     def create_architecture(self, mode, num_classes, tag=None,
                             anchor_width=16, anchor_h_ratio_step=0.7, num_anchors=10):
-        self._image = tf.placeholder(tf.float32, shape=[1, None, None, 3], name='input')
-        self._im_info = tf.placeholder(tf.float32, shape=[3], name='im_info')
-        self._gt_boxes = tf.placeholder(tf.float32, shape=[None, 5])
+        self._image = tf.placeholder(tf.float32, shape=[None, None, None, 3], name='input')
+        if mode == 'TRAIN':
+            # [height, width, scale] of each image of the padded batch
+            self._im_info = tf.placeholder(tf.float32, shape=[None, 3], name='im_info')
+        else:
+            self._im_info = tf.placeholder(tf.float32, shape=[3], name='im_info')
+        # [x1, y1, x2, y2, class, batch index]
+        self._gt_boxes = tf.placeholder(tf.float32, shape=[None, 6])
         self._tag = tag
 
         self._num_classes = num_classes
@@ -397,16 +447,27 @@ class Network(object):
         rois = sess.run(self._predictions['rois'], feed_dict=feed_dict)
         return rois
 
+    def test_rpn(self, sess, image):
+        """RPN predictions of a batch of images, no anchors nor proposals"""
+        return sess.run({'rpn_cls_prob': self._predictions['rpn_cls_prob'],
+                         'rpn_bbox_pred': self._predictions['rpn_bbox_pred']},
+                        feed_dict={self._image: image})
+
+    def get_feed_dict(self, blobs):
+        return {self._image: blobs['data'], self._im_info: blobs['im_info'],
+                self._gt_boxes: blobs['gt_boxes']}
+
     def get_summary(self, sess, blobs):
-        feed_dict = {self._image: blobs['data'], self._im_info: blobs['im_info'],
-                     self._gt_boxes: blobs['gt_boxes']}
+        feed_dict = self.get_feed_dict(blobs)
         summary = sess.run(self._summary_op_val, feed_dict=feed_dict)
 
         return summary
 
-    def train_step(self, sess, blobs, train_op):
-        feed_dict = {self._image: blobs['data'], self._im_info: blobs['im_info'],
-                     self._gt_boxes: blobs['gt_boxes']}
+    def train_step(self, sess, blobs, train_op, extra_feed_dict=None):
+        # extra_feed_dict feeds the inputs of the other towers
+        feed_dict = self.get_feed_dict(blobs)
+        if extra_feed_dict is not None:
+            feed_dict.update(extra_feed_dict)
         rpn_loss_cls, rpn_loss_box, rpn_loss, total_loss, _ = sess.run(
             [self._losses["rpn_cross_entropy"],
              self._losses['rpn_loss_box'],
@@ -417,9 +478,10 @@ class Network(object):
 
         return rpn_loss_cls, rpn_loss_box, rpn_loss, total_loss, _
 
-    def train_step_with_summary(self, sess, blobs, train_op):
-        feed_dict = {self._image: blobs['data'], self._im_info: blobs['im_info'],
-                     self._gt_boxes: blobs['gt_boxes']}
+    def train_step_with_summary(self, sess, blobs, train_op, extra_feed_dict=None):
+        feed_dict = self.get_feed_dict(blobs)
+        if extra_feed_dict is not None:
+            feed_dict.update(extra_feed_dict)
         rpn_loss_cls, rpn_loss_box, rpn_loss, loss, summary, _ = sess.run([self._losses["rpn_cross_entropy"],
                                                                            self._losses['rpn_loss_box'],
                                                                            self._losses['rpn_loss'],
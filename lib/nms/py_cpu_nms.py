@@ -8,7 +8,8 @@
 import numpy as np
 
 def py_cpu_nms(dets, thresh):
-    """Pure Python NMS baseline."""
+    """Pure Python NMS baseline, keeps the same boxes as cpu_nms (float32 overlaps, suppressed from thresh)."""
+    dets = dets.astype(np.float32, copy=False)
     x1 = dets[:, 0]
     y1 = dets[:, 1]
     x2 = dets[:, 2]
@@ -32,7 +33,7 @@ def py_cpu_nms(dets, thresh):
         inter = w * h
         ovr = inter / (areas[i] + areas[order[1:]] - inter)
 
-        inds = np.where(ovr <= thresh)[0]
+        inds = np.where(ovr.astype(np.float64) < thresh)[0]
         order = order[inds + 1]
 
     return keep
@@ -22,12 +22,14 @@ import time
 class RoIDataLayer(object):
     """Fast R-CNN data layer used for training."""
 
-    def __init__(self, roidb, num_classes, random=False):
+    def __init__(self, roidb, num_classes, random=False, augment=False):
         """Set the roidb to be used by this layer during training."""
         self._roidb = roidb
         self._num_classes = num_classes
         # Also set a random flag
         self._random = random
+        # Randomly flip the samples horizontally
+        self._augment = augment
         self._shuffle_roidb_inds()
 
     def _shuffle_roidb_inds(self):
@@ -41,16 +43,21 @@ class RoIDataLayer(object):
             np.random.seed(millis)
 
         if cfg.TRAIN.ASPECT_GROUPING:
+            # Batch the images with the same orientation together, so that
+            # less padding is needed in the blob
+            ims_per_batch = cfg.TRAIN.IMS_PER_BATCH
             widths = np.array([r['width'] for r in self._roidb])
             heights = np.array([r['height'] for r in self._roidb])
             horz = (widths >= heights)
             vert = np.logical_not(horz)
-            horz_inds = np.where(horz)[0]
-            vert_inds = np.where(vert)[0]
-            inds = np.hstack((
-                np.random.permutation(horz_inds),
-                np.random.permutation(vert_inds)))
-            inds = np.reshape(inds, (-1, 2))
+            groups = []
+            for group_inds in (np.where(horz)[0], np.where(vert)[0]):
+                if len(group_inds) == 0:
+                    continue
+                # Wrap around so that each group fills whole batches
+                num_inds = int(np.ceil(len(group_inds) / ims_per_batch)) * ims_per_batch
+                groups.append(np.resize(np.random.permutation(group_inds), num_inds))
+            inds = np.reshape(np.hstack(groups), (-1, ims_per_batch))
             row_perm = np.random.permutation(np.arange(inds.shape[0]))
             inds = np.reshape(inds[row_perm, :], (-1,))
             self._perm = inds
@@ -65,7 +72,7 @@ class RoIDataLayer(object):
     def _get_next_minibatch_inds(self):
         """Return the roidb indices for the next minibatch."""
 
-        if self._cur + cfg.TRAIN.IMS_PER_BATCH >= len(self._roidb):
+        if self._cur + cfg.TRAIN.IMS_PER_BATCH >= len(self._perm):
             self._shuffle_roidb_inds()
 
         db_inds = self._perm[self._cur:self._cur + cfg.TRAIN.IMS_PER_BATCH]
@@ -80,9 +87,21 @@ class RoIDataLayer(object):
         separate process and made available through self._blob_queue.
         """
         db_inds = self._get_next_minibatch_inds()
-        minibatch_db = [self._roidb[i] for i in db_inds]
+        minibatch_db = [self._sample_entry(self._roidb[i]) for i in db_inds]
         return get_minibatch(minibatch_db, self._num_classes)
 
+    def _sample_entry(self, entry):
+        """Decide the augmentation of one sample.
+
+        The roidb entry is shallow-copied, the transform itself is applied
+        lazily by get_minibatch.
+        """
+        if not self._augment:
+            return entry
+        entry = dict(entry)
+        entry['flipped'] = np.random.rand() < 0.5
+        return entry
+
     def forward(self):
         """Get blobs and copy them into this layer's top blob vector."""
         blobs = self._get_next_minibatch()
@@ -15,6 +15,7 @@ import numpy.random as npr
 import cv2
 from model.config import cfg
 from utils.blob import prep_im_for_blob, im_list_to_blob
+from utils.text_line_split import split_quads, clip_slices
 
 from utils import helper
 
@@ -26,31 +27,71 @@ def get_minibatch(roidb, num_classes):
     random_scale_inds = npr.randint(0, high=len(cfg.TRAIN.SCALES), size=num_images)
 
     # Get the input image blob, formatted for caffe
-    im_blob, im_scales = _get_image_blob(roidb, random_scale_inds)
+    # the images are padded at the bottom/right to the largest one of the batch
+    im_blob, im_scales, im_shapes = _get_image_blob(roidb, random_scale_inds)
 
     blobs = {'data': im_blob}
 
-    assert len(im_scales) == 1, "Single batch only"
-    assert len(roidb) == 1, "Single batch only"
-
-    # gt boxes: (x1, y1, x2, y2, cls)
-    if cfg.TRAIN.USE_ALL_GT:
-        # Include all ground truth boxes
-        gt_inds = np.where(roidb[0]['gt_classes'] != 0)[0]
-    else:
-        # For the COCO ground truth boxes, exclude the ones that are ''iscrowd''
-        gt_inds = np.where(roidb[0]['gt_classes'] != 0 & np.all(roidb[0]['gt_overlaps'].toarray() > -1.0, axis=1))[0]
-    gt_boxes = np.empty((len(gt_inds), 5), dtype=np.float32)
-    gt_boxes[:, 0:4] = roidb[0]['boxes'][gt_inds, :] * im_scales[0]
-    gt_boxes[:, 4] = roidb[0]['gt_classes'][gt_inds]
-    blobs['gt_boxes'] = gt_boxes
+    # gt boxes: (x1, y1, x2, y2, cls, batch index)
+    all_gt_boxes = []
+    for i in range(num_images):
+        if cfg.TRAIN.USE_ALL_GT:
+            # Include all ground truth boxes
+            gt_inds = np.where(roidb[i]['gt_classes'] != 0)[0]
+        else:
+            # For the COCO ground truth boxes, exclude the ones that are ''iscrowd''
+            gt_inds = np.where(roidb[i]['gt_classes'] != 0 & np.all(roidb[i]['gt_overlaps'].toarray() > -1.0, axis=1))[0]
+        if 'text_lines' in roidb[i]:
+            # Whole text lines, split at the scale of the minibatch
+            boxes, line_inds = _split_text_lines(roidb[i], gt_inds, im_scales[i], im_shapes[i])
+            gt_boxes = np.empty((len(boxes), 6), dtype=np.float32)
+            gt_boxes[:, 0:4] = boxes
+            gt_boxes[:, 4] = roidb[i]['gt_classes'][gt_inds][line_inds]
+            gt_boxes[:, 5] = i
+            all_gt_boxes.append(gt_boxes)
+            continue
+        gt_boxes = np.empty((len(gt_inds), 6), dtype=np.float32)
+        boxes = roidb[i]['boxes'][gt_inds, :].astype(np.float32)
+        if roidb[i]['flipped']:
+            boxes = _flip_boxes(boxes, roidb[i]['width'])
+        gt_boxes[:, 0:4] = boxes * im_scales[i]
+        gt_boxes[:, 4] = roidb[i]['gt_classes'][gt_inds]
+        gt_boxes[:, 5] = i
+        all_gt_boxes.append(gt_boxes)
+    blobs['gt_boxes'] = np.vstack(all_gt_boxes)
+
+    # size of each image inside the padded blob
     blobs['im_info'] = np.array(
-        [im_blob.shape[1], im_blob.shape[2], im_scales[0]],
+        [[shape[0], shape[1], scale] for shape, scale in zip(im_shapes, im_scales)],
         dtype=np.float32)
 
     return blobs
 
 
+def _flip_boxes(boxes, width):
+    """Mirror the boxes of an image horizontally."""
+    flipped = boxes.copy()
+    flipped[:, 0] = width - boxes[:, 2] - 1
+    flipped[:, 2] = width - boxes[:, 0] - 1
+    flipped[flipped[:, 2] < flipped[:, 0], 0] = 0
+    assert (flipped[:, 2] >= flipped[:, 0]).all()
+    return flipped
+
+
+def _split_text_lines(entry, gt_inds, im_scale, im_shape):
+    """
+    Split the text lines of a roidb entry into the gt boxes of width cfg.CTPN.ANCHOR_WIDTH
+    :return: the boxes in the scaled image and the index of their line in gt_inds
+    """
+    quads = entry['text_lines'][gt_inds, :].astype(np.float64)
+    if entry['flipped']:
+        # Mirrored, left-top becomes right-top and left-bottom becomes right-bottom
+        quads[:, 0::2] = entry['width'] - quads[:, 0::2] - 1
+        quads = quads[:, [2, 3, 0, 1, 6, 7, 4, 5]]
+    slices, line_inds = split_quads(quads * im_scale, cfg.CTPN.ANCHOR_WIDTH)
+    return clip_slices(slices, im_shape), line_inds
+
+
 def _get_image_blob(roidb, scale_inds):
     """Builds an input blob from the images in the roidb at the specified
     scales.
@@ -58,6 +99,7 @@ def _get_image_blob(roidb, scale_inds):
     num_images = len(roidb)
     processed_ims = []
     im_scales = []
+    im_shapes = []
     for i in range(num_images):
         im = helper.read_rgb_img(roidb[i]['image'])
         if roidb[i]['flipped']:
@@ -66,9 +108,10 @@ def _get_image_blob(roidb, scale_inds):
         im, im_scale = prep_im_for_blob(im, cfg.PIXEL_MEANS, target_size,
                                         cfg.TRAIN.MAX_SIZE)
         im_scales.append(im_scale)
+        im_shapes.append(im.shape[:2])
         processed_ims.append(im)
 
     # Create a blob to hold the input images
     blob = im_list_to_blob(processed_ims)
 
-    return blob, im_scales
+    return blob, im_scales, im_shapes
@@ -9,16 +9,24 @@ from .text_connect_cfg import Config as TextLineCfg
 
 
 class TextDetector:
-    def __init__(self, oriented):
+    """
+        Stateless once created, detect can be called by several threads at once, each with its own config.
+    """
+
+    def __init__(self, oriented, config=None):
+        """
+        :param config: the default text_connect_cfg.Config of detect, the defaults of its class attributes when None
+        """
+        self.config = config if config is not None else TextLineCfg()
         if oriented:
             print('Use TextProposalConnectorOriented')
-            self.text_proposal_connector = TextProposalConnectorOriented()
+            self.text_proposal_connector = TextProposalConnectorOriented(self.config)
         else:
-            self.text_proposal_connector = TextProposalConnector()
+            self.text_proposal_connector = TextProposalConnector(self.config)
 
     @staticmethod
-    def pre_process(text_proposals, scores):
-        keep_inds = np.where(scores > TextLineCfg.TEXT_PROPOSALS_MIN_SCORE)[0]
+    def pre_process(text_proposals, scores, config=TextLineCfg):
+        keep_inds = np.where(scores > config.TEXT_PROPOSALS_MIN_SCORE)[0]
         text_proposals, scores = text_proposals[keep_inds], scores[keep_inds]
 
         # 按得分排序
@@ -26,20 +34,24 @@ class TextDetector:
         text_proposals, scores = text_proposals[sorted_indices], scores[sorted_indices]
 
         # 对proposal做nms
-        keep_inds = nms(np.hstack((text_proposals, scores)), TextLineCfg.TEXT_PROPOSALS_NMS_THRESH)
+        keep_inds = nms(np.hstack((text_proposals, scores)), config.TEXT_PROPOSALS_NMS_THRESH)
         text_proposals, scores = text_proposals[keep_inds], scores[keep_inds]
 
         return text_proposals, scores
 
-    def detect(self, text_proposals, scores, size):
-        text_proposals, scores = self.pre_process(text_proposals, scores)
+    def detect(self, text_proposals, scores, size, config=None):
+        """
+        :param config: overrides the config of the detector for this call
+        """
+        config = config if config is not None else self.config
+        text_proposals, scores = self.pre_process(text_proposals, scores, config)
 
         # 获取检测结果
-        text_recs = self.text_proposal_connector.get_text_lines(text_proposals, scores, size)
-        keep_inds = self.filter_boxes(text_recs)
+        text_recs = self.text_proposal_connector.get_text_lines(text_proposals, scores, size, config)
+        keep_inds = self.filter_boxes(text_recs, config)
         return text_recs[keep_inds]
 
-    def filter_boxes(self, boxes):
+    def filter_boxes(self, boxes, config=None):
         heights = np.zeros((len(boxes), 1), np.float)
         widths = np.zeros((len(boxes), 1), np.float)
         scores = np.zeros((len(boxes), 1), np.float)
@@ -50,5 +62,6 @@ class TextDetector:
             scores[index] = box[8]
             index += 1
 
-        return np.where((widths / heights > TextLineCfg.MIN_RATIO) & (scores > TextLineCfg.LINE_MIN_SCORE) &
-                        (widths > (TextLineCfg.TEXT_PROPOSALS_WIDTH * TextLineCfg.MIN_NUM_PROPOSALS)))[0]
+        config = config if config is not None else self.config
+        return np.where((widths / heights > config.MIN_RATIO) & (scores > config.LINE_MIN_SCORE) &
+                        (widths > (config.TEXT_PROPOSALS_WIDTH * config.MIN_NUM_PROPOSALS)))[0]
@@ -1,4 +1,4 @@
-class Config:
+class Config(object):
     SCALE = 600
     MAX_SCALE = 1200
     TEXT_PROPOSALS_WIDTH = 16
@@ -10,3 +10,42 @@ class Config:
     TEXT_PROPOSALS_NMS_THRESH = 0.2
     MIN_V_OVERLAPS = 0.7
     MIN_SIZE_SIM = 0.7
+
+    def __init__(self, **kwargs):
+        """
+        Immutable config, the class attributes are the defaults and an instance overrides some of them,
+        e.g. Config(MAX_HORIZONTAL_GAP=30). The defaults are copied when the instance is created, so it can be
+        shared by threads whatever changes the class attributes later
+        """
+        for key in kwargs:
+            if key not in self.keys():
+                raise KeyError('Unknown text connector config {:s}'.format(key))
+        for key in self.keys():
+            object.__setattr__(self, key, kwargs.get(key, getattr(Config, key)))
+
+    @staticmethod
+    def keys():
+        return sorted(key for key in vars(Config) if key.isupper())
+
+    def replace(self, **kwargs):
+        """A copy of the config with some values overridden"""
+        params = dict((key, getattr(self, key)) for key in self.keys())
+        params.update(kwargs)
+        return Config(**params)
+
+    def __setattr__(self, key, value):
+        raise AttributeError('Config is immutable, use replace({:s}=...)'.format(key))
+
+    def __eq__(self, other):
+        return isinstance(other, Config) and vars(self) == vars(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(tuple(getattr(self, key) for key in self.keys()))
+
+    def __repr__(self):
+        # Only the values overriding the defaults
+        return 'Config({:s})'.format(', '.join('{:s}={}'.format(key, getattr(self, key)) for key in self.keys()
+                                                if getattr(self, key) != getattr(Config, key)))
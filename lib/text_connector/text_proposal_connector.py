@@ -4,11 +4,11 @@ from .text_proposal_graph_builder import TextProposalGraphBuilder
 
 
 class TextProposalConnector:
-    def __init__(self):
-        self.graph_builder = TextProposalGraphBuilder()
+    def __init__(self, config=None):
+        self.graph_builder = TextProposalGraphBuilder(config)
 
-    def group_text_proposals(self, text_proposals, scores, im_size):
-        graph = self.graph_builder.build_graph(text_proposals, scores, im_size)
+    def group_text_proposals(self, text_proposals, scores, im_size, config=None):
+        graph = self.graph_builder.build_graph(text_proposals, scores, im_size, config)
         return graph.sub_graphs_connected()
 
     def fit_y(self, X, Y, x1, x2):
@@ -19,9 +19,9 @@ class TextProposalConnector:
         p = np.poly1d(np.polyfit(X, Y, 1))
         return p(x1), p(x2)
 
-    def get_text_lines(self, text_proposals, scores, im_size):
+    def get_text_lines(self, text_proposals, scores, im_size, config=None):
         # tp=text proposal
-        tp_groups = self.group_text_proposals(text_proposals, scores, im_size)
+        tp_groups = self.group_text_proposals(text_proposals, scores, im_size, config)
         text_lines = np.zeros((len(tp_groups), 5), np.float32)
 
         for index, tp_indices in enumerate(tp_groups):
@@ -8,11 +8,11 @@ class TextProposalConnector:
         Connect text proposals into text lines
     """
 
-    def __init__(self):
-        self.graph_builder = TextProposalGraphBuilder()
+    def __init__(self, config=None):
+        self.graph_builder = TextProposalGraphBuilder(config)
 
-    def group_text_proposals(self, text_proposals, scores, im_size):
-        graph = self.graph_builder.build_graph(text_proposals, scores, im_size)
+    def group_text_proposals(self, text_proposals, scores, im_size, config=None):
+        graph = self.graph_builder.build_graph(text_proposals, scores, im_size, config)
         return graph.sub_graphs_connected()
 
     def fit_y(self, X, Y, x1, x2):
@@ -23,13 +23,13 @@ class TextProposalConnector:
         p = np.poly1d(np.polyfit(X, Y, 1))
         return p(x1), p(x2)
 
-    def get_text_lines(self, text_proposals, scores, im_size):
+    def get_text_lines(self, text_proposals, scores, im_size, config=None):
         """
         text_proposals:boxes
         
         """
         # tp=text proposal
-        tp_groups = self.group_text_proposals(text_proposals, scores, im_size)  # 首先还是建图，获取到文本行由哪几个小框构成
+        tp_groups = self.group_text_proposals(text_proposals, scores, im_size, config)  # 首先还是建图，获取到文本行由哪几个小框构成
 
         text_lines = np.zeros((len(tp_groups), 8), np.float32)
 
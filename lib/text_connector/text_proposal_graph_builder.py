@@ -3,16 +3,44 @@ from .other import Graph
 import numpy as np
 
 
-# noinspection PyAttributeOutsideInit
 class TextProposalGraphBuilder:
     """
         Build Text proposals into a graph.
+        The builder has no per-call state, one instance can be shared by threads.
     """
 
+    def __init__(self, config=None):
+        self.config = config if config is not None else TextLineCfg()
+
+    def build_graph(self, text_proposals, scores, im_size, config=None):
+        """
+        :param config: overrides the config of the builder for this call
+        """
+        config = config if config is not None else self.config
+        return _ProposalGraph(config, text_proposals, scores, im_size).build()
+
+
+class _ProposalGraph:
+    """
+        State of one build_graph call
+    """
+
+    def __init__(self, config, text_proposals, scores, im_size):
+        self.config = config
+        self.text_proposals = text_proposals
+        self.scores = scores
+        self.im_size = im_size
+        self.heights = text_proposals[:, 3] - text_proposals[:, 1] + 1
+
+        boxes_table = [[] for _ in range(self.im_size[1])]
+        for index, box in enumerate(text_proposals):
+            boxes_table[int(box[0])].append(index)
+        self.boxes_table = boxes_table
+
     def get_successions(self, index):
         box = self.text_proposals[index]
         results = []
-        for left in range(int(box[0]) + 1, min(int(box[0]) + TextLineCfg.MAX_HORIZONTAL_GAP + 1, self.im_size[1])):
+        for left in range(int(box[0]) + 1, min(int(box[0]) + self.config.MAX_HORIZONTAL_GAP + 1, self.im_size[1])):
             adj_box_indices = self.boxes_table[left]
             for adj_box_index in adj_box_indices:
                 if self.meet_v_iou(adj_box_index, index):
@@ -24,7 +52,7 @@ class TextProposalGraphBuilder:
     def get_precursors(self, index):
         box = self.text_proposals[index]
         results = []
-        for left in range(int(box[0]) - 1, max(int(box[0] - TextLineCfg.MAX_HORIZONTAL_GAP), 0) - 1, -1):
+        for left in range(int(box[0]) - 1, max(int(box[0] - self.config.MAX_HORIZONTAL_GAP), 0) - 1, -1):
             adj_box_indices = self.boxes_table[left]
             for adj_box_index in adj_box_indices:
                 if self.meet_v_iou(adj_box_index, index):
@@ -56,19 +84,11 @@ class TextProposalGraphBuilder:
         size_sim = size_similarity(index1, index2)
         # print("v_overlap %f" % v_overlap)
         # print("size_sim %f" % size_sim)
-        return v_overlap >= TextLineCfg.MIN_V_OVERLAPS and size_sim >= TextLineCfg.MIN_SIZE_SIM
-
-    def build_graph(self, text_proposals, scores, im_size):
-        self.text_proposals = text_proposals
-        self.scores = scores
-        self.im_size = im_size
-        self.heights = text_proposals[:, 3] - text_proposals[:, 1] + 1
-
-        boxes_table = [[] for _ in range(self.im_size[1])]
-        for index, box in enumerate(text_proposals):
-            boxes_table[int(box[0])].append(index)
-        self.boxes_table = boxes_table
+        return v_overlap >= self.config.MIN_V_OVERLAPS and size_sim >= self.config.MIN_SIZE_SIM
 
+    def build(self):
+        text_proposals = self.text_proposals
+        scores = self.scores
         graph = np.zeros((text_proposals.shape[0], text_proposals.shape[0]), np.bool)
 
         for index, box in enumerate(text_proposals):
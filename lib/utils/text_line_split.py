@@ -0,0 +1,149 @@
+# --------------------------------------------------------
+# Tensorflow CTPN
+# Licensed under The MIT License [see LICENSE for details]
+# --------------------------------------------------------
+"""Split gt text lines into the fixed width boxes regressed by CTPN.
+
+All the lines of an image are split in one call, the slices of every line
+are computed together with numpy instead of one Python loop per slice. The
+slices are the ones of the former per-line splitters of tools/ (same
+integer arithmetic), so the converters and the training data layer give the
+same gt boxes.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import cv2
+
+
+def _as_int(points):
+    # Same truncation as int()
+    return np.trunc(np.asarray(points, dtype=np.float64)).astype(np.int64)
+
+
+def _slice_xs(xmin, xmax, step):
+    """(xmin of the slices, line index of the slices), ceil(width / step) slices per line"""
+    counts = np.maximum(np.ceil((xmax - xmin) / step), 0).astype(np.int64)
+    inds = np.repeat(np.arange(len(xmin)), counts)
+    first = np.cumsum(counts) - counts
+    local = np.arange(len(inds)) - first[inds]
+    return local * step + xmin[inds], inds
+
+
+def split_ltrb(boxes, step=16):
+    """
+    Split axis aligned text lines into slices of width step
+    :param boxes: (N, 4) [xmin, ymin, xmax, ymax], truncated to int
+    :return: (M, 4) int slices [xmin, ymin, xmin + step - 1, ymax] and the (M,) index of their line
+    """
+    boxes = _as_int(boxes).reshape((-1, 4))
+    xmins, inds = _slice_xs(boxes[:, 0], boxes[:, 2], step)
+    slices = np.stack([xmins, boxes[inds, 1], xmins + step - 1, boxes[inds, 3]], axis=1)
+    return slices, inds
+
+
+def min_area_quads(quads):
+    """
+    Corners of the minimum area rotated rectangle of each quad, truncated to int
+    :param quads: (N, 8) int (x1, y1, x2, y2, x3, y3, x4, y4)
+    :return: (N, 4, 2) left-top, right-top, right-bottom, left-bottom
+    """
+    boxes = np.zeros((len(quads), 4, 2), dtype=np.float32)
+    for n, quad in enumerate(quads):
+        boxes[n] = cv2.boxPoints(cv2.minAreaRect(quad.reshape((4, 2))))
+
+    # The two top points sorted by x, then the two bottom points sorted by decreasing x
+    order = np.argsort(boxes[:, :, 1], axis=1, kind='mergesort')
+    p = boxes[np.arange(len(boxes))[:, np.newaxis], order]
+    swap_top = ~(p[:, 0, 0] < p[:, 1, 0])
+    swap_bottom = ~(p[:, 2, 0] > p[:, 3, 0])
+    p[swap_top, 0:2] = p[swap_top, 1::-1]
+    p[swap_bottom, 2:4] = p[swap_bottom, 3:1:-1]
+    return _as_int(p)
+
+
+def _cross_ys(xs, height, p0, p1):
+    """
+    y of the intersections of the vertical lines xs with the edge lines (p0, p1), truncated to int
+    :return: ys and a mask of the intersections lying on the edges
+    """
+    a = p0[:, 1] - p1[:, 1]
+    b = p1[:, 0] - p0[:, 0]
+    c = p0[:, 0] * p1[:, 1] - p1[:, 0] * p0[:, 1]
+    # No intersection with a vertical edge, or when the vertical line is degenerated
+    valid = (b != 0) & (height != 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ys = (a * xs + c) / -b
+    ys = np.trunc(np.where(valid, ys, 0)).astype(np.int64)
+
+    on_edge = valid & (xs >= np.minimum(p0[:, 0], p1[:, 0])) & (xs <= np.maximum(p0[:, 0], p1[:, 0])) & \
+              (ys >= np.minimum(p0[:, 1], p1[:, 1])) & (ys <= np.maximum(p0[:, 1], p1[:, 1]))
+    return ys, on_edge
+
+
+def split_quads(quads, step=16, min_height=5, max_height_width_scale=4):
+    """
+    Split oriented text lines into slices of width step. The slices cover the bounding box of the line
+    horizontally and are fitted vertically to the minimum area rectangle of the line
+    :param quads: (N, 8) (x1, y1, x2, y2, x3, y3, x4, y4) left-top, right-top, right-bottom, left-bottom,
+        truncated to int
+    :param min_height: the slices whose height is not above it are dropped
+    :param max_height_width_scale: the lines higher than max_height_width_scale * width are not split
+    :return: (M, 4) int slices [xmin, ymin, xmax, ymax] and the (M,) index of their line
+    """
+    quads = _as_int(quads).reshape((-1, 8))
+    xmin = np.minimum(quads[:, 0], quads[:, 6])
+    ymin = np.minimum(quads[:, 1], quads[:, 3])
+    xmax = np.maximum(quads[:, 2], quads[:, 4])
+    ymax = np.maximum(quads[:, 5], quads[:, 7])
+    height = ymax - ymin
+    keep = ~(height > max_height_width_scale * (xmax - xmin))
+
+    lines = np.where(keep)[0]
+    boxes = np.zeros((len(quads), 4, 2), dtype=np.int64)
+    boxes[lines] = min_area_quads(quads[lines])
+    # The slope of the top edge chooses the edges bounding the slices, a vertical top edge is not split
+    dx = boxes[:, 0, 0] - boxes[:, 1, 0]
+    dy = boxes[:, 0, 1] - boxes[:, 1, 1]
+    keep &= dx != 0
+    slope = np.sign(dx) * np.sign(dy)
+
+    xmins, inds = _slice_xs(xmin[keep], xmax[keep], step)
+    inds = np.where(keep)[0][inds]
+    xmaxs = xmins + step - 1
+    boxes = boxes[inds]
+    height = height[inds]
+    edges = [(boxes[:, 0], boxes[:, 1]), (boxes[:, 1], boxes[:, 2]),
+             (boxes[:, 2], boxes[:, 3]), (boxes[:, 3], boxes[:, 0])]
+    left = [_cross_ys(xmins, height, p0, p1) for p0, p1 in edges]
+    right = [_cross_ys(xmaxs, height, p0, p1) for p0, p1 in edges]
+
+    ymins = ymin[inds].copy()
+    ymaxs = ymax[inds].copy()
+    # The later rules take precedence
+    rules = {-1: [(right[0], ymins), (right[3], ymaxs), (left[2], ymaxs), (left[1], ymins)],
+             1: [(right[3], ymins), (right[2], ymaxs), (left[0], ymins), (left[1], ymaxs)]}
+    for sign, line_rules in rules.items():
+        in_sign = slope[inds] == sign
+        for (ys, on_edge), dst in line_rules:
+            mask = in_sign & on_edge
+            dst[mask] = ys[mask]
+
+    slices = np.stack([xmins, ymins, xmaxs, ymaxs], axis=1)
+    high_enough = ymaxs - ymins > min_height
+    return slices[high_enough], inds[high_enough]
+
+
+def clip_slices(slices, size):
+    """
+    :param slices: (M, 4) [xmin, ymin, xmax, ymax]
+    :param size: (height, width)
+    """
+    slices = slices.copy()
+    slices[:, 0] = np.maximum(slices[:, 0], 0)
+    slices[:, 1] = np.maximum(slices[:, 1], 0)
+    slices[:, 2] = np.minimum(slices[:, 2], size[1] - 1)
+    slices[:, 3] = np.minimum(slices[:, 3], size[0] - 1)
+    return slices
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Vectorized DetEval matching of rectangles, used by script.py.
+
+Rectangles are (N, 4) arrays of [xmin, ymin, xmax, ymax]. The area recall and area precision
+matrices are computed in one broadcast and the conditions of the one-to-one matches, which only
+depend on these matrices, are evaluated with masks. The one-to-many and many-to-one matches depend
+on the rectangles already matched, so they keep one step per rectangle in the order of the script,
+and the sums are accumulated in the same order so the results are identical.
+"""
+from __future__ import division
+
+import numpy as np
+
+
+def rectangles_from_points(pointsList):
+    """
+    Returns a (N, 4) float array from a list of [xmin, ymin, xmax, ymax]
+    """
+    return np.array(pointsList, dtype=np.float64).reshape([-1, 4])
+
+
+def _dimensions(rects):
+    return (rects[:, 2] - rects[:, 0] + 1) * (rects[:, 3] - rects[:, 1] + 1)
+
+
+def intersection_areas(rectsA, rectsB):
+    """
+    Returns the (N, M) matrix of intersection areas, with the inclusive pixel convention of the script
+    """
+    dx = np.minimum(rectsA[:, None, 2], rectsB[None, :, 2]) - np.maximum(rectsA[:, None, 0], rectsB[None, :, 0]) + 1
+    dy = np.minimum(rectsA[:, None, 3], rectsB[None, :, 3]) - np.maximum(rectsA[:, None, 1], rectsB[None, :, 1]) + 1
+    return np.where((dx >= 0) & (dy >= 0), dx * dy, 0.)
+
+
+def area_matrices(gtRects, detRects):
+    """
+    Returns recallMat and precisionMat, the (N, M) intersection areas divided by the gt and det areas
+    """
+    intersected = intersection_areas(gtRects, detRects)
+    gtDimensions = _dimensions(gtRects)[:, None]
+    detDimensions = _dimensions(detRects)[None, :]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        recallMat = np.where(gtDimensions == 0, 0., intersected / gtDimensions)
+        precisionMat = np.where(detDimensions == 0, 0., intersected / detDimensions)
+    return recallMat, precisionMat
+
+
+def dont_care_detections(gtRects, gtDontCare, detRects, areaPrecisionConstraint):
+    """
+    Returns a (M,) bool mask of the detections covered by a don't care gt rectangle
+    """
+    dontCareRects = gtRects[gtDontCare]
+    if len(dontCareRects) == 0:
+        return np.zeros([len(detRects)], dtype=np.bool_)
+    _, precisionMat = area_matrices(dontCareRects, detRects)
+    return np.any(precisionMat > areaPrecisionConstraint, axis=0)
+
+
+def _normalized_center_distances(gtRects, detRects):
+    def center(r):
+        return r[:, 0] + (r[:, 2] - r[:, 0] + 1) / 2., r[:, 1] + (r[:, 3] - r[:, 1] + 1) / 2.
+
+    def diag(r):
+        w = r[:, 2] - r[:, 0] + 1
+        h = r[:, 3] - r[:, 1] + 1
+        return np.sqrt(h * h + w * w)
+
+    gx, gy = center(gtRects)
+    dx, dy = center(detRects)
+    distx = np.abs(gx - dx)
+    disty = np.abs(gy - dy)
+    normDist = np.sqrt(distx * distx + disty * disty)
+    normDist /= diag(gtRects) + diag(detRects)
+    normDist *= 2.0
+    return normDist
+
+
+def _ordered_sum(values):
+    # Sequential sum, numpy would use a pairwise summation
+    return np.cumsum(values)[-1] if len(values) > 0 else 0
+
+
+def deteval(gtRects, detRects, gtDontCare, evaluationParams):
+    """
+    DetEval matching of the rectangles of one sample
+    :param gtRects, detRects: (N, 4) and (M, 4) arrays of [xmin, ymin, xmax, ymax]
+    :param gtDontCare: (N,) bool mask of the don't care gt rectangles
+    :param evaluationParams: the parameters of script.default_evaluation_params
+    :return: a dictionary with recallMat, precisionMat, detDontCare ((M,) bool mask), gtMatched, detMatched,
+        pairs, recallAccum, precisionAccum and evaluationLog, the log of the matching steps
+    """
+    areaRecallConstraint = evaluationParams['AREA_RECALL_CONSTRAINT']
+    areaPrecisionConstraint = evaluationParams['AREA_PRECISION_CONSTRAINT']
+
+    gtDontCare = np.asarray(gtDontCare, dtype=np.bool_)
+    detDontCare = dont_care_detections(gtRects, gtDontCare, detRects, areaPrecisionConstraint)
+    recallMat, precisionMat = area_matrices(gtRects, detRects)
+
+    gtRectMat = np.zeros(len(gtRects), np.int8)
+    detRectMat = np.zeros(len(detRects), np.int8)
+    recallAccum = 0.
+    precisionAccum = 0.
+    pairs = []
+    evaluationLog = ""
+
+    # Number of overlapping care rectangles of each gt and each det
+    overlaps = recallMat > 0
+    numOverlapsGt = np.sum(overlaps & ~detDontCare[None, :], axis=1).tolist()
+    numOverlapsDet = np.sum(overlaps & ~gtDontCare[:, None], axis=0).tolist()
+    noMatches = np.zeros([0], dtype=np.int64)
+
+    # Find one-to-one matches
+    # A gt and a det are one-to-one when the pair is the only one meeting both constraints in its row and
+    # in its column, so there is at most one candidate per gt and per det and the order does not matter
+    evaluationLog += "Find one-to-one matches\n"
+    constrained = (recallMat >= areaRecallConstraint) & (precisionMat >= areaPrecisionConstraint)
+    oneToOne = constrained & (np.sum(constrained, axis=1) == 1)[:, None] & (np.sum(constrained, axis=0) == 1)[None, :]
+    oneToOne &= ~gtDontCare[:, None] & ~detDontCare[None, :]
+    rows, cols = np.nonzero(oneToOne)
+    singleOverlap = [numOverlapsGt[gtNum] == 1 and numOverlapsDet[detNum] == 1 for gtNum, detNum in zip(rows, cols)]
+    normDists = _normalized_center_distances(gtRects[rows], detRects[cols])
+    for gtNum, detNum, single, normDist in zip(rows.tolist(), cols.tolist(), singleOverlap, normDists.tolist()):
+        #in deteval we have to make other validation before mark as one-to-one
+        if not single:
+            evaluationLog += "Match Discarded GT #" + str(gtNum) + " with Det #" + str(detNum) + " not single overlap\n"
+        elif normDist < evaluationParams['EV_PARAM_IND_CENTER_DIFF_THR']:
+            gtRectMat[gtNum] = 1
+            detRectMat[detNum] = 1
+            recallAccum += evaluationParams['MTYPE_OO_O']
+            precisionAccum += evaluationParams['MTYPE_OO_O']
+            pairs.append({'gt': gtNum, 'det': detNum, 'type': 'OO'})
+            evaluationLog += "Match GT #" + str(gtNum) + " with Det #" + str(detNum) + "\n"
+        else:
+            evaluationLog += "Match Discarded GT #" + str(gtNum) + " with Det #" + str(detNum) + " normDist: " + str(normDist) + " \n"
+
+    # Find one-to-many matches
+    evaluationLog += "Find one-to-many matches\n"
+    precisionOk = (precisionMat >= areaPrecisionConstraint) & ~detDontCare[None, :]
+    for gtNum in np.nonzero(~gtDontCare)[0].tolist():
+        matchesDet = np.nonzero(precisionOk[gtNum] & (detRectMat == 0))[0] if gtRectMat[gtNum] == 0 else noMatches
+        if round(_ordered_sum(recallMat[gtNum, matchesDet]), 4) < areaRecallConstraint:
+            continue
+        matchesDet = matchesDet.tolist()
+        evaluationLog += "num_overlaps_gt=" + str(numOverlapsGt[gtNum])
+        #in deteval we have to make other validation before mark as one-to-one
+        if numOverlapsGt[gtNum] >= 2:
+            gtRectMat[gtNum] = 1
+            recallAccum += (evaluationParams['MTYPE_OO_O'] if len(matchesDet) == 1 else evaluationParams['MTYPE_OM_O'])
+            precisionAccum += (evaluationParams['MTYPE_OO_O'] if len(matchesDet) == 1 else evaluationParams['MTYPE_OM_O'] * len(matchesDet))
+            pairs.append({'gt': gtNum, 'det': matchesDet, 'type': 'OO' if len(matchesDet) == 1 else 'OM'})
+            detRectMat[matchesDet] = 1
+            evaluationLog += "Match GT #" + str(gtNum) + " with Det #" + str(matchesDet) + "\n"
+        else:
+            evaluationLog += "Match Discarded GT #" + str(gtNum) + " with Det #" + str(matchesDet) + " not single overlap\n"
+
+    # Find many-to-one matches
+    evaluationLog += "Find many-to-one matches\n"
+    recallOk = (recallMat >= areaRecallConstraint) & ~gtDontCare[:, None]
+    for detNum in np.nonzero(~detDontCare)[0].tolist():
+        matchesGt = np.nonzero(recallOk[:, detNum] & (gtRectMat == 0))[0] if detRectMat[detNum] == 0 else noMatches
+        if round(_ordered_sum(precisionMat[matchesGt, detNum]), 4) < areaPrecisionConstraint:
+            continue
+        matchesGt = matchesGt.tolist()
+        #in deteval we have to make other validation before mark as one-to-one
+        if numOverlapsDet[detNum] >= 2:
+            detRectMat[detNum] = 1
+            recallAccum += (evaluationParams['MTYPE_OO_O'] if len(matchesGt) == 1 else evaluationParams['MTYPE_OM_M'] * len(matchesGt))
+            precisionAccum += (evaluationParams['MTYPE_OO_O'] if len(matchesGt) == 1 else evaluationParams['MTYPE_OM_M'])
+            pairs.append({'gt': matchesGt, 'det': detNum, 'type': 'OO' if len(matchesGt) == 1 else 'MO'})
+            gtRectMat[matchesGt] = 1
+            evaluationLog += "Match GT #" + str(matchesGt) + " with Det #" + str(detNum) + "\n"
+        else:
+            evaluationLog += "Match Discarded GT #" + str(matchesGt) + " with Det #" + str(detNum) + " not single overlap\n"
+
+    return {
+        'recallMat': recallMat,
+        'precisionMat': precisionMat,
+        'detDontCare': detDontCare,
+        'gtMatched': gtRectMat.astype(np.bool_),
+        'detMatched': detRectMat.astype(np.bool_),
+        'pairs': pairs,
+        'recallAccum': recallAccum,
+        'precisionAccum': precisionAccum,
+        'evaluationLog': evaluationLog
+    }
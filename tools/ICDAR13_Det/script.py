@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-from collections import namedtuple
 import rrc_evaluation_funcs
+import deteval
 import importlib
 
 def evaluation_imports():
@@ -26,7 +26,8 @@ def default_evaluation_params():
                 'MTYPE_OM_M':1.,
                 'GT_SAMPLE_NAME_2_ID':'gt_img_([0-9]+).txt',
                 'DET_SAMPLE_NAME_2_ID':'res_img_([0-9]+).txt',
-                'CRLF':False # Lines are delimited by Windows CRLF format                
+                'CRLF':False, # Lines are delimited by Windows CRLF format
+                'NUM_WORKERS':1 # Number of processes evaluating the samples                
             }
 
 def validate_data(gtFilePath, submFilePath,evaluationParams):
@@ -51,309 +52,207 @@ def validate_data(gtFilePath, submFilePath,evaluationParams):
         rrc_evaluation_funcs.validate_lines_in_file(k,subm[k],evaluationParams['CRLF'],True,False)
 
     
-def evaluate_method(gtFilePath, submFilePath, evaluationParams):
-    """
-    Method evaluate_method: evaluate method and returns the results
-        Results. Dictionary with the following values:
-        - method (required)  Global method metrics. Ex: { 'Precision':0.8,'Recall':0.9 }
-        - samples (optional) Per sample metrics. Ex: {'sample1' : { 'Precision':0.8,'Recall':0.9 } , 'sample2' : { 'Precision':0.8,'Recall':0.9 }
-    """    
-
-    for module,alias in evaluation_imports().iteritems():
+def import_evaluation_modules():
+    for module,alias in evaluation_imports().items():
         globals()[alias] = importlib.import_module(module)
 
-    def one_to_one_match(row, col):
-        cont = 0
-        for j in range(len(recallMat[0])):    
-            if recallMat[row,j] >= evaluationParams['AREA_RECALL_CONSTRAINT'] and precisionMat[row,j] >= evaluationParams['AREA_PRECISION_CONSTRAINT'] :
-                cont = cont +1
-        if (cont != 1):
-            return False
-        cont = 0
-        for i in range(len(recallMat)):    
-            if recallMat[i,col] >= evaluationParams['AREA_RECALL_CONSTRAINT'] and precisionMat[i,col] >= evaluationParams['AREA_PRECISION_CONSTRAINT'] :
-                cont = cont +1
-        if (cont != 1):
-            return False
-        
-        if recallMat[row,col] >= evaluationParams['AREA_RECALL_CONSTRAINT'] and precisionMat[row,col] >= evaluationParams['AREA_PRECISION_CONSTRAINT'] :
-            return True
-        return False
-    
-    def num_overlaps_gt(gtNum):
-        cont = 0
-        for detNum in range(len(detRects)):
-            if detNum not in detDontCareRectsNum:
-                if recallMat[gtNum,detNum] > 0 :
-                    cont = cont +1
-        return cont
-
-    def num_overlaps_det(detNum):
-        cont = 0
-        for gtNum in range(len(recallMat)):    
-            if gtNum not in gtDontCareRectsNum:
-                if recallMat[gtNum,detNum] > 0 :
-                    cont = cont +1
-        return cont
-    
-    def is_single_overlap(row, col):
-        if num_overlaps_gt(row)==1 and num_overlaps_det(col)==1:
-            return True
-        else:
-            return False
+
+def evaluate_sample(gtPointsList, gtTranscriptionsList, detPointsList, evaluationParams):
+    """
+    Method evaluate_sample: evaluate the detections of one sample
+    detPointsList is None when the sample is not in the submission
+    Returns a dictionary with the recall and precision accumulated by the sample, its number of care
+    rectangles and its metrics in 'per_sample'
+    """
+
+    recall = 0
+    precision = 0
+    hmean = 0        
+    recallAccum = 0.
+    precisionAccum = 0.
+    gtPolPoints = list(gtPointsList)
+    detPolPoints = []
+    gtDontCareRectsNum = [n for n in range(len(gtTranscriptionsList)) if gtTranscriptionsList[n] == "###"]#Array of Ground Truth Rectangles' keys marked as don't Care
+    detDontCareRectsNum = []#Array of Detected Rectangles' matched with a don't Care GT
+    pairs = []
+    evaluationLog = ""
     
-    def one_to_many_match(gtNum):
-        many_sum = 0
-        detRects = []
-        for detNum in range(len(recallMat[0])):    
-            if gtRectMat[gtNum] == 0 and detRectMat[detNum] == 0 and detNum not in detDontCareRectsNum:
-                if precisionMat[gtNum,detNum] >= evaluationParams['AREA_PRECISION_CONSTRAINT'] :
-                    many_sum += recallMat[gtNum,detNum]
-                    detRects.append(detNum)
-        if round(many_sum,4) >=evaluationParams['AREA_RECALL_CONSTRAINT'] :
-            return True,detRects
-        else:
-            return False,[]         
+    recallMat = np.empty([1,1])
+    precisionMat = np.empty([1,1])              
     
-    def many_to_one_match(detNum):
-        many_sum = 0
-        gtRects = []
-        for gtNum in range(len(recallMat)):    
-            if gtRectMat[gtNum] == 0 and detRectMat[detNum] == 0 and gtNum not in gtDontCareRectsNum:
-                if recallMat[gtNum,detNum] >= evaluationParams['AREA_RECALL_CONSTRAINT'] :
-                    many_sum += precisionMat[gtNum,detNum]
-                    gtRects.append(gtNum)
-        if round(many_sum,4) >=evaluationParams['AREA_PRECISION_CONSTRAINT'] :
-            return True,gtRects
-        else:
-            return False,[]
+    evaluationLog += "GT rectangles: " + str(len(gtPolPoints)) + (" (" + str(len(gtDontCareRectsNum)) + " don't care)\n" if len(gtDontCareRectsNum)>0 else "\n")
     
-    def area(a, b):
-            dx = min(a.xmax, b.xmax) - max(a.xmin, b.xmin) + 1
-            dy = min(a.ymax, b.ymax) - max(a.ymin, b.ymin) + 1
-            if (dx>=0) and (dy>=0):
-                    return dx*dy
+    if detPointsList is not None:
+        detPolPoints = list(detPointsList)
+        gtRects = deteval.rectangles_from_points(gtPolPoints)
+        detRects = deteval.rectangles_from_points(detPolPoints)
+        gtDontCare = np.zeros(len(gtRects), np.bool_)
+        gtDontCare[gtDontCareRectsNum] = True
+
+        result = deteval.deteval(gtRects, detRects, gtDontCare, evaluationParams)
+        detDontCareRectsNum = np.nonzero(result['detDontCare'])[0].tolist()
+
+        evaluationLog += "DET rectangles: " + str(len(detRects)) + (" (" + str(len(detDontCareRectsNum)) + " don't care)\n" if len(detDontCareRectsNum)>0 else "\n")
+
+        if len(gtRects)==0:
+            recall = 1
+            precision = 0 if len(detRects)>0 else 1
+
+        if len(detRects)>0:
+            recallMat = result['recallMat']
+            precisionMat = result['precisionMat']
+            pairs = result['pairs']
+            recallAccum = result['recallAccum']
+            precisionAccum = result['precisionAccum']
+            evaluationLog += result['evaluationLog']
+
+            numGtCare = (len(gtRects) - len(gtDontCareRectsNum))
+            if numGtCare == 0:
+                recall = float(1)
+                precision = float(0) if len(detRects)>0 else float(1)
             else:
-                    return 0.
-    
-    def center(r):
-        x = float(r.xmin) + float(r.xmax - r.xmin + 1) / 2.;
-        y = float(r.ymin) + float(r.ymax - r.ymin + 1) / 2.;
-        return Point(x,y)
-        
-    def point_distance(r1, r2):
-        distx = math.fabs(r1.x - r2.x)
-        disty = math.fabs(r1.y - r2.y)
-        return math.sqrt(distx * distx + disty * disty )  
-        
-    
-    def center_distance(r1, r2):
-        return point_distance(center(r1), center(r2))
-    
-    def diag(r):
-        w = (r.xmax - r.xmin + 1)
-        h = (r.ymax - r.ymin + 1)
-        return math.sqrt(h * h + w * w)  
-    
-    def rectangle_to_points(rect):
-        points = [int(rect.xmin), int(rect.ymax), int(rect.xmax), int(rect.ymax), int(rect.xmax), int(rect.ymin), int(rect.xmin), int(rect.ymin)]
-        return points    
-    
-    perSampleMetrics = {}
-    
+                recall = float(recallAccum) / numGtCare
+                precision =  float(0) if (len(detRects) - len(detDontCareRectsNum))==0 else float(precisionAccum) / (len(detRects) - len(detDontCareRectsNum))
+            hmean = 0 if (precision + recall)==0 else 2.0 * precision * recall / (precision + recall)
+
+    sampleResult = {
+                    'recallAccum':recallAccum,
+                    'precisionAccum':precisionAccum,
+                    'numGtCare':len(gtPolPoints) - len(gtDontCareRectsNum),
+                    'numDetCare':len(detPolPoints) - len(detDontCareRectsNum)
+                    }
+
+    sampleResult['per_sample'] = {
+                                    'precision':precision,
+                                    'recall':recall,
+                                    'hmean':hmean,
+                                    'pairs':pairs,
+                                    'recallMat':[] if len(detPolPoints)>100 else recallMat.tolist(),
+                                    'precisionMat':[] if len(detPolPoints)>100 else precisionMat.tolist(),
+                                    'gtPolPoints':gtPolPoints,
+                                    'detPolPoints':detPolPoints,
+                                    'gtDontCare':gtDontCareRectsNum,
+                                    'detDontCare':detDontCareRectsNum,
+                                    'evaluationParams': evaluationParams,
+                                    'evaluationLog': evaluationLog
+                                }
+
+    return sampleResult
+
+
+def parse_gt_contents(gtContents, evaluationParams):
+    """
+    Method parse_gt_contents: returns the points and transcriptions lists of a gt file
+    """
+    gtFile = rrc_evaluation_funcs.decode_utf8(gtContents)
+    gtPointsList,_,gtTranscriptionsList = rrc_evaluation_funcs.get_tl_line_values_from_file_contents(gtFile,evaluationParams['CRLF'],True,True,False)
+    return gtPointsList, gtTranscriptionsList
+
+
+def parse_det_contents(detContents, evaluationParams):
+    """
+    Method parse_det_contents: returns the points and confidences lists of a detection file
+    """
+    detFile = rrc_evaluation_funcs.decode_utf8(detContents)
+    detPointsList,detConfidencesList,_ = rrc_evaluation_funcs.get_tl_line_values_from_file_contents(detFile,evaluationParams['CRLF'],True,False,False)
+    return detPointsList, detConfidencesList
+
+
+def evaluate_sample_values(sample):
+    """
+    Method evaluate_sample_values: evaluate one parsed sample, runs in the worker processes
+    sample: (gtPointsList, gtTranscriptionsList, detPointsList or None, detConfidencesList, evaluationParams)
+    The confidences are not used by this challenge
+    """
+    gtPointsList, gtTranscriptionsList, detPointsList, _, evaluationParams = sample
+    import_evaluation_modules()
+
+    return evaluate_sample(gtPointsList, gtTranscriptionsList, detPointsList, evaluationParams)
+
+
+def evaluate_sample_contents(sample):
+    """
+    Method evaluate_sample_contents: parse and evaluate one sample, runs in the worker processes
+    sample: (gt file contents, detection file contents or None, evaluationParams)
+    """
+    gtContents, detContents, evaluationParams = sample
+
+    gtPointsList, gtTranscriptionsList = parse_gt_contents(gtContents, evaluationParams)
+
+    detPointsList = None
+    detConfidencesList = []
+    if detContents is not None:
+        detPointsList, detConfidencesList = parse_det_contents(detContents, evaluationParams)
+
+    return evaluate_sample_values((gtPointsList, gtTranscriptionsList, detPointsList, detConfidencesList, evaluationParams))
+
+
+def combine_sample_results(sampleResults, evaluationParams):
+    """
+    Method combine_sample_results: returns the global method metrics from the results of evaluate_sample,
+    the samples are accumulated in the order of the list
+    """
     methodRecallSum = 0
     methodPrecisionSum = 0
-    
-    Rectangle = namedtuple('Rectangle', 'xmin ymin xmax ymax')
-    Point = namedtuple('Point', 'x y')
-    
-    gt = rrc_evaluation_funcs.load_zip_file(gtFilePath,evaluationParams['GT_SAMPLE_NAME_2_ID'])
-    subm = rrc_evaluation_funcs.load_zip_file(submFilePath,evaluationParams['DET_SAMPLE_NAME_2_ID'],True)
-   
+
     numGt = 0;
     numDet = 0;
-   
-    for resFile in gt:
-        
-        gtFile = rrc_evaluation_funcs.decode_utf8(gt[resFile])
-        recall = 0
-        precision = 0
-        hmean = 0        
-        recallAccum = 0.
-        precisionAccum = 0.
-        gtRects = []
-        detRects = []
-        gtPolPoints = []
-        detPolPoints = []
-        gtDontCareRectsNum = []#Array of Ground Truth Rectangles' keys marked as don't Care
-        detDontCareRectsNum = []#Array of Detected Rectangles' matched with a don't Care GT
-        pairs = []
-        evaluationLog = ""
-        
-        recallMat = np.empty([1,1])
-        precisionMat = np.empty([1,1])              
-        
-        pointsList,_,transcriptionsList = rrc_evaluation_funcs.get_tl_line_values_from_file_contents(gtFile,evaluationParams['CRLF'],True,True,False)
-        for n in range(len(pointsList)):
-            points = pointsList[n]
-            transcription = transcriptionsList[n]
-            dontCare = transcription == "###"
-            gtRect = Rectangle(*points)
-            gtRects.append(gtRect)
-            gtPolPoints.append(points)
-            if dontCare:
-                gtDontCareRectsNum.append( len(gtRects)-1 )                 
-        
-        evaluationLog += "GT rectangles: " + str(len(gtRects)) + (" (" + str(len(gtDontCareRectsNum)) + " don't care)\n" if len(gtDontCareRectsNum)>0 else "\n")
-        
-        if resFile in subm:
-            detFile = rrc_evaluation_funcs.decode_utf8(subm[resFile])
-            pointsList,_,_ = rrc_evaluation_funcs.get_tl_line_values_from_file_contents(detFile,evaluationParams['CRLF'],True,False,False)
-            for n in range(len(pointsList)):
-                points = pointsList[n]            
-                detRect = Rectangle(*points)
-                detRects.append(detRect)
-                detPolPoints.append(points)
-                if len(gtDontCareRectsNum)>0 :
-                    for dontCareRectNum in gtDontCareRectsNum:
-                        dontCareRect = gtRects[dontCareRectNum]
-                        intersected_area = area(dontCareRect,detRect)
-                        rdDimensions = ( (detRect.xmax - detRect.xmin+1) * (detRect.ymax - detRect.ymin+1));
-                        if (rdDimensions==0) :
-                            precision = 0
-                        else:
-                            precision= intersected_area / rdDimensions
-                        if (precision > evaluationParams['AREA_PRECISION_CONSTRAINT'] ):
-                            detDontCareRectsNum.append( len(detRects)-1 )
-                            break
-
-            evaluationLog += "DET rectangles: " + str(len(detRects)) + (" (" + str(len(detDontCareRectsNum)) + " don't care)\n" if len(detDontCareRectsNum)>0 else "\n")
-
-            if len(gtRects)==0:
-                recall = 1
-                precision = 0 if len(detRects)>0 else 1
-
-            if len(detRects)>0:
-                #Calculate recall and precision matrixs
-                outputShape=[len(gtRects),len(detRects)]
-                recallMat = np.empty(outputShape)
-                precisionMat = np.empty(outputShape)
-                gtRectMat = np.zeros(len(gtRects),np.int8)
-                detRectMat = np.zeros(len(detRects),np.int8)
-                for gtNum in range(len(gtRects)):
-                    for detNum in range(len(detRects)):
-                        rG = gtRects[gtNum]
-                        rD = detRects[detNum]
-                        intersected_area = area(rG,rD)
-                        rgDimensions = ( (rG.xmax - rG.xmin+1) * (rG.ymax - rG.ymin+1) );
-                        rdDimensions = ( (rD.xmax - rD.xmin+1) * (rD.ymax - rD.ymin+1));
-                        recallMat[gtNum,detNum] = 0 if rgDimensions==0 else  intersected_area / rgDimensions
-                        precisionMat[gtNum,detNum] = 0 if rdDimensions==0 else intersected_area / rdDimensions
-
-                # Find one-to-one matches
-                evaluationLog += "Find one-to-one matches\n"
-                for gtNum in range(len(gtRects)):
-                    for detNum in range(len(detRects)):
-                        if gtRectMat[gtNum] == 0 and detRectMat[detNum] == 0 and gtNum not in gtDontCareRectsNum and detNum not in detDontCareRectsNum :
-                            match = one_to_one_match(gtNum, detNum)
-                            if match is True :
-                                #in deteval we have to make other validation before mark as one-to-one
-                                if is_single_overlap(gtNum, detNum) is True :
-                                    rG = gtRects[gtNum]
-                                    rD = detRects[detNum]
-                                    normDist = center_distance(rG, rD);
-                                    normDist /= diag(rG) + diag(rD);
-                                    normDist *= 2.0;
-                                    if normDist < evaluationParams['EV_PARAM_IND_CENTER_DIFF_THR'] :
-                                        gtRectMat[gtNum] = 1
-                                        detRectMat[detNum] = 1
-                                        recallAccum += evaluationParams['MTYPE_OO_O']
-                                        precisionAccum += evaluationParams['MTYPE_OO_O']
-                                        pairs.append({'gt':gtNum,'det':detNum,'type':'OO'})
-                                        evaluationLog += "Match GT #" + str(gtNum) + " with Det #" + str(detNum) + "\n"
-                                    else:
-                                        evaluationLog += "Match Discarded GT #" + str(gtNum) + " with Det #" + str(detNum) + " normDist: " + str(normDist) + " \n"
-                                else:
-                                    evaluationLog += "Match Discarded GT #" + str(gtNum) + " with Det #" + str(detNum) + " not single overlap\n"
-                # Find one-to-many matches
-                evaluationLog += "Find one-to-many matches\n"
-                for gtNum in range(len(gtRects)):
-                    if gtNum not in gtDontCareRectsNum:
-                        match,matchesDet = one_to_many_match(gtNum)
-                        if match is True :
-                            evaluationLog += "num_overlaps_gt=" + str(num_overlaps_gt(gtNum))
-                            #in deteval we have to make other validation before mark as one-to-one
-                            if num_overlaps_gt(gtNum)>=2 :
-                                gtRectMat[gtNum] = 1
-                                recallAccum += (evaluationParams['MTYPE_OO_O'] if len(matchesDet)==1 else evaluationParams['MTYPE_OM_O'])
-                                precisionAccum += (evaluationParams['MTYPE_OO_O'] if len(matchesDet)==1 else evaluationParams['MTYPE_OM_O']*len(matchesDet))
-                                pairs.append({'gt':gtNum,'det':matchesDet,'type': 'OO' if len(matchesDet)==1 else 'OM'})
-                                for detNum in matchesDet :
-                                    detRectMat[detNum] = 1
-                                evaluationLog += "Match GT #" + str(gtNum) + " with Det #" + str(matchesDet) + "\n"
-                            else:
-                                evaluationLog += "Match Discarded GT #" + str(gtNum) + " with Det #" + str(matchesDet) + " not single overlap\n"    
-
-                # Find many-to-one matches
-                evaluationLog += "Find many-to-one matches\n"
-                for detNum in range(len(detRects)):
-                    if detNum not in detDontCareRectsNum:
-                        match,matchesGt = many_to_one_match(detNum)
-                        if match is True :
-                            #in deteval we have to make other validation before mark as one-to-one
-                            if num_overlaps_det(detNum)>=2 :                          
-                                detRectMat[detNum] = 1
-                                recallAccum += (evaluationParams['MTYPE_OO_O'] if len(matchesGt)==1 else evaluationParams['MTYPE_OM_M']*len(matchesGt))
-                                precisionAccum += (evaluationParams['MTYPE_OO_O'] if len(matchesGt)==1 else evaluationParams['MTYPE_OM_M'])
-                                pairs.append({'gt':matchesGt,'det':detNum,'type': 'OO' if len(matchesGt)==1 else 'MO'})
-                                for gtNum in matchesGt :
-                                    gtRectMat[gtNum] = 1
-                                evaluationLog += "Match GT #" + str(matchesGt) + " with Det #" + str(detNum) + "\n"
-                            else:
-                                evaluationLog += "Match Discarded GT #" + str(matchesGt) + " with Det #" + str(detNum) + " not single overlap\n"                                    
-
-                numGtCare = (len(gtRects) - len(gtDontCareRectsNum))
-                if numGtCare == 0:
-                    recall = float(1)
-                    precision = float(0) if len(detRects)>0 else float(1)
-                else:
-                    recall = float(recallAccum) / numGtCare
-                    precision =  float(0) if (len(detRects) - len(detDontCareRectsNum))==0 else float(precisionAccum) / (len(detRects) - len(detDontCareRectsNum))
-                hmean = 0 if (precision + recall)==0 else 2.0 * precision * recall / (precision + recall)  
-
-        methodRecallSum += recallAccum
-        methodPrecisionSum += precisionAccum
-        numGt += len(gtRects) - len(gtDontCareRectsNum)
-        numDet += len(detRects) - len(detDontCareRectsNum)
-
-        perSampleMetrics[resFile] = {
-                                        'precision':precision,
-                                        'recall':recall,
-                                        'hmean':hmean,
-                                        'pairs':pairs,
-                                        'recallMat':[] if len(detRects)>100 else recallMat.tolist(),
-                                        'precisionMat':[] if len(detRects)>100 else precisionMat.tolist(),
-                                        'gtPolPoints':gtPolPoints,
-                                        'detPolPoints':detPolPoints,
-                                        'gtDontCare':gtDontCareRectsNum,
-                                        'detDontCare':detDontCareRectsNum,
-                                        'evaluationParams': evaluationParams,
-                                        'evaluationLog': evaluationLog
-                                    }
-        
+
+    for sampleResult in sampleResults:
+        methodRecallSum += sampleResult['recallAccum']
+        methodPrecisionSum += sampleResult['precisionAccum']
+        numGt += sampleResult['numGtCare']
+        numDet += sampleResult['numDetCare']
+
     methodRecall = 0 if numGt==0 else methodRecallSum/numGt
     methodPrecision = 0 if numDet==0 else methodPrecisionSum/numDet
     methodHmean = 0 if methodRecall + methodPrecision==0 else 2* methodRecall * methodPrecision / (methodRecall + methodPrecision)
     
     methodMetrics = {'precision':methodPrecision, 'recall':methodRecall,'hmean': methodHmean  }
 
+    return methodMetrics
+
+
+def evaluate_samples(evaluate_sample_fn, resFiles, samples, evaluationParams):
+    """
+    Method evaluate_samples: evaluate the samples with evaluate_sample_fn and returns the results of evaluate_method
+    samples: the arguments of evaluate_sample_fn for each of the resFiles
+    """
+
+    import_evaluation_modules()
+
+    perSampleMetrics = {}
+
+    sampleResults = rrc_evaluation_funcs.map_samples(evaluate_sample_fn, samples, evaluationParams.get('NUM_WORKERS', 1))
+
+    for resFile, sampleResult in zip(resFiles, sampleResults):
+        perSampleMetrics[resFile] = sampleResult['per_sample']
+
+    methodMetrics = combine_sample_results(sampleResults, evaluationParams)
+
     resDict = {'calculated':True,'Message':'','method': methodMetrics,'per_sample': perSampleMetrics}
-    
-    
+
+
     return resDict;
 
 
+def evaluate_method(gtFilePath, submFilePath, evaluationParams):
+    """
+    Method evaluate_method: evaluate method and returns the results
+        Results. Dictionary with the following values:
+        - method (required)  Global method metrics. Ex: { 'Precision':0.8,'Recall':0.9 }
+        - samples (optional) Per sample metrics. Ex: {'sample1' : { 'Precision':0.8,'Recall':0.9 } , 'sample2' : { 'Precision':0.8,'Recall':0.9 }
+    """
+
+    gt = rrc_evaluation_funcs.load_zip_file(gtFilePath,evaluationParams['GT_SAMPLE_NAME_2_ID'])
+    subm = rrc_evaluation_funcs.load_zip_file(submFilePath,evaluationParams['DET_SAMPLE_NAME_2_ID'],True)
+
+    resFiles = list(gt.keys())
+    samples = [(gt[resFile], subm[resFile] if resFile in subm else None, evaluationParams) for resFile in resFiles]
+
+    return evaluate_samples(evaluate_sample_contents, resFiles, samples, evaluationParams)
+
 
 if __name__=='__main__':
-        
+
     rrc_evaluation_funcs.main_evaluation(None,default_evaluation_params,validate_data,evaluate_method)
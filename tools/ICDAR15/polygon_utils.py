@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Vectorized areas and intersection areas of quadrilaterals, used by script.py to fill
+the IoU matrix without one Polygon call per gt x det pair.
+
+Only the pairs whose axis aligned bounding boxes overlap are computed. Convex quads
+are intersected with numpy, the other pairs (concave, self-intersecting or degenerate
+quads) are left to a fallback function so their area is the one of the Polygon module.
+"""
+from __future__ import division
+
+import numpy as np
+
+
+def quads_from_points(pointsList, LTRB):
+    """
+    Returns a (N, 4, 2) array with the vertices of each polygon, in the same order and
+    with the same int() truncation as polygon_from_points / rectangle_to_polygon in script.py
+    """
+    quads = np.zeros([len(pointsList), 4, 2], dtype=np.float64)
+    for n, points in enumerate(pointsList):
+        if LTRB:
+            xmin, ymin, xmax, ymax = [int(p) for p in points]
+            quads[n] = [[xmin, ymax], [xmin, ymin], [xmax, ymin], [xmax, ymax]]
+        else:
+            quads[n] = np.array([int(p) for p in points[:8]]).reshape([4, 2])
+    return quads
+
+
+def _cross(ax, ay, bx, by):
+    return ax * by - ay * bx
+
+
+def _signed_areas(quads):
+    x = quads[..., 0]
+    y = quads[..., 1]
+    return 0.5 * np.sum(_cross(x, y, np.roll(x, -1, axis=-1), np.roll(y, -1, axis=-1)), axis=-1)
+
+
+def areas(quads):
+    """
+    Area of each quad, the absolute value of its shoelace sum like Polygon.area()
+    """
+    return np.abs(_signed_areas(quads))
+
+
+def is_convex(quads):
+    """
+    True for the strictly convex quads: every turn goes in the same direction and no
+    three consecutive vertices are collinear
+    """
+    edges = np.roll(quads, -1, axis=1) - quads
+    turns = _cross(edges[..., 0], edges[..., 1],
+                   np.roll(edges[..., 0], -1, axis=1), np.roll(edges[..., 1], -1, axis=1))
+    return np.all(turns > 0, axis=1) | np.all(turns < 0, axis=1)
+
+
+def _counter_clockwise(quads):
+    quads = quads.copy()
+    cw = _signed_areas(quads) < 0
+    quads[cw] = quads[cw, ::-1]
+    return quads
+
+
+def _clipped_edges_cross(subject, clip, keepCollinear):
+    """
+    Sum of the shoelace terms of the parts of the edges of `subject` that lie inside `clip`.
+    :param subject, clip: (P, 4, 2) counter-clockwise convex quads
+    :param keepCollinear: keep the subject edges lying on a clip edge with the same direction,
+        the other edges on the clip border are dropped so that a shared border is counted once
+    """
+    p0 = subject[:, :, None, :]
+    d = (np.roll(subject, -1, axis=1) - subject)[:, :, None, :]
+    q0 = clip[:, None, :, :]
+    e = (np.roll(clip, -1, axis=1) - clip)[:, None, :, :]
+
+    # (P, subject edge, clip edge) signed distance of both ends of the subject edge to the clip edge
+    c0 = _cross(e[..., 0], e[..., 1], p0[..., 0] - q0[..., 0], p0[..., 1] - q0[..., 1])
+    c1 = c0 + _cross(e[..., 0], e[..., 1], d[..., 0], d[..., 1])
+    denom = c1 - c0
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = -c0 / denom
+    tmin = np.max(np.where(denom > 0, t, 0.), axis=2)
+    tmax = np.min(np.where(denom < 0, t, 1.), axis=2)
+
+    parallel = denom == 0
+    collinear = parallel & (c0 == 0)
+    if keepCollinear:
+        sameDirection = (d[..., 0] * e[..., 0] + d[..., 1] * e[..., 1]) > 0
+        outside = parallel & ((c0 < 0) | (collinear & ~sameDirection))
+    else:
+        outside = parallel & (c0 <= 0)
+    inside = ~np.any(outside, axis=2) & (tmax > tmin)
+
+    a = subject + tmin[..., None] * d[:, :, 0, :]
+    b = subject + tmax[..., None] * d[:, :, 0, :]
+    terms = _cross(a[..., 0], a[..., 1], b[..., 0], b[..., 1])
+    return np.sum(np.where(inside, terms, 0.), axis=1)
+
+
+def convex_intersection_areas(quadsA, quadsB):
+    """
+    Intersection area of each pair (quadsA[i], quadsB[i]) of strictly convex quads
+    :param quadsA, quadsB: (P, 4, 2) arrays
+    """
+    if len(quadsA) == 0:
+        return np.zeros([0])
+    quadsA = _counter_clockwise(quadsA)
+    quadsB = _counter_clockwise(quadsB)
+    # The border of the intersection is made of the edges of A inside B and of the edges of B inside A
+    area = 0.5 * (_clipped_edges_cross(quadsA, quadsB, True) + _clipped_edges_cross(quadsB, quadsA, False))
+    return np.maximum(area, 0.)
+
+
+def intersection_areas(quadsA, quadsB, fallback):
+    """
+    Returns the (N, M) matrix of intersection areas between quadsA (N, 4, 2) and quadsB (M, 4, 2)
+    :param fallback: fallback(i, j) returns the intersection area of quadsA[i] and quadsB[j],
+        only called for the pairs with overlapping bounding boxes where a quad is not convex
+    """
+    areas = np.zeros([len(quadsA), len(quadsB)])
+    if len(quadsA) == 0 or len(quadsB) == 0:
+        return areas
+
+    minA, maxA = quadsA.min(axis=1), quadsA.max(axis=1)
+    minB, maxB = quadsB.min(axis=1), quadsB.max(axis=1)
+    overlap = np.all((np.minimum(maxA[:, None], maxB[None]) - np.maximum(minA[:, None], minB[None])) > 0, axis=2)
+
+    convex = is_convex(quadsA)[:, None] & is_convex(quadsB)[None, :]
+
+    rows, cols = np.nonzero(overlap & convex)
+    areas[rows, cols] = convex_intersection_areas(quadsA[rows], quadsB[cols])
+
+    for i, j in zip(*np.nonzero(overlap & ~convex)):
+        areas[i, j] = fallback(i, j)
+
+    return areas
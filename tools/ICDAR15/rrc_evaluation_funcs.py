@@ -1,4 +1,4 @@
-#!/usr/bin/env python2
+#!/usr/bin/env python
 #encoding: UTF-8
 import json
 import sys;sys.path.append('./')
@@ -8,7 +8,6 @@ import sys
 import os
 import codecs
 import importlib
-from StringIO import StringIO
 
 def print_help():
     sys.stdout.write('Usage: python %s.py -g=<gtFile> -s=<submFile> [-o=<outputFolder> -p=<jsonParams>]' %sys.argv[0])
@@ -278,6 +277,24 @@ def get_tl_line_values_from_file_contents(content,CRLF=True,LTRB=True,withTransc
 
     return pointsList,confidencesList,transcriptionsList
 
+def map_samples(evaluate_sample_fn,samples,numWorkers=1):
+    """
+    Returns [evaluate_sample_fn(sample) for sample in samples], computed by a pool of numWorkers processes if numWorkers>1.
+    The results are in the order of the samples, so accumulating them gives the same values as a serial evaluation.
+    evaluate_sample_fn must be a module level function so it can be sent to the workers.
+    """
+    if numWorkers<=1 or len(samples)<2:
+        return [evaluate_sample_fn(sample) for sample in samples]
+
+    import multiprocessing
+    pool = multiprocessing.Pool(numWorkers)
+    try:
+        chunksize = max(1, len(samples) // (numWorkers*4))
+        return pool.map(evaluate_sample_fn, samples, chunksize)
+    finally:
+        pool.close()
+        pool.join()
+
 def main_evaluation(p,default_evaluation_params_fn,validate_data_fn,evaluate_method_fn,show_result=True,per_sample=True):
     """
     This process validates a method, evaluates it and if it succed generates a ZIP file with a JSON entry for each sample.
@@ -303,7 +320,7 @@ def main_evaluation(p,default_evaluation_params_fn,validate_data_fn,evaluate_met
         evalData = evaluate_method_fn(p['g'], p['s'], evalParams)
         resDict.update(evalData)
 
-    except Exception, e:
+    except Exception as e:
         resDict['Message']= str(e)
         resDict['calculated']=False
 
@@ -329,11 +346,11 @@ def main_evaluation(p,default_evaluation_params_fn,validate_data_fn,evaluate_met
 
     if 'o' in p:
         if per_sample == True:
-            for k,v in evalData['per_sample'].iteritems():
+            for k,v in evalData['per_sample'].items():
                 outZip.writestr( k + '.json',json.dumps(v))
 
             if 'output_items' in evalData.keys():
-                for k, v in evalData['output_items'].iteritems():
+                for k, v in evalData['output_items'].items():
                     outZip.writestr( k,v)
 
         outZip.close()
@@ -359,8 +376,8 @@ def main_validation(default_evaluation_params_fn,validate_data_fn):
             evalParams.update( p['p'] if isinstance(p['p'], dict) else json.loads(p['p'][1:-1]) )
 
         validate_data_fn(p['g'], p['s'], evalParams)
-        print 'SUCCESS'
+        print('SUCCESS')
         sys.exit(0)
     except Exception as e:
-        print str(e)
+        print(str(e))
         sys.exit(101)
\ No newline at end of file
@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 from collections import namedtuple
 import rrc_evaluation_funcs
+import polygon_utils
 import importlib
 
 
@@ -27,7 +28,8 @@ def default_evaluation_params():
         'LTRB': False,  # LTRB:2points(left,top,right,bottom) or 4 points(x1,y1,x2,y2,x3,y3,x4,y4)
         'CRLF': False,  # Lines are delimited by Windows CRLF format
         'CONFIDENCES': False,  # Detections must include confidence value. AP will be calculated
-        'PER_SAMPLE_RESULTS': True  # Generate per sample results and produce data for visualization
+        'PER_SAMPLE_RESULTS': True,  # Generate per sample results and produce data for visualization
+        'NUM_WORKERS': 1  # Number of processes evaluating the samples
     }
 
 
@@ -54,267 +56,344 @@ def validate_data(gtFilePath, submFilePath, evaluationParams):
                                                  False, evaluationParams['CONFIDENCES'])
 
 
-def evaluate_method(gtFilePath, submFilePath, evaluationParams):
+def import_evaluation_modules():
+    for module, alias in evaluation_imports().items():
+        globals()[alias] = importlib.import_module(module)
+
+
+Rectangle = namedtuple('Rectangle', 'xmin ymin xmax ymax')
+
+
+def polygon_from_points(points):
     """
-    Method evaluate_method: evaluate method and returns the results
-        Results. Dictionary with the following values:
-        - method (required)  Global method metrics. Ex: { 'Precision':0.8,'Recall':0.9 }
-        - samples (optional) Per sample metrics. Ex: {'sample1' : { 'Precision':0.8,'Recall':0.9 } , 'sample2' : { 'Precision':0.8,'Recall':0.9 }
+    Returns a Polygon object to use with the Polygon2 class from a list of 8 points: x1,y1,x2,y2,x3,y3,x4,y4
+    """
+    resBoxes = np.empty([1, 8], dtype='int32')
+    resBoxes[0, 0] = int(points[0])
+    resBoxes[0, 4] = int(points[1])
+    resBoxes[0, 1] = int(points[2])
+    resBoxes[0, 5] = int(points[3])
+    resBoxes[0, 2] = int(points[4])
+    resBoxes[0, 6] = int(points[5])
+    resBoxes[0, 3] = int(points[6])
+    resBoxes[0, 7] = int(points[7])
+    pointMat = resBoxes[0].reshape([2, 4]).T
+    return plg.Polygon(pointMat)
+
+
+def rectangle_to_polygon(rect):
+    resBoxes = np.empty([1, 8], dtype='int32')
+    resBoxes[0, 0] = int(rect.xmin)
+    resBoxes[0, 4] = int(rect.ymax)
+    resBoxes[0, 1] = int(rect.xmin)
+    resBoxes[0, 5] = int(rect.ymin)
+    resBoxes[0, 2] = int(rect.xmax)
+    resBoxes[0, 6] = int(rect.ymin)
+    resBoxes[0, 3] = int(rect.xmax)
+    resBoxes[0, 7] = int(rect.ymax)
+
+    pointMat = resBoxes[0].reshape([2, 4]).T
+
+    return plg.Polygon(pointMat)
+
+
+def rectangle_to_points(rect):
+    points = [int(rect.xmin), int(rect.ymax), int(rect.xmax), int(rect.ymax), int(rect.xmax), int(rect.ymin),
+              int(rect.xmin), int(rect.ymin)]
+    return points
+
+
+class LazyPolygons(object):
+    """
+    Polygon objects of a list of points, built on first access
     """
 
-    for module, alias in evaluation_imports().iteritems():
-        globals()[alias] = importlib.import_module(module)
+    def __init__(self, pointsList, LTRB):
+        self.pointsList = pointsList
+        self.LTRB = LTRB
+        self.polygons = {}
 
-    def polygon_from_points(points):
-        """
-        Returns a Polygon object to use with the Polygon2 class from a list of 8 points: x1,y1,x2,y2,x3,y3,x4,y4
-        """
-        resBoxes = np.empty([1, 8], dtype='int32')
-        resBoxes[0, 0] = int(points[0])
-        resBoxes[0, 4] = int(points[1])
-        resBoxes[0, 1] = int(points[2])
-        resBoxes[0, 5] = int(points[3])
-        resBoxes[0, 2] = int(points[4])
-        resBoxes[0, 6] = int(points[5])
-        resBoxes[0, 3] = int(points[6])
-        resBoxes[0, 7] = int(points[7])
-        pointMat = resBoxes[0].reshape([2, 4]).T
-        return plg.Polygon(pointMat)
-
-    def rectangle_to_polygon(rect):
-        resBoxes = np.empty([1, 8], dtype='int32')
-        resBoxes[0, 0] = int(rect.xmin)
-        resBoxes[0, 4] = int(rect.ymax)
-        resBoxes[0, 1] = int(rect.xmin)
-        resBoxes[0, 5] = int(rect.ymin)
-        resBoxes[0, 2] = int(rect.xmax)
-        resBoxes[0, 6] = int(rect.ymin)
-        resBoxes[0, 3] = int(rect.xmax)
-        resBoxes[0, 7] = int(rect.ymax)
-
-        pointMat = resBoxes[0].reshape([2, 4]).T
-
-        return plg.Polygon(pointMat)
-
-    def rectangle_to_points(rect):
-        points = [int(rect.xmin), int(rect.ymax), int(rect.xmax), int(rect.ymax), int(rect.xmax), int(rect.ymin),
-                  int(rect.xmin), int(rect.ymin)]
-        return points
-
-    def get_union(pD, pG):
-        areaA = pD.area();
-        areaB = pG.area();
-        return areaA + areaB - get_intersection(pD, pG);
-
-    def get_intersection_over_union(pD, pG):
-        try:
-            return get_intersection(pD, pG) / get_union(pD, pG);
-        except:
-            return 0
-
-    def get_intersection(pD, pG):
-        pInt = pD & pG
-        if len(pInt) == 0:
-            return 0
-        return pInt.area()
-
-    def compute_ap(confList, matchList, numGtCare):
-        correct = 0
-        AP = 0
-        if len(confList) > 0:
-            confList = np.array(confList)
-            matchList = np.array(matchList)
-            sorted_ind = np.argsort(-confList)
-            confList = confList[sorted_ind]
-            matchList = matchList[sorted_ind]
-            for n in range(len(confList)):
-                match = matchList[n]
-                if match:
-                    correct += 1
-                    AP += float(correct) / (n + 1)
-
-            if numGtCare > 0:
-                AP /= numGtCare
-
-        return AP
+    def __len__(self):
+        return len(self.pointsList)
 
-    perSampleMetrics = {}
+    def __getitem__(self, n):
+        if n not in self.polygons:
+            points = self.pointsList[n]
+            if self.LTRB:
+                self.polygons[n] = rectangle_to_polygon(Rectangle(*points))
+            else:
+                self.polygons[n] = polygon_from_points(points)
+        return self.polygons[n]
 
-    matchedSum = 0
 
-    Rectangle = namedtuple('Rectangle', 'xmin ymin xmax ymax')
+def get_union(pD, pG):
+    areaA = pD.area();
+    areaB = pG.area();
+    return areaA + areaB - get_intersection(pD, pG);
 
-    gt = rrc_evaluation_funcs.load_zip_file(gtFilePath, evaluationParams['GT_SAMPLE_NAME_2_ID'])
-    subm = rrc_evaluation_funcs.load_zip_file(submFilePath, evaluationParams['DET_SAMPLE_NAME_2_ID'], True)
 
-    numGlobalDontCareGt = 0
-    numGlobalDontCareDet = 0
-    numGlobalCareGt = 0;
-    numGlobalCareDet = 0;
+def get_intersection_over_union(pD, pG):
+    try:
+        return get_intersection(pD, pG) / get_union(pD, pG);
+    except:
+        return 0
 
-    arrGlobalConfidences = [];
-    arrGlobalMatches = [];
 
-    for resFile in gt:
+def get_intersection(pD, pG):
+    pInt = pD & pG
+    if len(pInt) == 0:
+        return 0
+    return pInt.area()
 
-        gtFile = rrc_evaluation_funcs.decode_utf8(gt[resFile])
-        recall = 0
-        precision = 0
-        hmean = 0
 
-        detMatched = 0
+def compute_ap(confList, matchList, numGtCare):
+    correct = 0
+    AP = 0
+    if len(confList) > 0:
+        confList = np.array(confList)
+        matchList = np.array(matchList)
+        sorted_ind = np.argsort(-confList)
+        confList = confList[sorted_ind]
+        matchList = matchList[sorted_ind]
+        for n in range(len(confList)):
+            match = matchList[n]
+            if match:
+                correct += 1
+                AP += float(correct) / (n + 1)
 
-        iouMat = np.empty([1, 1])
+        if numGtCare > 0:
+            AP /= numGtCare
 
-        gtPols = []
-        detPols = []
+    return AP
 
-        gtPolPoints = []
-        detPolPoints = []
 
-        # Array of Ground Truth Polygons' keys marked as don't Care
-        gtDontCarePolsNum = []
-        # Array of Detected Polygons' matched with a don't Care GT
-        detDontCarePolsNum = []
+def evaluate_sample(gtPointsList, gtTranscriptionsList, detPointsList, detConfidencesList, evaluationParams):
+    """
+    Method evaluate_sample: evaluate the detections of one sample
+    detPointsList is None when the sample is not in the submission
+    Returns a dictionary with the counts of the sample, its confidences and matches,
+    and its metrics in 'per_sample' when PER_SAMPLE_RESULTS is set
+    """
+    recall = 0
+    precision = 0
+    hmean = 0
+
+    detMatched = 0
+
+    iouMat = np.empty([1, 1])
+
+    gtPolPoints = []
+    detPolPoints = []
+
+    # Polygon objects are only built for the pairs the vectorized areas cannot settle
+    gtPols = LazyPolygons(gtPolPoints, evaluationParams['LTRB'])
+    detPols = LazyPolygons(detPolPoints, evaluationParams['LTRB'])
+
+    # Array of Ground Truth Polygons' keys marked as don't Care
+    gtDontCarePolsNum = []
+    # Array of Detected Polygons' matched with a don't Care GT
+    detDontCarePolsNum = []
+
+    pairs = []
+    detMatchedNums = []
+
+    arrSampleConfidences = [];
+    arrSampleMatch = [];
+    sampleAP = 0;
+
+    evaluationLog = ""
+
+    for n in range(len(gtPointsList)):
+        points = gtPointsList[n]
+        transcription = gtTranscriptionsList[n]
+        dontCare = transcription == "###"
+        gtPolPoints.append(points)
+        if dontCare:
+            gtDontCarePolsNum.append(len(gtPolPoints) - 1)
+
+    evaluationLog += "GT polygons: " + str(len(gtPols)) + (
+        " (" + str(len(gtDontCarePolsNum)) + " don't care)\n" if len(gtDontCarePolsNum) > 0 else "\n")
+
+    if detPointsList is not None:
+
+        for n in range(len(detPointsList)):
+            points = detPointsList[n]
+            detPolPoints.append(points)
+
+        gtQuads = polygon_utils.quads_from_points(gtPolPoints, evaluationParams['LTRB'])
+        detQuads = polygon_utils.quads_from_points(detPolPoints, evaluationParams['LTRB'])
+        gtAreas = polygon_utils.areas(gtQuads)
+        detAreas = polygon_utils.areas(detQuads)
+
+        # 过滤掉 don't care 区域
+        if len(gtDontCarePolsNum) > 0 and len(detPols) > 0:
+            # precisionMat[detNum, n]: part of the detection covered by the n-th don't care gt
+            intersectedMat = polygon_utils.intersection_areas(
+                detQuads, gtQuads[gtDontCarePolsNum],
+                lambda detNum, n: get_intersection(gtPols[gtDontCarePolsNum[n]], detPols[detNum]))
+            precisionMat = np.zeros(intersectedMat.shape)
+            nonEmpty = detAreas > 0
+            precisionMat[nonEmpty] = intersectedMat[nonEmpty] / detAreas[nonEmpty, None]
+            # Ties with the constraint are decided by Polygon, as in the per pair evaluation
+            for detNum, n in zip(*np.nonzero(
+                    np.abs(precisionMat - evaluationParams['AREA_PRECISION_CONSTRAINT']) < 1e-9)):
+                precisionMat[detNum, n] = get_intersection(gtPols[gtDontCarePolsNum[n]],
+                                                           detPols[detNum]) / detAreas[detNum]
+            detDontCarePolsNum = np.nonzero(
+                np.any(precisionMat > evaluationParams['AREA_PRECISION_CONSTRAINT'], axis=1))[0].tolist()
+
+        evaluationLog += "DET polygons: " + str(len(detPols)) + (
+            " (" + str(len(detDontCarePolsNum)) + " don't care)\n" if len(detDontCarePolsNum) > 0 else "\n")
+
+        if len(gtPols) > 0 and len(detPols) > 0:
+            # Calculate IoU and precision matrixs
+            intersectionMat = polygon_utils.intersection_areas(
+                gtQuads, detQuads, lambda gtNum, detNum: get_intersection(detPols[detNum], gtPols[gtNum]))
+            unionMat = gtAreas[:, None] + detAreas[None, :] - intersectionMat
+            iouMat = np.zeros(intersectionMat.shape)
+            nonEmpty = unionMat != 0
+            iouMat[nonEmpty] = intersectionMat[nonEmpty] / unionMat[nonEmpty]
+            # Ties with the constraint are decided by Polygon, as in the per pair evaluation
+            for gtNum, detNum in zip(*np.nonzero(np.abs(iouMat - evaluationParams['IOU_CONSTRAINT']) < 1e-9)):
+                iouMat[gtNum, detNum] = get_intersection_over_union(detPols[detNum], gtPols[gtNum])
+
+            gtRectMat = np.zeros(len(gtPols), np.int8)
+            detRectMat = np.zeros(len(detPols), np.int8)
+            # Same greedy order as looping over every gt then every det
+            for gtNum, detNum in zip(*np.nonzero(iouMat > evaluationParams['IOU_CONSTRAINT'])):
+                gtNum, detNum = int(gtNum), int(detNum)
+                if gtRectMat[gtNum] == 0 and detRectMat[detNum] == 0 and gtNum not in gtDontCarePolsNum and detNum not in detDontCarePolsNum:
+                    gtRectMat[gtNum] = 1
+                    detRectMat[detNum] = 1
+                    detMatched += 1
+                    pairs.append({'gt': gtNum, 'det': detNum})
+                    detMatchedNums.append(detNum)
+                    evaluationLog += "Match GT #" + str(gtNum) + " with Det #" + str(detNum) + "\n"
+
+        if evaluationParams['CONFIDENCES']:
+            for detNum in range(len(detPols)):
+                if detNum not in detDontCarePolsNum:
+                    # we exclude the don't care detections
+                    match = detNum in detMatchedNums
+
+                    arrSampleConfidences.append(detConfidencesList[detNum])
+                    arrSampleMatch.append(match)
+
+    numGtCare = (len(gtPols) - len(gtDontCarePolsNum))
+    numDetCare = (len(detPols) - len(detDontCarePolsNum))
+    if numGtCare == 0:
+        recall = float(1)
+        precision = float(0) if numDetCare > 0 else float(1)
+        sampleAP = precision
+    else:
+        recall = float(detMatched) / numGtCare
+        precision = 0 if numDetCare == 0 else float(detMatched) / numDetCare
+        if evaluationParams['CONFIDENCES'] and evaluationParams['PER_SAMPLE_RESULTS']:
+            sampleAP = compute_ap(arrSampleConfidences, arrSampleMatch, numGtCare)
+
+    hmean = 0 if (precision + recall) == 0 else 2.0 * precision * recall / (precision + recall)
+
+    sampleResult = {
+        'detMatched': detMatched,
+        'numGtCare': numGtCare,
+        'numDetCare': numDetCare,
+        'numDontCareGt': len(gtDontCarePolsNum),
+        'numDontCareDet': len(detDontCarePolsNum),
+        'confidences': arrSampleConfidences,
+        'matches': arrSampleMatch
+    }
 
-        pairs = []
-        detMatchedNums = []
+    if evaluationParams['PER_SAMPLE_RESULTS']:
+        sampleResult['per_sample'] = {
+            'precision': precision,
+            'recall': recall,
+            'hmean': hmean,
+            'pairs': pairs,
+            'AP': sampleAP,
+            'iouMat': [] if len(detPols) > 100 else iouMat.tolist(),
+            'gtPolPoints': gtPolPoints,
+            'detPolPoints': detPolPoints,
+            'gtDontCare': gtDontCarePolsNum,
+            'detDontCare': detDontCarePolsNum,
+            'evaluationParams': evaluationParams,
+            'evaluationLog': evaluationLog
+        }
+
+    return sampleResult
+
+
+def parse_gt_contents(gtContents, evaluationParams):
+    """
+    Method parse_gt_contents: returns the points and transcriptions lists of a gt file
+    """
+    gtFile = rrc_evaluation_funcs.decode_utf8(gtContents)
+    gtPointsList, _, gtTranscriptionsList = rrc_evaluation_funcs.get_tl_line_values_from_file_contents(
+        gtFile, evaluationParams['CRLF'], evaluationParams['LTRB'], True, False)
+    return gtPointsList, gtTranscriptionsList
 
-        arrSampleConfidences = [];
-        arrSampleMatch = [];
-        sampleAP = 0;
 
-        evaluationLog = ""
+def parse_det_contents(detContents, evaluationParams):
+    """
+    Method parse_det_contents: returns the points and confidences lists of a detection file,
+    sorted by decreasing confidence when CONFIDENCES is set
+    """
+    detFile = rrc_evaluation_funcs.decode_utf8(detContents)
+    detPointsList, detConfidencesList, _ = rrc_evaluation_funcs.get_tl_line_values_from_file_contents(
+        detFile, evaluationParams['CRLF'], evaluationParams['LTRB'], False, evaluationParams['CONFIDENCES'])
+    return detPointsList, detConfidencesList
 
-        pointsList, _, transcriptionsList = rrc_evaluation_funcs.get_tl_line_values_from_file_contents(gtFile,
-                                                                                                       evaluationParams[
-                                                                                                           'CRLF'],
-                                                                                                       evaluationParams[
-                                                                                                           'LTRB'],
-                                                                                                       True, False)
-        for n in range(len(pointsList)):
-            points = pointsList[n]
-            transcription = transcriptionsList[n]
-            dontCare = transcription == "###"
-            if evaluationParams['LTRB']:
-                gtRect = Rectangle(*points)
-                gtPol = rectangle_to_polygon(gtRect)
-            else:
-                gtPol = polygon_from_points(points)
-            gtPols.append(gtPol)
-            gtPolPoints.append(points)
-            if dontCare:
-                gtDontCarePolsNum.append(len(gtPols) - 1)
-
-        evaluationLog += "GT polygons: " + str(len(gtPols)) + (
-            " (" + str(len(gtDontCarePolsNum)) + " don't care)\n" if len(gtDontCarePolsNum) > 0 else "\n")
-
-        if resFile in subm:
-
-            detFile = rrc_evaluation_funcs.decode_utf8(subm[resFile])
-
-            pointsList, confidencesList, _ = rrc_evaluation_funcs.get_tl_line_values_from_file_contents(detFile,
-                                                                                                        evaluationParams[
-                                                                                                            'CRLF'],
-                                                                                                        evaluationParams[
-                                                                                                            'LTRB'],
-                                                                                                        False,
-                                                                                                        evaluationParams[
-                                                                                                            'CONFIDENCES'])
-            for n in range(len(pointsList)):
-                points = pointsList[n]
-
-                if evaluationParams['LTRB']:
-                    detRect = Rectangle(*points)
-                    detPol = rectangle_to_polygon(detRect)
-                else:
-                    detPol = polygon_from_points(points)
-                detPols.append(detPol)
-                detPolPoints.append(points)
-                # 过滤掉 don't care 区域
-                if len(gtDontCarePolsNum) > 0:
-                    for dontCarePol in gtDontCarePolsNum:
-                        dontCarePol = gtPols[dontCarePol]
-                        intersected_area = get_intersection(dontCarePol, detPol)
-                        pdDimensions = detPol.area()
-                        precision = 0 if pdDimensions == 0 else intersected_area / pdDimensions
-                        if (precision > evaluationParams['AREA_PRECISION_CONSTRAINT']):
-                            detDontCarePolsNum.append(len(detPols) - 1)
-                            break
-
-            evaluationLog += "DET polygons: " + str(len(detPols)) + (
-                " (" + str(len(detDontCarePolsNum)) + " don't care)\n" if len(detDontCarePolsNum) > 0 else "\n")
-
-            if len(gtPols) > 0 and len(detPols) > 0:
-                # Calculate IoU and precision matrixs
-                outputShape = [len(gtPols), len(detPols)]
-                iouMat = np.empty(outputShape)
-                gtRectMat = np.zeros(len(gtPols), np.int8)
-                detRectMat = np.zeros(len(detPols), np.int8)
-                for gtNum in range(len(gtPols)):
-                    for detNum in range(len(detPols)):
-                        pG = gtPols[gtNum]
-                        pD = detPols[detNum]
-                        iouMat[gtNum, detNum] = get_intersection_over_union(pD, pG)
-
-                for gtNum in range(len(gtPols)):
-                    for detNum in range(len(detPols)):
-                        if gtRectMat[gtNum] == 0 and detRectMat[detNum] == 0 and gtNum not in gtDontCarePolsNum and detNum not in detDontCarePolsNum:
-                            if iouMat[gtNum, detNum] > evaluationParams['IOU_CONSTRAINT']:
-                                gtRectMat[gtNum] = 1
-                                detRectMat[detNum] = 1
-                                detMatched += 1
-                                pairs.append({'gt': gtNum, 'det': detNum})
-                                detMatchedNums.append(detNum)
-                                evaluationLog += "Match GT #" + str(gtNum) + " with Det #" + str(detNum) + "\n"
-
-            if evaluationParams['CONFIDENCES']:
-                for detNum in range(len(detPols)):
-                    if detNum not in detDontCarePolsNum:
-                        # we exclude the don't care detections
-                        match = detNum in detMatchedNums
-
-                        arrSampleConfidences.append(confidencesList[detNum])
-                        arrSampleMatch.append(match)
-
-                        arrGlobalConfidences.append(confidencesList[detNum]);
-                        arrGlobalMatches.append(match);
-
-        numGtCare = (len(gtPols) - len(gtDontCarePolsNum))
-        numDetCare = (len(detPols) - len(detDontCarePolsNum))
-        if numGtCare == 0:
-            recall = float(1)
-            precision = float(0) if numDetCare > 0 else float(1)
-            sampleAP = precision
-        else:
-            recall = float(detMatched) / numGtCare
-            precision = 0 if numDetCare == 0 else float(detMatched) / numDetCare
-            if evaluationParams['CONFIDENCES'] and evaluationParams['PER_SAMPLE_RESULTS']:
-                sampleAP = compute_ap(arrSampleConfidences, arrSampleMatch, numGtCare)
-
-        hmean = 0 if (precision + recall) == 0 else 2.0 * precision * recall / (precision + recall)
-
-        matchedSum += detMatched
-        numGlobalCareGt += numGtCare
-        numGlobalCareDet += numDetCare
-        numGlobalDontCareGt += len(gtDontCarePolsNum)
-        numGlobalDontCareDet += len(detDontCarePolsNum)
-
-        if evaluationParams['PER_SAMPLE_RESULTS']:
-            perSampleMetrics[resFile] = {
-                'precision': precision,
-                'recall': recall,
-                'hmean': hmean,
-                'pairs': pairs,
-                'AP': sampleAP,
-                'iouMat': [] if len(detPols) > 100 else iouMat.tolist(),
-                'gtPolPoints': gtPolPoints,
-                'detPolPoints': detPolPoints,
-                'gtDontCare': gtDontCarePolsNum,
-                'detDontCare': detDontCarePolsNum,
-                'evaluationParams': evaluationParams,
-                'evaluationLog': evaluationLog
-            }
+
+def evaluate_sample_values(sample):
+    """
+    Method evaluate_sample_values: evaluate one parsed sample, runs in the worker processes
+    sample: (gtPointsList, gtTranscriptionsList, detPointsList or None, detConfidencesList, evaluationParams)
+    """
+    gtPointsList, gtTranscriptionsList, detPointsList, detConfidencesList, evaluationParams = sample
+    import_evaluation_modules()
+
+    return evaluate_sample(gtPointsList, gtTranscriptionsList, detPointsList, detConfidencesList, evaluationParams)
+
+
+def evaluate_sample_contents(sample):
+    """
+    Method evaluate_sample_contents: parse and evaluate one sample, runs in the worker processes
+    sample: (gt file contents, detection file contents or None, evaluationParams)
+    """
+    gtContents, detContents, evaluationParams = sample
+
+    gtPointsList, gtTranscriptionsList = parse_gt_contents(gtContents, evaluationParams)
+
+    detPointsList = None
+    detConfidencesList = []
+    if detContents is not None:
+        detPointsList, detConfidencesList = parse_det_contents(detContents, evaluationParams)
+
+    return evaluate_sample_values((gtPointsList, gtTranscriptionsList, detPointsList, detConfidencesList, evaluationParams))
+
+
+def combine_sample_results(sampleResults, evaluationParams):
+    """
+    Method combine_sample_results: returns the global method metrics from the results of evaluate_sample,
+    the samples are accumulated in the order of the list
+    """
+    matchedSum = 0
+
+    numGlobalDontCareGt = 0
+    numGlobalDontCareDet = 0
+    numGlobalCareGt = 0;
+    numGlobalCareDet = 0;
+
+    arrGlobalConfidences = [];
+    arrGlobalMatches = [];
+
+    for sampleResult in sampleResults:
+        matchedSum += sampleResult['detMatched']
+        numGlobalCareGt += sampleResult['numGtCare']
+        numGlobalCareDet += sampleResult['numDetCare']
+        numGlobalDontCareGt += sampleResult['numDontCareGt']
+        numGlobalDontCareDet += sampleResult['numDontCareDet']
+        arrGlobalConfidences.extend(sampleResult['confidences'])
+        arrGlobalMatches.extend(sampleResult['matches'])
 
     # Compute MAP and MAR
     AP = 0
@@ -328,10 +407,49 @@ def evaluate_method(gtFilePath, submFilePath, evaluationParams):
 
     methodMetrics = {'precision': methodPrecision, 'recall': methodRecall, 'hmean': methodHmean, 'AP': AP}
 
+    return methodMetrics
+
+
+def evaluate_samples(evaluate_sample_fn, resFiles, samples, evaluationParams):
+    """
+    Method evaluate_samples: evaluate the samples with evaluate_sample_fn and returns the results of evaluate_method
+    samples: the arguments of evaluate_sample_fn for each of the resFiles
+    """
+
+    import_evaluation_modules()
+
+    perSampleMetrics = {}
+
+    sampleResults = rrc_evaluation_funcs.map_samples(evaluate_sample_fn, samples,
+                                                     evaluationParams.get('NUM_WORKERS', 1))
+
+    if evaluationParams['PER_SAMPLE_RESULTS']:
+        for resFile, sampleResult in zip(resFiles, sampleResults):
+            perSampleMetrics[resFile] = sampleResult['per_sample']
+
+    methodMetrics = combine_sample_results(sampleResults, evaluationParams)
+
     resDict = {'calculated': True, 'Message': '', 'method': methodMetrics, 'per_sample': perSampleMetrics}
 
     return resDict;
 
 
+def evaluate_method(gtFilePath, submFilePath, evaluationParams):
+    """
+    Method evaluate_method: evaluate method and returns the results
+        Results. Dictionary with the following values:
+        - method (required)  Global method metrics. Ex: { 'Precision':0.8,'Recall':0.9 }
+        - samples (optional) Per sample metrics. Ex: {'sample1' : { 'Precision':0.8,'Recall':0.9 } , 'sample2' : { 'Precision':0.8,'Recall':0.9 }
+    """
+
+    gt = rrc_evaluation_funcs.load_zip_file(gtFilePath, evaluationParams['GT_SAMPLE_NAME_2_ID'])
+    subm = rrc_evaluation_funcs.load_zip_file(submFilePath, evaluationParams['DET_SAMPLE_NAME_2_ID'], True)
+
+    resFiles = list(gt.keys())
+    samples = [(gt[resFile], subm[resFile] if resFile in subm else None, evaluationParams) for resFile in resFiles]
+
+    return evaluate_samples(evaluate_sample_contents, resFiles, samples, evaluationParams)
+
+
 if __name__ == '__main__':
     rrc_evaluation_funcs.main_evaluation(None, default_evaluation_params, validate_data, evaluate_method)
@@ -0,0 +1,105 @@
+"""
+Compare the latency of the CTPN.LSTM implementations of the BiLSTM of the RPN head
+on feature maps of several widths, and check that they give the same outputs.
+
+The 'dynamic' graph is initialized and saved, the 'fused' graph is restored from that
+checkpoint by variable name, as a checkpoint of a trained model would be.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import _init_paths
+from model.config import cfg, cfg_from_file, cfg_from_list
+from model.train_val import get_session_config
+import argparse
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+import tensorflow as tf
+from nets.vgg16 import vgg16
+
+IMPLEMENTATIONS = ('dynamic', 'fused')
+HIDDEN_NUM = 128
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Compare the latency of the BiLSTM implementations')
+    parser.add_argument('--cfg', dest='cfg_file', help='optional config file',
+                        default='./data/cfgs/vgg16.yml', type=str)
+    parser.add_argument('--height', help='height of the feature map', default=38, type=int)
+    parser.add_argument('--widths', help='widths of the feature map', default=[16, 38, 75, 150],
+                        nargs='+', type=int)
+    parser.add_argument('--runs', help='number of timed runs per width', default=20, type=int)
+    parser.add_argument('--tolerance', help='maximal absolute difference of the outputs',
+                        default=1e-4, type=float)
+    parser.add_argument('--set', dest='set_cfgs', help='set config keys', default=None,
+                        nargs=argparse.REMAINDER)
+    return parser.parse_args()
+
+
+def build(impl):
+    """The BiLSTM of the RPN head on a feature map placeholder"""
+    cfg.CTPN.LSTM = impl
+    net = vgg16()
+    feature_map = tf.placeholder(tf.float32, shape=[1, None, None, cfg.RPN_CHANNELS])
+    bi_lstm = net._BiLstm(feature_map, cfg.RPN_CHANNELS, HIDDEN_NUM, name='bi_lstm')
+    return feature_map, bi_lstm
+
+
+def run(impl, ckpt, inputs, runs):
+    """
+    :return: {width: (outputs, median latency in seconds)}
+    """
+    results = {}
+    with tf.Graph().as_default(), tf.Session(config=get_session_config()) as sess:
+        feature_map, bi_lstm = build(impl)
+        saver = tf.train.Saver()
+        if os.path.exists(ckpt + '.index'):
+            saver.restore(sess, ckpt)
+        else:
+            sess.run(tf.global_variables_initializer())
+            saver.save(sess, ckpt)
+
+        for width, x in inputs.items():
+            # Warm up, the first run of a shape builds the kernels
+            outputs = sess.run(bi_lstm, feed_dict={feature_map: x})
+            latencies = []
+            for _ in range(runs):
+                start = time.time()
+                sess.run(bi_lstm, feed_dict={feature_map: x})
+                latencies.append(time.time() - start)
+            results[width] = (outputs, np.median(latencies))
+    return results
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    if args.cfg_file is not None:
+        cfg_from_file(args.cfg_file)
+    if args.set_cfgs is not None:
+        cfg_from_list(args.set_cfgs)
+
+    np.random.seed(cfg.RNG_SEED)
+    inputs = dict((w, np.random.randn(1, args.height, w, cfg.RPN_CHANNELS).astype(np.float32))
+                  for w in args.widths)
+    ckpt = os.path.join(tempfile.mkdtemp(), 'bi_lstm.ckpt')
+
+    results = dict((impl, run(impl, ckpt, inputs, args.runs)) for impl in IMPLEMENTATIONS)
+
+    ok = True
+    print('{:>6s} {:>12s} {:>12s} {:>8s} {:>10s}'.format('width', 'dynamic (ms)', 'fused (ms)', 'speedup', 'max diff'))
+    for w in args.widths:
+        dynamic_out, dynamic_time = results['dynamic'][w]
+        fused_out, fused_time = results['fused'][w]
+        diff = np.max(np.abs(dynamic_out - fused_out))
+        ok = ok and diff <= args.tolerance
+        print('{:6d} {:12.2f} {:12.2f} {:7.2f}x {:10.2e}'.format(
+            w, dynamic_time * 1000, fused_time * 1000, dynamic_time / fused_time, diff))
+
+    print('Outputs {:s}'.format('OK' if ok else 'FAILED'))
+    sys.exit(0 if ok else 1)
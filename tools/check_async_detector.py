@@ -0,0 +1,199 @@
+"""
+Check model/async_detector.AsyncTextDetector with a pure asyncio harness:
+
+- coalescing: concurrent detections are run in batches and give the text lines of
+  im_detect_rpn + TextDetector.detect run one image at a time
+- timeout: a detection slower than its timeout raises asyncio.TimeoutError
+- cancellation: a detection cancelled while waiting for its batch is not run
+- close: the detections in flight when the detector is closed are cancelled
+
+The network is a stand-in of the RPN with random weights by default, so the check
+only needs numpy and cv2. --net runs a randomly initialised network of nets/ instead.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import _init_paths
+from model.config import cfg, cfg_from_file, cfg_from_list
+from model.test import im_detect_rpn, recover_scale
+from model.async_detector import AsyncTextDetector
+from text_connector import TextDetector
+import argparse
+import asyncio
+import sys
+import threading
+import time
+import numpy as np
+
+CLASSES = ('__background__', 'text')
+
+
+class RandomRpn(object):
+    """
+    Stand-in of Network.test_rpn: the text scores of each 16 px cell are a random linear function
+    of its mean color, the box deltas are 0
+    """
+
+    def __init__(self, num_anchors, seed=0):
+        rng = np.random.RandomState(seed)
+        self.weights = rng.randn(3, num_anchors).astype(np.float32) / 32.
+        self.bias = rng.randn(num_anchors).astype(np.float32)
+
+    def __call__(self, image):
+        n, height, width, _ = image.shape
+        h, w = int(np.ceil(height / 16.)), int(np.ceil(width / 16.))
+        padded = np.pad(image, ((0, 0), (0, h * 16 - height), (0, w * 16 - width), (0, 0)), mode='edge')
+        cells = padded.reshape((n, h, 16, w, 16, 3)).mean(axis=(2, 4))
+        text = 1. / (1. + np.exp(-(cells.dot(self.weights) + self.bias)))
+        cls_prob = np.stack([1. - text, text], axis=-1).reshape((n, h, w, -1))
+        bbox_pred = np.zeros((n, h, w, 4 * len(self.bias)), dtype=np.float32)
+        return {'rpn_cls_prob': cls_prob.astype(np.float32), 'rpn_bbox_pred': bbox_pred}
+
+
+def random_network_rpn(net_name):
+    """Network.test_rpn of a randomly initialised network"""
+    import tensorflow as tf
+    from nets.factory import get_network
+
+    sess = tf.Session()
+    net = get_network(net_name)
+    net.create_architecture("TEST",
+                            num_classes=len(CLASSES),
+                            tag='default',
+                            anchor_width=cfg.CTPN.ANCHOR_WIDTH,
+                            anchor_h_ratio_step=cfg.CTPN.H_RADIO_STEP,
+                            num_anchors=cfg.CTPN.NUM_ANCHORS)
+    sess.run(tf.global_variables_initializer())
+    return lambda image: net.test_rpn(sess, image)
+
+
+class RecordedRpn(object):
+    """Records the batch size of every run, and runs delay seconds at least"""
+
+    def __init__(self, rpn_fn, delay=0.):
+        self.rpn_fn = rpn_fn
+        self.delay = delay
+        self.batch_sizes = []
+        self._lock = threading.Lock()
+
+    def __call__(self, image):
+        with self._lock:
+            self.batch_sizes.append(len(image))
+        time.sleep(self.delay)
+        return self.rpn_fn(image)
+
+
+def reference_detect(rpn_fn, im):
+    scores, boxes, resized_im_shape, im_scale = im_detect_rpn(rpn_fn, im)
+    text_lines = TextDetector(False).detect(boxes, scores[:, np.newaxis], resized_im_shape)
+    if len(text_lines) != 0:
+        text_lines = recover_scale(text_lines, im_scale)
+    return text_lines
+
+
+async def check_coalescing(rpn_fn, ims, args):
+    rpn = RecordedRpn(rpn_fn)
+    async with AsyncTextDetector(rpn, max_batch_size=args.max_batch_size, batch_timeout=args.batch_timeout) as detector:
+        results = await asyncio.gather(*[detector.detect(im) for im in ims])
+    same = all(np.allclose(result, reference_detect(rpn_fn, im)) for result, im in zip(results, ims))
+    print('coalescing: {:d} images in {:d} runs of sizes {}'.format(len(ims), len(rpn.batch_sizes), rpn.batch_sizes))
+    return same and len(rpn.batch_sizes) < len(ims) and max(rpn.batch_sizes) <= args.max_batch_size
+
+
+async def check_timeout(rpn_fn, ims, args):
+    rpn = RecordedRpn(rpn_fn, args.delay)
+    async with AsyncTextDetector(rpn, batch_timeout=args.batch_timeout) as detector:
+        try:
+            await detector.detect(ims[0], timeout=args.delay / 2)
+            timed_out = False
+        except asyncio.TimeoutError:
+            timed_out = True
+        # The detector still serves the next detections
+        text_lines = await detector.detect(ims[1])
+    print('timeout: timed out {}'.format(timed_out))
+    return timed_out and np.allclose(text_lines, reference_detect(rpn_fn, ims[1]))
+
+
+async def check_cancellation(rpn_fn, ims, args):
+    rpn = RecordedRpn(rpn_fn)
+    # The batch is collected long enough for both detections to wait in it
+    async with AsyncTextDetector(rpn, batch_timeout=args.delay) as detector:
+        cancelled = asyncio.ensure_future(detector.detect(ims[0]))
+        kept = asyncio.ensure_future(detector.detect(ims[1]))
+        await asyncio.sleep(args.delay / 2)
+        cancelled.cancel()
+        results = await asyncio.gather(cancelled, kept, return_exceptions=True)
+    print('cancellation: runs of sizes {}'.format(rpn.batch_sizes))
+    return isinstance(results[0], asyncio.CancelledError) and not isinstance(results[1], BaseException) and \
+        sum(rpn.batch_sizes) == 1
+
+
+async def check_close(rpn_fn, ims, args):
+    rpn = RecordedRpn(rpn_fn, args.delay)
+    detector = AsyncTextDetector(rpn, batch_timeout=args.batch_timeout)
+    in_flight = asyncio.ensure_future(detector.detect(ims[0]))
+    while len(rpn.batch_sizes) == 0:
+        await asyncio.sleep(0.001)
+    await detector.close()
+    try:
+        await asyncio.wait_for(in_flight, args.delay * 3)
+        result = 'returned'
+    except asyncio.CancelledError:
+        result = 'cancelled'
+    except asyncio.TimeoutError:
+        result = 'hung'
+    print('close: the detection in flight {:s}'.format(result))
+    return result == 'cancelled'
+
+
+def random_images(num_images, seed=0):
+    """Same size images but the last one, so the batches are split by blob shape too"""
+    rng = np.random.RandomState(seed)
+    ims = []
+    for i in range(num_images):
+        size = (480, 640) if i < num_images - 1 else (640, 480)
+        small = rng.randint(0, 256, (size[0] // 32, size[1] // 32, 3)).astype(np.uint8)
+        ims.append(np.kron(small, np.ones((32, 32, 1), dtype=np.uint8)))
+    return ims
+
+
+async def main(args):
+    rpn_fn = random_network_rpn(args.net) if args.net is not None else RandomRpn(cfg.CTPN.NUM_ANCHORS)
+    ims = random_images(args.num_images)
+
+    ok = True
+    for check in [check_coalescing, check_timeout, check_cancellation, check_close]:
+        passed = await check(rpn_fn, ims, args)
+        ok = ok and passed
+        print('{:s} {:s}'.format(check.__name__, 'OK' if passed else 'FAILED'))
+    return ok
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Check the batching, timeouts and cancellation of AsyncTextDetector')
+    parser.add_argument('--net', dest='net', choices=['vgg16', 'res50', 'res101', 'res152', 'mobile', 'squeeze'],
+                        default=None, help='randomly initialised network, a numpy stand-in when not given')
+    parser.add_argument('--num_images', type=int, default=6)
+    parser.add_argument('--max_batch_size', type=int, default=4)
+    parser.add_argument('--batch_timeout', type=float, default=0.02, help='in seconds')
+    parser.add_argument('--delay', type=float, default=0.5,
+                        help='time of a network run in the timeout and close checks, in seconds')
+    parser.add_argument('--cfg', dest='cfg_file', help='optional config file', default=None, type=str)
+    parser.add_argument('--set', dest='set_cfgs', help='set config keys', default=None,
+                        nargs=argparse.REMAINDER)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    if args.cfg_file is not None:
+        cfg_from_file(args.cfg_file)
+    if args.set_cfgs is not None:
+        cfg_from_list(args.set_cfgs)
+    cfg.USE_GPU_NMS = False
+
+    ok = asyncio.run(main(args))
+    print('Async detector {:s}'.format('OK' if ok else 'FAILED'))
+    sys.exit(0 if ok else 1)
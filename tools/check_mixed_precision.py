@@ -0,0 +1,123 @@
+"""
+Train the same network twice from the same initialization and on the same
+minibatches, once in float32 and once with TRAIN.MIXED_PRECISION, and check
+that rpn_cross_entropy and rpn_loss_box converge comparably.
+
+The float16 rewrite only applies to GPU kernels, on CPU both runs are float32.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import _init_paths
+from model.train_val import SolverWrapper, get_training_roidb, filter_roidb, get_session_config
+from model.config import cfg, cfg_from_file, cfg_from_list
+from roi_data_layer.layer import RoIDataLayer
+from datasets.factory import get_imdb
+import argparse
+import tempfile
+import numpy as np
+import sys
+
+import tensorflow as tf
+from nets.factory import get_network
+
+
+def parse_args():
+    """
+    Parse input arguments
+    """
+    parser = argparse.ArgumentParser(description='Compare float32 and mixed precision training losses')
+    parser.add_argument('--cfg', dest='cfg_file',
+                        help='optional config file',
+                        default='./data/cfgs/vgg16.yml', type=str)
+    parser.add_argument('--pretrained_model',
+                        default=None,
+                        help='path to pretrained model, initialize with pretrained model weights',
+                        type=str)
+    parser.add_argument('--imdb', dest='imdb_name',
+                        help='dataset to train on',
+                        default='voc_2007_trainval', type=str)
+    parser.add_argument('--iters', dest='max_iters',
+                        help='number of iterations of each run',
+                        default=500, type=int)
+    parser.add_argument('--window', dest='window',
+                        help='number of last iterations the losses are averaged over',
+                        default=100, type=int)
+    parser.add_argument('--tolerance', dest='tolerance',
+                        help='maximal relative difference of the averaged losses',
+                        default=0.1, type=float)
+    parser.add_argument('--net', dest='net',
+                        help='vgg16, res50, res101, res152, mobile, squeeze',
+                        choices=['vgg16', 'res50', 'res101', 'res152', 'mobile', 'squeeze'],
+                        default='vgg16', type=str)
+    parser.add_argument('--set', dest='set_cfgs',
+                        help='set config keys', default=None,
+                        nargs=argparse.REMAINDER)
+
+    args = parser.parse_args()
+    return args
+
+
+def run(args, imdb, roidb, mixed_precision):
+    """
+    Train for args.max_iters iterations
+    :return: (max_iters, 2) array of rpn_cross_entropy, rpn_loss_box
+    """
+    cfg.TRAIN.MIXED_PRECISION = mixed_precision
+    # Same minibatches and anchor sampling for both runs
+    np.random.seed(cfg.RNG_SEED)
+
+    tf.reset_default_graph()
+    net = get_network(args.net)
+    losses = []
+    with tf.Session(config=get_session_config()) as sess:
+        output_dir = tempfile.mkdtemp()
+        sw = SolverWrapper(sess, net, imdb, roidb, roidb, output_dir, output_dir,
+                           pretrained_model=args.pretrained_model)
+        # One shard of the roidb per tower, as in SolverWrapper.train_model
+        num_towers = cfg.TRAIN.NUM_TOWERS
+        data_layers = [RoIDataLayer(roidb[i::num_towers], imdb.num_classes) for i in range(num_towers)]
+        _, train_op = sw.construct_graph(sess)
+        sw.initialize(sess)
+
+        for iter in range(1, args.max_iters + 1):
+            blobs = data_layers[0].forward()
+            extra_feed_dict = {}
+            for tower, data_layer in zip(sw.towers[1:], data_layers[1:]):
+                extra_feed_dict.update(tower.get_feed_dict(data_layer.forward()))
+            rpn_loss_cls, rpn_loss_box, _, _, _ = net.train_step(sess, blobs, train_op, extra_feed_dict)
+            losses.append((rpn_loss_cls, rpn_loss_box))
+            if iter % cfg.TRAIN.DISPLAY == 0:
+                print('%s %d/%d rpn_loss_cls: %.3f rpn_loss_box: %.3f' % (
+                    'mixed' if mixed_precision else 'fp32', iter, args.max_iters, rpn_loss_cls, rpn_loss_box))
+
+    return np.array(losses)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    if args.cfg_file is not None:
+        cfg_from_file(args.cfg_file)
+    if args.set_cfgs is not None:
+        cfg_from_list(args.set_cfgs)
+
+    imdb = get_imdb(args.imdb_name)
+    roidb = filter_roidb(get_training_roidb(imdb))
+
+    fp32_losses = run(args, imdb, roidb, mixed_precision=False)
+    mixed_losses = run(args, imdb, roidb, mixed_precision=True)
+
+    fp32_mean = fp32_losses[-args.window:].mean(axis=0)
+    mixed_mean = mixed_losses[-args.window:].mean(axis=0)
+    rel_diff = np.abs(mixed_mean - fp32_mean) / np.maximum(fp32_mean, 1e-6)
+
+    ok = True
+    for i, name in enumerate(['rpn_cross_entropy', 'rpn_loss_box']):
+        passed = rel_diff[i] <= args.tolerance
+        ok = ok and passed
+        print('{:s}: fp32 {:.4f} mixed {:.4f} relative difference {:.3f} {:s}'.format(
+            name, fp32_mean[i], mixed_mean[i], rel_diff[i], 'OK' if passed else 'FAILED'))
+
+    sys.exit(0 if ok else 1)
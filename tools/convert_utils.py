@@ -1,8 +1,16 @@
 import os
+import json
+import multiprocessing
 
 from xml.dom.minidom import Document
 import numpy as np
 
+import tools._init_paths
+from datasets.jsonl_annotations import read_annotations
+
+# One VOC XML file per image, or one datasets.jsonl_annotations file per image set
+ANNOTATION_FORMATS = ('voc', 'jsonl')
+
 
 def build_voc_dirs(outdir):
     mkdir = lambda dir: os.makedirs(dir) if not os.path.exists(dir) else None
@@ -77,3 +85,112 @@ def generate_xml(img_name, positions, img_size, database, cls='text'):
         objs.append(o)
 
     return doc, objs
+
+
+def tmp_path(path):
+    """A temporary file next to path, with the same extension so cv2.imwrite picks the same format"""
+    root, ext = os.path.splitext(path)
+    return '{}.{}.tmp{}'.format(root, os.getpid(), ext)
+
+
+def write_atomic(path, text):
+    """Write text to path through a temporary file, a reader never sees a partial file"""
+    tmp_file = tmp_path(path)
+    with open(tmp_file, 'w') as f:
+        f.write(text)
+    os.replace(tmp_file, path)
+
+
+def imwrite_atomic(path, img):
+    import cv2
+    tmp_file = tmp_path(path)
+    if not cv2.imwrite(tmp_file, img):
+        raise IOError('Could not write image %s' % path)
+    os.replace(tmp_file, path)
+
+
+def source_mtimes(src_files):
+    return [os.path.getmtime(f) for f in src_files]
+
+
+def load_manifest(manifest_file, params):
+    """
+    :return: {source name: entry} of the last conversion into the same directory, empty when it was
+        made with other params, so a change of scale converts everything again
+    """
+    if not os.path.exists(manifest_file):
+        return {}
+    with open(manifest_file, 'r') as f:
+        manifest = json.load(f)
+    if manifest.get('params') != params:
+        return {}
+    return manifest.get('sources', {})
+
+
+def save_manifest(manifest_file, params, sources):
+    write_atomic(manifest_file, json.dumps({'params': params, 'sources': sources}, indent=1, sort_keys=True))
+
+
+def is_up_to_date(entry, src_files, dst_files):
+    """
+    :param entry: the manifest entry of the source, None if it was never converted
+    :return: True if the sources did not change since the entry was written and the outputs still exist
+    """
+    if entry is None or entry['mtimes'] != source_mtimes(src_files):
+        return False
+    return all(os.path.exists(f) for f in dst_files)
+
+
+def map_parallel(convert_fn, tasks, num_workers=1):
+    """
+    Yields convert_fn(task) for each task, in the order of the tasks. They are computed by a pool of
+    num_workers processes in chunks if num_workers > 1. convert_fn must be a module level function or
+    a functools.partial of one so it can be sent to the workers.
+    """
+    if num_workers <= 1 or len(tasks) < 2:
+        for task in tasks:
+            yield convert_fn(task)
+        return
+
+    pool = multiprocessing.Pool(num_workers)
+    try:
+        chunksize = max(1, len(tasks) // (num_workers * 4))
+        for result in pool.imap(convert_fn, tasks, chunksize):
+            yield result
+    finally:
+        pool.close()
+        pool.join()
+
+
+def jsonl_annotations_file(dest_label_dir, setname):
+    return os.path.join(dest_label_dir, setname + '.jsonl')
+
+
+def load_jsonl_annotations(path):
+    """The records of a previous conversion, {} if there is none"""
+    return read_annotations(path) if os.path.exists(path) else {}
+
+
+def converted_records(names, entries, todo, results, records):
+    """
+    Yields the annotation record of every converted source, in the order of names, so they can be
+    streamed to the annotation file while the workers are running
+    :param entries: {name: manifest entry}, the 'stem' of the converted sources is set from results
+    :param todo: the names converted again, in the order of names
+    :param results: the (stem, record) of the todo names, in order
+    :param records: {stem: record} of the previous conversion, for the names up to date
+    """
+    results = iter(results)
+    todo = set(todo)
+    for name in names:
+        entry = entries[name]
+        record = None
+        if name in todo:
+            entry['stem'], record = next(results)
+        elif entry['stem'] is not None:
+            record = records.get(entry['stem'])
+        if entry['stem'] is not None:
+            yield record
+    # Run the results to their end, it closes the pool of map_parallel
+    for _ in results:
+        pass
@@ -20,7 +20,7 @@ import time
 
 import _init_paths
 from model.config import cfg
-from model.test import im_detect
+from model.test import im_detect, recover_scale
 from model.nms_wrapper import nms
 from text_connector import TextDetector
 
@@ -95,18 +95,6 @@ def save_result(img, img_name, text_lines, result_dir):
     cv2.imwrite(img_path, dst)
 
 
-def recover_scale(boxes, scale):
-    """
-    :param boxes: [(x1, y1, x2, y2)]
-    :param scale: image scale
-    :return:
-    """
-    tmp_boxes = []
-    for b in boxes:
-        tmp_boxes.append([int(x / scale) for x in b])
-    return np.asarray(tmp_boxes).astype(np.float32)
-
-
 def draw_rpn_boxes(img, img_name, boxes, scores, im_scale, nms, save_dir):
     """
     :param boxes: [(x1, y1, x2, y2)]
@@ -0,0 +1,176 @@
+"""
+Export a checkpoint to ONNX and validate the export end to end.
+
+The graph is frozen and optimized by freeze_graph.py, then converted by tf2onnx. The
+exported model computes RPN/rpn_cls_prob and RPN/rpn_bbox_pred of the image blob,
+model/numpy_runtime.py does the rest of the detection with numpy, so a deployment only
+needs numpy, cv2 and onnxruntime.
+
+The text lines detected on --image by the exported model and the numpy runtime are
+compared to the ones of im_detect + TextDetector.detect with the checkpoint.
+
+The 'fused' BiLSTM has no ONNX equivalent, the 'dynamic' one is always exported, its
+variables are the same. There is no TFLite export: the TFLite converter of TensorFlow 1.x
+does not convert the while loop of the BiLSTM, the one of TensorFlow 2.x only with the
+TensorArray ops of the loop left to the Flex delegate.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import _init_paths
+from model.config import cfg, cfg_from_file, cfg_from_list
+from model.test import im_detect, recover_scale, _get_blobs
+from model import numpy_runtime
+from text_connector import TextDetector
+from utils import helper
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+import tensorflow as tf
+from tensorflow.tools.graph_transforms import TransformGraph
+from nets.factory import get_network
+from freeze_graph import CLASSES, INPUT_NAME, TRANSFORMS, freeze
+
+# tf2onnx only rewrites the while loop of the BiLSTM into an ONNX Loop with its Identity nodes
+ONNX_TRANSFORMS = [transform for transform in TRANSFORMS if not transform.startswith('remove_nodes')]
+
+
+def to_onnx(graph_def, output_names, output_file, opset):
+    try:
+        import tf2onnx
+    except ImportError:
+        raise ImportError('The ONNX export needs tf2onnx: pip install tf2onnx')
+    tf2onnx.convert.from_graph_def(graph_def,
+                                   input_names=[INPUT_NAME + ':0'],
+                                   output_names=[name + ':0' for name in output_names],
+                                   opset=opset,
+                                   output_path=output_file)
+
+
+def reference_detect(net_name, ckpt_file, im, oriented):
+    """
+    :return: the RPN predictions of the image blob and the text lines of im_detect + TextDetector.detect,
+        and the time to the first detection
+    """
+    start = time.time()
+    with tf.Graph().as_default(), tf.Session() as sess:
+        net = get_network(net_name)
+        net.create_architecture("TEST",
+                                num_classes=len(CLASSES),
+                                tag='default',
+                                anchor_width=cfg.CTPN.ANCHOR_WIDTH,
+                                anchor_h_ratio_step=cfg.CTPN.H_RADIO_STEP,
+                                num_anchors=cfg.CTPN.NUM_ANCHORS)
+        saver = tf.train.Saver()
+        saver.restore(sess, ckpt_file)
+
+        scores, boxes, resized_im_shape, im_scale = im_detect(sess, net, im)
+        text_lines = TextDetector(oriented).detect(boxes, scores[:, np.newaxis], resized_im_shape)
+        if len(text_lines) != 0:
+            text_lines = recover_scale(text_lines, im_scale)
+        startup = time.time() - start
+
+        blobs, _ = _get_blobs(im)
+        outputs = sess.run({'rpn_cls_prob': net._predictions['rpn_cls_prob'],
+                            'rpn_bbox_pred': net._predictions['rpn_bbox_pred']},
+                           feed_dict={net._image: blobs['data']})
+    return outputs, text_lines, startup
+
+
+def exported_detect(model_file, im, oriented):
+    """Same as reference_detect with the exported model and the numpy runtime"""
+    start = time.time()
+    detector = numpy_runtime.ExportedTextDetector(model_file, oriented)
+    text_lines = detector.detect(im)
+    startup = time.time() - start
+
+    blobs, _ = _get_blobs(im)
+    return detector.model(blobs['data']), text_lines, startup
+
+
+def validate(args, model_file, ckpt_file):
+    im = helper.read_rgb_img(args.image)
+    ref_outputs, ref_lines, ref_startup = reference_detect(args.net, ckpt_file, im, args.oriented)
+    outputs, lines, startup = exported_detect(model_file, im, args.oriented)
+
+    ok = True
+    for key, ref_output in sorted(ref_outputs.items()):
+        print('%s: max diff %.2e' % (key, np.max(np.abs(ref_output - outputs[key]))))
+
+    print('Text lines: %d checkpoint, %d exported' % (len(ref_lines), len(lines)))
+    if len(ref_lines) != len(lines):
+        ok = False
+    elif len(lines) != 0:
+        diff = np.max(np.abs(ref_lines[:, :8] - lines[:, :8]))
+        print('Text lines: max diff %.2f px' % diff)
+        ok = diff <= args.tolerance
+
+    print('Time to the first detection: %.2fs checkpoint, %.2fs exported' % (ref_startup, startup))
+    return ok
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Export a checkpoint to ONNX')
+    parser.add_argument('--net', dest='net', choices=['vgg16', 'res101', 'squeeze', 'mobile'], default='vgg16')
+    parser.add_argument('--ckpt_dir', type=str, default='./output/vgg16/voc_2007_trainval/default',
+                        help='Directory containing the checkpoint (ckpt) file containing model parameters')
+    parser.add_argument('--output_file', type=str, default=None,
+                        help='Filename of the exported model, ./model/ctpn.onnx by default')
+    parser.add_argument('--opset', type=int, default=11, help='ONNX opset')
+    parser.add_argument('--image', type=str, default='./data/demo/007.jpg',
+                        help='image of the validation of the export')
+    parser.add_argument('-o', '--oriented', action='store_true', default=False, help='output rotated detect box')
+    parser.add_argument('--tolerance', type=float, default=1.0,
+                        help='maximal difference of the text lines coordinates, in pixels')
+    parser.add_argument('--no_validate', action='store_true', help='only export the model')
+    parser.add_argument('--cfg', dest='cfg_file', help='optional config file', default=None, type=str)
+    parser.add_argument('--set', dest='set_cfgs', help='set config keys', default=None,
+                        nargs=argparse.REMAINDER)
+    return parser.parse_args()
+
+
+def main(args):
+    ckpt = tf.train.get_checkpoint_state(args.ckpt_dir)
+    if ckpt is None or not ckpt.model_checkpoint_path:
+        raise IOError('No checkpoint found in {:s}'.format(args.ckpt_dir))
+    print('Checkpoint file: %s' % ckpt.model_checkpoint_path)
+
+    if cfg.CTPN.LSTM != 'dynamic':
+        print('Export the dynamic BiLSTM instead of the %s one' % cfg.CTPN.LSTM)
+        cfg.CTPN.LSTM = 'dynamic'
+    # Same NMS for the checkpoint and the exported model
+    cfg.USE_GPU_NMS = False
+
+    frozen_def, output_names = freeze(args.net, ckpt.model_checkpoint_path, 'RPN',
+                                      ['rpn_cls_prob', 'rpn_bbox_pred'])
+    graph_def = TransformGraph(frozen_def, [INPUT_NAME], output_names, ONNX_TRANSFORMS)
+
+    to_onnx(graph_def, output_names, args.output_file, args.opset)
+    print('Exported %s, size: %.1f mb' % (args.output_file, os.path.getsize(args.output_file) / 1024. / 1024.))
+
+    if args.no_validate:
+        return True
+    return validate(args, args.output_file, ckpt.model_checkpoint_path)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    if args.cfg_file is not None:
+        cfg_from_file(args.cfg_file)
+    if args.set_cfgs is not None:
+        cfg_from_list(args.set_cfgs)
+
+    if args.output_file is None:
+        args.output_file = './model/ctpn.onnx'
+    output_dir = os.path.dirname(args.output_file)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    ok = main(args)
+    print('Export {:s}'.format('OK' if ok else 'FAILED'))
+    sys.exit(0 if ok else 1)
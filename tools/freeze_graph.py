@@ -1,85 +1,155 @@
 """
-bazel-bin/tensorflow/tools/graph_transforms/transform_graph \
-        --in_graph=/home/cwq/code/tf_ctpn/model/ctpn.pb \
-        --out_graph=/home/cwq/code/tf_ctpn/model/ctpn_optimized.pb \
-        --inputs='input' \
-        --outputs='vgg_16_1/rpn_bbox_pred/Conv2D,vgg_16_1/rpn_cls_score_reshape' \
-        --transforms='
-        strip_unused_nodes(name=inputs, type_for_name=float, shape_for_name="1,-1,-1,3")
-        remove_nodes(op=Identity, op=CheckNumerics)
-        fold_constants(ignore_errors=true)
-        fold_batch_norms
-        fold_old_batch_norms'
+Export a checkpoint to a frozen and optimized graph for inference.
+
+The TEST graph of the network is rebuilt from the code and restored from the checkpoint
+by variable name, so the exported graph has no training, summary or proposal ops whatever
+graph the checkpoint was saved with. The outputs are Identity nodes named
+<output_scope>/<prediction>, e.g. RPN/rpn_cls_prob and RPN/rpn_bbox_pred, and the input
+is the 'input' placeholder of Network.create_architecture.
+
+The frozen graph is then rewritten by the graph transforms of TRANSFORMS: unused and
+identity nodes are stripped, constants folded, and the batch norms of SqueezeNet and
+MobileNetV2 folded into the weights of their convolutions. Conv2D + BiasAdd + Relu are
+fused by the Grappler remapper when the graph is loaded, a graph with _FusedConv2D ops
+would only load on the TensorFlow version and device it was exported with.
 """
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
 
-import tensorflow as tf
+import _init_paths
+from model.config import cfg, cfg_from_file, cfg_from_list
 import argparse
+import collections
 import os
-import sys
-
+import time
+import numpy as np
 
-def main(args):
-    with tf.Graph().as_default():
+import tensorflow as tf
+from tensorflow.tools.graph_transforms import TransformGraph
+from nets.factory import get_network
+
+CLASSES = ('__background__', 'text')
+INPUT_NAME = 'input'
+
+TRANSFORMS = ['strip_unused_nodes(type=float, shape="1,-1,-1,3")',
+              'remove_nodes(op=Identity, op=CheckNumerics)',
+              'fold_constants(ignore_errors=true)',
+              'fold_batch_norms',
+              'fold_old_batch_norms',
+              'strip_unused_nodes(type=float, shape="1,-1,-1,3")',
+              'sort_by_execution_order']
+
+
+def freeze(net_name, ckpt_file, output_scope, outputs):
+    """
+    :param outputs: keys of the predictions of the network to export
+    :return: the frozen GraphDef and the names of its output nodes
+    """
+    with tf.Graph().as_default() as graph, tf.Session() as sess:
+        net = get_network(net_name)
+        net.create_architecture("TEST",
+                                num_classes=len(CLASSES),
+                                tag='default',
+                                anchor_width=cfg.CTPN.ANCHOR_WIDTH,
+                                anchor_h_ratio_step=cfg.CTPN.H_RADIO_STEP,
+                                num_anchors=cfg.CTPN.NUM_ANCHORS)
+        with tf.name_scope(output_scope):
+            output_nodes = [tf.identity(net._predictions[key], name=key) for key in outputs]
+        output_names = [node.op.name for node in output_nodes]
+
+        saver = tf.train.Saver()
+        saver.restore(sess, ckpt_file)
+
+        graph_def = tf.graph_util.convert_variables_to_constants(sess, graph.as_graph_def(), output_names)
+    return graph_def, output_names
+
+
+def op_counts(graph_def):
+    return collections.Counter(node.op for node in graph_def.node)
+
+
+def latency(graph_def, output_names, im_shape, runs):
+    """Median time of a forward pass on a random image of shape im_shape, in seconds"""
+    im = np.random.rand(1, im_shape[0], im_shape[1], 3).astype(np.float32) * 255
+    with tf.Graph().as_default() as graph:
+        tf.import_graph_def(graph_def, name='')
+        fetches = [graph.get_tensor_by_name(name + ':0') for name in output_names]
         with tf.Session() as sess:
-            # Load the model metagraph and checkpoint
-            print('Model directory: %s' % args.ckpt_dir)
-            meta_file, ckpt_file = get_model_filenames(args.ckpt_dir)
-
-            print('Metagraph file: %s' % meta_file)
-            print('Checkpoint file: %s' % ckpt_file)
-
-            saver = tf.train.import_meta_graph(meta_file, clear_devices=True)
-            tf.get_default_session().run(tf.global_variables_initializer())
-            tf.get_default_session().run(tf.local_variables_initializer())
-            saver.restore(sess, ckpt_file)
-
-            input_graph_def = tf.get_default_graph().as_graph_def()
-
-            for node in input_graph_def.node:
-                if node.name == "vgg_16_1/rpn_bbox_pred/Conv2D":
-                    node.name = "RPN/rpn_bbox_pred/Conv2D"
-
-                if node.name == "vgg_16_1/rpn_cls_score_reshape":
-                    node.name = "RPN/rpn_cls_score_reshape"
-
-            output_node_names = ['RPN/rpn_bbox_pred/Conv2D', 'RPN/rpn_cls_prob_reshape']
-
-            # We use a built-in TF helper to export variables to constants
-            output_graph_def = tf.graph_util.convert_variables_to_constants(
-                sess,  # The session is used to retrieve the weights
-                input_graph_def,  # The graph_def is used to retrieve the nodes
-                output_node_names  # The output node names are used to select the usefull nodes
-            )
-
-            # Serialize and dump the output graph to the filesystem
-            with tf.gfile.GFile(args.output_file, 'wb') as f:
-                f.write(output_graph_def.SerializeToString())
-                pb_file_size = f.size() / 1024. / 1024.
-            print("%d ops in the final graph: %s, size: %d mb" %
-                  (len(output_graph_def.node), args.output_file, pb_file_size))
+            feed_dict = {graph.get_tensor_by_name(INPUT_NAME + ':0'): im}
+            # Warm up
+            sess.run(fetches, feed_dict=feed_dict)
+            times = []
+            for _ in range(runs):
+                start = time.time()
+                sess.run(fetches, feed_dict=feed_dict)
+                times.append(time.time() - start)
+    return np.median(times)
+
+
+def write_graph(graph_def, output_file):
+    with tf.gfile.GFile(output_file, 'wb') as f:
+        f.write(graph_def.SerializeToString())
+        return f.size() / 1024. / 1024.
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Export a checkpoint to an optimized frozen graph')
+    parser.add_argument('--net', dest='net', choices=['vgg16', 'res101', 'squeeze', 'mobile'], default='vgg16')
+    parser.add_argument('--ckpt_dir', type=str, default='./output/vgg16/voc_2007_trainval/default',
+                        help='Directory containing the checkpoint (ckpt) file containing model parameters')
+    parser.add_argument('--output_file', type=str, default='./model/ctpn.pb',
+                        help='Filename for the exported graphdef protobuf (.pb)')
+    parser.add_argument('--output_scope', type=str, default='RPN',
+                        help='name scope of the output nodes')
+    parser.add_argument('--outputs', nargs='+', default=['rpn_cls_prob', 'rpn_bbox_pred'],
+                        help='predictions of the network exported as <output_scope>/<prediction>')
+    parser.add_argument('--no_optimize', action='store_true', help='only freeze the variables')
+    parser.add_argument('--benchmark_shape', nargs=2, type=int, default=[600, 900],
+                        help='height and width of the image used to compare the latency, no comparison if 0')
+    parser.add_argument('--runs', type=int, default=10, help='number of timed forward passes')
+    parser.add_argument('--cfg', dest='cfg_file', help='optional config file', default=None, type=str)
+    parser.add_argument('--set', dest='set_cfgs', help='set config keys', default=None,
+                        nargs=argparse.REMAINDER)
+    return parser.parse_args()
 
 
-def get_model_filenames(model_dir):
-    ckpt = tf.train.get_checkpoint_state(model_dir)
-    if ckpt and ckpt.model_checkpoint_path:
-        ckpt_file_basename = os.path.basename(ckpt.model_checkpoint_path)
-        meta_file = os.path.join(model_dir, ckpt_file_basename + '.meta')
-        return meta_file, ckpt.model_checkpoint_path
+def main(args):
+    ckpt = tf.train.get_checkpoint_state(args.ckpt_dir)
+    if ckpt is None or not ckpt.model_checkpoint_path:
+        raise IOError('No checkpoint found in {:s}'.format(args.ckpt_dir))
+    print('Checkpoint file: %s' % ckpt.model_checkpoint_path)
+
+    frozen_def, output_names = freeze(args.net, ckpt.model_checkpoint_path, args.output_scope, args.outputs)
+    graph_defs = [('frozen', frozen_def)]
+    if not args.no_optimize:
+        graph_defs.append(('optimized', TransformGraph(frozen_def, [INPUT_NAME], output_names, TRANSFORMS)))
+
+    for name, graph_def in graph_defs:
+        counts = op_counts(graph_def)
+        print('%s: %d ops (%s)' % (name, len(graph_def.node),
+                                   ', '.join('%s %d' % c for c in counts.most_common(8))))
+        if min(args.benchmark_shape) > 0:
+            print('%s: %.1f ms per %dx%d image' % (name, latency(graph_def, output_names, args.benchmark_shape,
+                                                                 args.runs) * 1000,
+                                                  args.benchmark_shape[0], args.benchmark_shape[1]))
+
+    _, graph_def = graph_defs[-1]
+    pb_file_size = write_graph(graph_def, args.output_file)
+    print("%d ops in the final graph: %s, size: %d mb" % (len(graph_def.node), args.output_file, pb_file_size))
+    print('Input: %s, outputs: %s' % (INPUT_NAME, ', '.join(output_names)))
 
 
 if __name__ == '__main__':
-    parser = argparse.ArgumentParser()
-
-    parser.add_argument('--ckpt_dir', type=str, default='./checkpoint/crnn',
-                        help='Directory containing the metagraph (.meta) file and the checkpoint (ckpt) file containing model parameters')
-
-    parser.add_argument('--output_file', type=str, default='./model/ctpn.pb',
-                        help='Filename for the exported graphdef protobuf (.pb)')
+    args = parse_args()
 
-    args, _ = parser.parse_known_args()
+    if args.cfg_file is not None:
+        cfg_from_file(args.cfg_file)
+    if args.set_cfgs is not None:
+        cfg_from_list(args.set_cfgs)
 
     output_dir = os.path.dirname(args.output_file)
-    if not os.path.exists(output_dir):
+    if output_dir and not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
     main(args)
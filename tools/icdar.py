@@ -10,7 +10,8 @@ from zipfile import ZipFile
 
 import _init_paths
 from model.config import cfg
-from model.test import im_detect
+from model.test import im_detect, recover_scale
+from model.rpn_cache import RpnCache, im_detect_cached
 from model.nms_wrapper import nms
 from text_connector import TextDetector
 
@@ -27,13 +28,12 @@ from nets.resnet_v1 import Resnetv1
 from nets.mobilenet_v2 import MobileNetV2
 
 from utils import helper
-
-from demo import recover_scale
+from datasets.icdar_eval import CHALLENGES, IcdarEvaluator, text_lines_to_points
 
 CLASSES = ('__background__', 'text')
 
 
-def demo(sess, net, im_file, icdar_dir, oriented=False, ltrb=False):
+def demo(sess, net, im_file, icdar_dir, oriented=False, ltrb=False, rpn_cache=None):
     """Detect object classes in an image using pre-computed object proposals."""
 
     # Load the demo image
@@ -42,7 +42,11 @@ def demo(sess, net, im_file, icdar_dir, oriented=False, ltrb=False):
     # Detect all object classes and regress object bounds
     timer = Timer()
     timer.tic()
-    scores, boxes, resized_im_shape, im_scale = im_detect(sess, net, im)
+    if rpn_cache is None:
+        scores, boxes, resized_im_shape, im_scale = im_detect(sess, net, im)
+    else:
+        scores, boxes, resized_im_shape, im_scale = im_detect_cached(rpn_cache, im,
+                                                                     lambda image: net.test_rpn(sess, image))
     timer.toc()
 
     # Run TextDetector to merge small box
@@ -55,12 +59,12 @@ def demo(sess, net, im_file, icdar_dir, oriented=False, ltrb=False):
     if len(text_lines) != 0:
         text_lines = recover_scale(text_lines, im_scale)
 
-    return save_result_txt(text_lines, icdar_dir, im_file, ltrb)
+    res_file = save_result_txt(text_lines, icdar_dir, im_file, ltrb)
+    return res_file, text_lines_to_points(text_lines, ltrb)
 
 
 def save_result_txt(text_lines, icdar_dir, im_file, ltrb=False):
-    # ICDAR need box points in clockwise
-    boxes = [[l[0], l[1], l[2], l[3], l[6], l[7], l[4], l[5]] for l in text_lines]
+    points = text_lines_to_points(text_lines, ltrb)
 
     im_name = im_file.split('/')[-1].split('.')[0]
     res_file = os.path.join(icdar_dir, 'res_%s.txt' % im_name)
@@ -68,17 +72,8 @@ def save_result_txt(text_lines, icdar_dir, im_file, ltrb=False):
         os.makedirs(icdar_dir)
 
     with open(res_file, mode='w') as f:
-        for line in boxes:
-            if ltrb:
-                min_x = min([line[0], line[2], line[4], line[6]])
-                min_y = min([line[1], line[3], line[5], line[7]])
-                max_x = max([line[0], line[2], line[4], line[6]])
-                max_y = max([line[1], line[3], line[5], line[7]])
-
-                f.write('%d,%d,%d,%d\n' % (min_x, min_y, max_x, max_y))
-            else:
-                f.write('%d,%d,%d,%d,%d,%d,%d,%d\n' % (line[0], line[1], line[2], line[3],
-                                                       line[4], line[5], line[6], line[7]))
+        for line in points:
+            f.write(','.join(['%d' % v for v in line]) + '\n')
     return res_file
 
 
@@ -96,8 +91,18 @@ def parse_args():
                             'ICDAR15',  # ICDAR15 - Challenge 4 - Incidental Scene Text
                             'MLT17'  # Multi-lingual scene text detection
                         ])
+    parser.add_argument('--gt', default=None,
+                        help='ground truth ZIP file of the challenge, evaluate the detections when given. '
+                             'ICDAR13 and ICDAR15 only')
+    parser.add_argument('--cache_dir', default=None,
+                        help='cache of the RPN predictions, the images already cached are not run by the network. '
+                             'Single scale only, not with TEST.GATE or TEST.CROP')
     args = parser.parse_args()
 
+    if args.gt is not None and args.challenge not in CHALLENGES:
+        parser.error('--gt: no evaluation script for the challenge {}, expected one of {}'.format(
+            args.challenge, CHALLENGES))
+
     if not os.path.exists(args.img_dir):
         print("img dir not exists.")
         exit(-1)
@@ -154,13 +159,31 @@ if __name__ == '__main__':
     if args.challenge in ['ICDAR13', 'ICDAR13_Det']:
         ltrb = True
 
+    evaluator = None
+    detections = {}
+    if args.gt is not None:
+        evaluator = IcdarEvaluator(args.challenge, args.gt)
+
+    rpn_cache = None
+    if args.cache_dir is not None:
+        rpn_cache = RpnCache(args.cache_dir, ckpt.model_checkpoint_path)
+
     im_files = glob.glob(args.img_dir + "/*.*")
     for im_file in im_files:
-        txt_file = demo(sess, net, im_file, icdar_dir, oriented=args.oriented, ltrb=ltrb)
+        txt_file, points = demo(sess, net, im_file, icdar_dir, oriented=args.oriented, ltrb=ltrb,
+                                rpn_cache=rpn_cache)
         txt_files.append(txt_file)
+        if evaluator is not None:
+            sample_id = evaluator.sample_id(im_file)
+            if sample_id is not None:
+                detections[sample_id] = points
 
     zip_path = os.path.join('./data/ICDAR_submit', '%s_%s_submit.zip' % (args.challenge, args.tag))
     print(os.path.abspath(zip_path))
     with ZipFile(zip_path, 'w') as f:
         for txt in txt_files:
             f.write(txt, txt.split('/')[-1])
+
+    if evaluator is not None:
+        results = evaluator.evaluate(detections)
+        print('{:s}: {}'.format(args.challenge, results['method']))
@@ -1,8 +1,10 @@
 import os
 import numpy as np
-import math
 import cv2 as cv
 
+import _init_paths
+from utils.text_line_split import split_ltrb, clip_slices
+
 # path = '/media/D/code/OCR/text-detection-ctpn/data/mlt_english+chinese/image'
 # gt_path = '/media/D/code/OCR/text-detection-ctpn/data/mlt_english+chinese/label'
 
@@ -38,82 +40,55 @@ for file in files:
 
     with open(gt_file, 'r') as f:
         lines = f.readlines()
-    for line in lines:
-        splitted_line = line.strip().lower().split(' ')
-        splitted_line = [int(n) for n in splitted_line[:-1]]
-
-        xmin = int(splitted_line[0] * im_scale)
-        ymin = int(splitted_line[1] * im_scale)
-        xmax = int(splitted_line[2] * im_scale)
-        ymax = int(splitted_line[3] * im_scale)
-
-        if xmin < 0:
-            xmin = 0
-        if xmax > re_size[1] - 1:
-            xmax = re_size[1] - 1
-        if ymin < 0:
-            ymin = 0
-        if ymax > re_size[0] - 1:
-            ymax = re_size[0] - 1
-
-        width = xmax - xmin
-        height = ymax - ymin
+    if len(lines) == 0:
+        continue
 
-        # 将完整的文字区域切分为宽度为 16 的小区域
-        step = 16.0
-        xmins = []
+    boxes = np.array([[int(n) for n in line.strip().lower().split(' ')[:4]] for line in lines])
+    boxes = np.trunc(boxes * im_scale).astype(np.int64)
+    boxes = clip_slices(boxes, re_size)
 
-        anchor_count = int(math.ceil(width / step))
-        for i in range(anchor_count):
-            xmins.append(i * int(step) + xmin)
+    # 将完整的文字区域切分为宽度为 16 的小区域, anchor box 的宽度为 16
+    step = 16
+    slices, _ = split_ltrb(boxes, step)
 
-        if not os.path.exists(label_out_path):
-            os.makedirs(label_out_path)
+    if not os.path.exists(label_out_path):
+        os.makedirs(label_out_path)
 
-        with open(os.path.join(label_out_path, "gt_" + stem) + '.txt', 'a') as f:
-            for i in range(len(xmins)):
-                f.writelines(str(xmins[i]))
-                f.writelines(" ")
-                f.writelines(str(int(ymin)))
-                f.writelines(" ")
-                # anchor box 的宽度为 16,
-                f.writelines(str(int(xmins[i] + step - 1)))
-                f.writelines(" ")
-                f.writelines(str(int(ymax)))
-                f.writelines("\n")
+    with open(os.path.join(label_out_path, "gt_" + stem) + '.txt', 'w') as f:
+        f.writelines('%d %d %d %d\n' % tuple(s) for s in slices)
 
-        # reimplement
-        # step = 16.0
-        # x_left = []
-        # x_right = []
-        # x_left.append(xmin)
-        # x_left_start = int(math.ceil(xmin / 16.0) * 16.0)
-        # if x_left_start == xmin:
-        #     x_left_start = xmin + 16
-        # for i in np.arange(x_left_start, xmax, 16):
-        #     x_left.append(i)
-        # x_left = np.array(x_left)
-        #
-        # x_right.append(x_left_start - 1)
-        # for i in range(1, len(x_left) - 1):
-        #     x_right.append(x_left[i] + 15)
-        # x_right.append(xmax)
-        # x_right = np.array(x_right)
-        #
-        # idx = np.where(x_left == x_right)
-        # x_left = np.delete(x_left, idx, axis=0)
-        # x_right = np.delete(x_right, idx, axis=0)
-        #
-        # if not os.path.exists(label_out_path):
-        #     os.makedirs(label_out_path)
-        #
-        # with open(os.path.join(label_out_path, "gt_" + stem) + '.txt', 'a') as f:
-        #     for i in range(len(x_left)):
-        #         f.writelines(str(int(x_left[i])))
-        #         f.writelines(" ")
-        #         f.writelines(str(int(ymin)))
-        #         f.writelines(" ")
-        #         f.writelines(str(int(x_right[i])))
-        #         f.writelines(" ")
-        #         f.writelines(str(int(ymax)))
-        #         f.writelines("\n")
+    # reimplement
+    # step = 16.0
+    # x_left = []
+    # x_right = []
+    # x_left.append(xmin)
+    # x_left_start = int(math.ceil(xmin / 16.0) * 16.0)
+    # if x_left_start == xmin:
+    #     x_left_start = xmin + 16
+    # for i in np.arange(x_left_start, xmax, 16):
+    #     x_left.append(i)
+    # x_left = np.array(x_left)
+    #
+    # x_right.append(x_left_start - 1)
+    # for i in range(1, len(x_left) - 1):
+    #     x_right.append(x_left[i] + 15)
+    # x_right.append(xmax)
+    # x_right = np.array(x_right)
+    #
+    # idx = np.where(x_left == x_right)
+    # x_left = np.delete(x_left, idx, axis=0)
+    # x_right = np.delete(x_right, idx, axis=0)
+    #
+    # if not os.path.exists(label_out_path):
+    #     os.makedirs(label_out_path)
+    #
+    # with open(os.path.join(label_out_path, "gt_" + stem) + '.txt', 'a') as f:
+    #     for i in range(len(x_left)):
+    #         f.writelines(str(int(x_left[i])))
+    #         f.writelines(" ")
+    #         f.writelines(str(int(ymin)))
+    #         f.writelines(" ")
+    #         f.writelines(str(int(x_right[i])))
+    #         f.writelines(" ")
+    #         f.writelines(str(int(ymax)))
+    #         f.writelines("\n")
@@ -3,9 +3,15 @@ import cv2
 import os
 import glob
 import shutil
+import argparse
+import functools
+import multiprocessing
 import numpy as np
 
-from tools.convert_utils import build_voc_dirs
+from tools.convert_utils import build_voc_dirs, write_atomic, imwrite_atomic, \
+    load_manifest, save_manifest, is_up_to_date, source_mtimes, map_parallel, \
+    ANNOTATION_FORMATS, jsonl_annotations_file, load_jsonl_annotations, converted_records
+from datasets.jsonl_annotations import annotation_record, JsonlAnnotationWriter
 
 
 def generate_xml(img_name, lines, img_size, class_sets):
@@ -84,44 +90,107 @@ def _is_hard(cls, truncation, occlusion, x1, y1, x2, y2):
     return hard
 
 
-if __name__ == '__main__':
-    outdir = '/home/cwq/data/ICDAR13/icdar13_voc'
+def _img_file(label_file, imagedir):
+    path, basename = os.path.split(label_file)
+    stem, ext = os.path.splitext(basename)
+    img_id = stem.split('_')[1]
+    return os.path.join(imagedir, img_id + '.jpg'), "icdar13_" + img_id
+
+
+def convert_label_file(file, imagedir, dest_img_dir, dest_label_dir, class_sets, annotation_format='voc'):
+    """
+    Convert one gt file and its image, runs in the workers of main
+    :return: (out stem, the annotation record in the jsonl format, else None)
+    """
+    img_file, stem = _img_file(file, imagedir)
+    with open(file, 'r') as f:
+        lines = f.readlines()
+
+    print(img_file)
+    img = cv2.imread(img_file)
+    img_size = img.shape
+
+    save_img_name = stem + '.jpg'
+    imwrite_atomic(os.path.join(dest_img_dir, save_img_name), img)
+    if annotation_format == 'jsonl':
+        boxes = [[int(float(v)) for v in line.strip().split()[:4]] for line in lines]
+        return stem, annotation_record(stem, save_img_name, img_size, boxes, 'coco_text_database')
+
+    doc, objs = generate_xml(save_img_name, lines, img_size, class_sets=class_sets)
+    xmlfile = os.path.join(dest_label_dir, stem + '.xml')
+    write_atomic(xmlfile, doc.toprettyxml(indent='	'))
+    return stem, None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Convert ICDAR13 splited gt to VOC format')
+    parser.add_argument('--out_dir', default='/home/cwq/data/ICDAR13/icdar13_voc')
+    parser.add_argument('--label_dir', default='/home/cwq/data/ICDAR13/Challenge2_Training_Task1_GT_splited')
+    parser.add_argument('--image_dir', default='/home/cwq/data/ICDAR13/Challenge2_Training_Task12_Images_splited')
+    parser.add_argument('--num_workers', type=int, default=multiprocessing.cpu_count(),
+                        help='number of conversion processes, 1 converts in this process')
+    parser.add_argument('--force', action='store_true', help='convert the files that are up to date too')
+    parser.add_argument('--format', dest='annotation_format', choices=ANNOTATION_FORMATS, default='voc',
+                        help='one XML file per image, or all the annotations in Annotations/<set>.jsonl')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    outdir = args.out_dir
     dest_label_dir, dest_img_dir, dest_set_dir = build_voc_dirs(outdir)
 
     for dset in ['train']:
-        _labeldir = '/home/cwq/data/ICDAR13/Challenge2_Training_Task1_GT_splited'
-        _imagedir = '/home/cwq/data/ICDAR13/Challenge2_Training_Task12_Images_splited'
+        _labeldir = args.label_dir
+        _imagedir = args.image_dir
         class_sets = ('text', 'dontcare')
-        class_sets_dict = dict((k, i) for i, k in enumerate(class_sets))
-        fs = [open(os.path.join(dest_set_dir, cls + '_' + dset + '.txt'), 'w') for cls in class_sets]
-        ftrain = open(os.path.join(dest_set_dir, dset + '.txt'), 'w')
+        for cls in class_sets:
+            write_atomic(os.path.join(dest_set_dir, cls + '_' + dset + '.txt'), '')
+
+        params = {'class_sets': list(class_sets), 'format': args.annotation_format}
+        manifest_file = os.path.join(outdir, dset + '_manifest.json')
+        manifest = {} if args.force else load_manifest(manifest_file, params)
+        jsonl_file = jsonl_annotations_file(dest_label_dir, dset)
+        # The records of the files up to date are copied from the previous file
+        records = load_jsonl_annotations(jsonl_file) if args.annotation_format == 'jsonl' else {}
 
         files = glob.glob(os.path.join(_labeldir, '*.txt'))
         files.sort()
+        entries = {}
+        todo = []
         for file in files:
-            path, basename = os.path.split(file)
-            stem, ext = os.path.splitext(basename)
-            img_id = stem.split('_')[1]
-            img_name = img_id + '.jpg'
-            stem = "icdar13_" + img_id
-            with open(file, 'r') as f:
-                lines = f.readlines()
-            img_file = os.path.join(_imagedir, img_name)
-
-            print(img_file)
-            img = cv2.imread(img_file)
-            img_size = img.shape
-
-            save_img_name = "icdar13_" + img_name
-            doc, objs = generate_xml(save_img_name, lines, img_size, class_sets=class_sets)
+            img_file, stem = _img_file(file, _imagedir)
+            src_files = [file, img_file]
+            dst_files = [os.path.join(dest_img_dir, stem + '.jpg')]
+            entry = manifest.get(file)
+            if args.annotation_format == 'voc':
+                dst_files.append(os.path.join(dest_label_dir, stem + '.xml'))
+            elif stem not in records:
+                entry = None
+            if is_up_to_date(entry, src_files, dst_files):
+                entries[file] = entry
+            else:
+                # Read before converting, a source modified meanwhile is converted again next time
+                entries[file] = {'mtimes': source_mtimes(src_files), 'stem': stem}
+                todo.append(file)
+        print("Up to date file count: %d, to convert: %d" % (len(files) - len(todo), len(todo)))
+
+        convert_fn = functools.partial(convert_label_file, imagedir=_imagedir, dest_img_dir=dest_img_dir,
+                                       dest_label_dir=dest_label_dir, class_sets=class_sets,
+                                       annotation_format=args.annotation_format)
+        converted = converted_records(files, entries, todo, map_parallel(convert_fn, todo, args.num_workers),
+                                      records)
+        if args.annotation_format == 'jsonl':
+            with JsonlAnnotationWriter(jsonl_file) as writer:
+                for record in converted:
+                    writer.write(record)
+        else:
+            for _ in converted:
+                pass
+
+        write_atomic(os.path.join(dest_set_dir, dset + '.txt'), ''.join(entries[f]['stem'] + '\n' for f in files))
+        save_manifest(manifest_file, params, entries)
 
-            cv2.imwrite(os.path.join(dest_img_dir, save_img_name), img)
-            xmlfile = os.path.join(dest_label_dir, stem + '.xml')
 
-            with open(xmlfile, 'w') as f:
-                f.write(doc.toprettyxml(indent='	'))
-
-            ftrain.writelines(stem + '\n')
-
-        (f.close() for f in fs)
-        ftrain.close()
+if __name__ == '__main__':
+    main()
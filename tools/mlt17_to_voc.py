@@ -1,8 +1,15 @@
 import os
+import argparse
+import functools
+import multiprocessing
 import numpy as np
-import math
 import cv2
-from tools.convert_utils import build_voc_dirs, generate_xml
+from tools.convert_utils import build_voc_dirs, generate_xml, write_atomic, imwrite_atomic, \
+    load_manifest, save_manifest, is_up_to_date, source_mtimes, map_parallel, \
+    ANNOTATION_FORMATS, jsonl_annotations_file, load_jsonl_annotations, converted_records
+import tools._init_paths
+from utils.text_line_split import split_quads, clip_slices
+from datasets.jsonl_annotations import annotation_record, JsonlAnnotationWriter
 
 """
 gt 样例
@@ -53,9 +60,6 @@ MAX_HEIGHT_WIDTH_SCALE = 4
 # 对文本行进行 split 后，允许最少的 anchor 数量
 MIN_ANCHOR_COUNT = 10
 
-global_k_is_none_count = 0
-
-
 def parse_line(pnts, im_scale):
     """
     :param pnts:
@@ -124,111 +128,6 @@ def clip_line(line, size):
     return xmin, ymin, xmax, ymax
 
 
-def split_text_line(line, step):
-    """
-    按照 Bounding box 对文字进行划分
-    :param line: (xmin, ymin, xmax, ymax)
-    :return: [(anchor_xmin, anchor_ymin, anchor_xmax, anchor_ymax)]
-    """
-    xmin, ymin, xmax, ymax = line
-    width = xmax - xmin
-
-    anchor_count = int(math.ceil(width / step))
-
-    splited_lines = []
-
-    for i in range(anchor_count):
-        anchor_xmin = i * step + xmin
-        anchor_ymin = ymin
-        anchor_xmax = anchor_xmin + step - 1
-        anchor_ymax = ymax
-
-        splited_lines.append((anchor_xmin, anchor_ymin, anchor_xmax, anchor_ymax))
-
-    return splited_lines
-
-
-class Point:
-    def __init__(self, x, y):
-        self.x = int(x)
-        self.y = int(y)
-
-    def __str__(self):
-        return "({}, {})".format(self.x, self.y)
-
-
-class Line:
-    def __init__(self, p0: Point, p1: Point):
-        self.p0 = p0
-        self.p1 = p1
-
-        if p0.x - p1.x == 0:
-            self.k = None
-        else:
-            self.k = (self.p0.y - self.p1.y) / (self.p0.x - self.p1.x)
-
-        # f = ax+by+c = 0
-        self.a = self.p0.y - self.p1.y
-        self.b = self.p1.x - self.p0.x
-        self.c = self.p0.x * self.p1.y - self.p1.x * self.p0.y
-
-    def cross(self, line) -> Point:
-        d = self.a * line.b - line.a * self.b
-        if d == 0:
-            return None
-
-        x = (self.b * line.c - line.b * self.c) / d
-        y = (line.a * self.c - self.a * line.c) / d
-
-        return Point(x, y)
-
-    def contain(self, p: Point) -> bool:
-        if p is None:
-            return False
-
-        # 输入的点应该吃 cross(求出来的交点)
-        # p 点是否落在 p0 和 p1 之间, 而不是延长线上
-        if p.x > max(self.p1.x, self.p0.x):
-            return False
-
-        if p.x < min(self.p1.x, self.p0.x):
-            return False
-
-        if p.y > max(self.p1.y, self.p0.y):
-            return False
-
-        if p.y < min(self.p1.y, self.p0.y):
-            return False
-
-        return True
-
-
-def get_clockwise(pnts):
-    """
-    :param pnts: [[x1, y1], [x2, y2], [x3, y3], [x4, y4]]
-    :return:
-        [[x1, y1], [x2, y2], [x3, y3], [x4, y4]]
-        left-top, right-top, right-bottom, left-bottom
-    """
-    out = []
-    p = sorted(pnts, key=lambda x: x[1])
-    if p[0][0] < p[1][0]:
-        out.append(p[0])
-        out.append(p[1])
-    else:
-        out.append(p[1])
-        out.append(p[0])
-
-    if p[2][0] > p[3][0]:
-        out.append(p[2])
-        out.append(p[3])
-    else:
-        out.append(p[3])
-        out.append(p[2])
-
-    return out
-
-
 def draw_four_vectors(img, line, color=(0, 255, 0)):
     """
     :param line: (x1,y1,x2,y2,x3,y3,x4,y4)
@@ -252,121 +151,6 @@ def draw_bounding_box(img, line, color=(255, 0, 0)):
     return img
 
 
-def split_text_line2(line, step, img=None):
-    """
-    按照 minAreaRect 对文本进行划分
-    :param line:
-        (x1,y1,x2,y2,x3,y3,x4,y4)
-        矩形四点坐标的顺序： left-top, right-top, right-bottom, left-bottom
-    :return: [(anchor_xmin, anchor_ymin, anchor_xmax, anchor_ymax)]
-    """
-    global global_k_is_none_count
-    if DEBUG:
-        img = draw_four_vectors(img, line)
-
-    xmin, ymin, xmax, ymax = get_ltrb(line)
-    width = xmax - xmin
-    height = ymax - ymin
-
-    if height > MAX_HEIGHT_WIDTH_SCALE * width:
-        return []
-
-    anchor_count = int(math.ceil(width / step))
-
-    if DEBUG:
-        img = draw_bounding_box(img, (xmin, ymin, xmax, ymax))
-
-    rect = cv2.minAreaRect(np.asarray([[line[0], line[1]],
-                                       [line[2], line[3]],
-                                       [line[4], line[5]],
-                                       [line[6], line[7]]]))
-    # 获得最小 rotate rect 的四个角点
-    box = cv2.boxPoints(rect)
-    box = get_clockwise(box)
-
-    if DEBUG:
-        img = draw_four_vectors(img, (box[0][0], box[0][1],
-                                      box[1][0], box[1][1],
-                                      box[2][0], box[2][1],
-                                      box[3][0], box[3][1]), color=(255, 55, 55))
-
-    p1 = Point(box[0][0], box[0][1])
-    p2 = Point(box[1][0], box[1][1])
-    p3 = Point(box[2][0], box[2][1])
-    p4 = Point(box[3][0], box[3][1])
-
-    l1 = Line(p1, p2)
-    l2 = Line(p2, p3)
-    l3 = Line(p3, p4)
-    l4 = Line(p4, p1)
-    lines = [l1, l2, l3, l4]
-
-    if l1.k is None:
-        global_k_is_none_count += 1
-        print("l1 K is None")
-        print(p1)
-        print(p2)
-        print(p3)
-        print(p4)
-        return []
-
-    splited_lines = []
-    for i in range(anchor_count):
-        anchor_xmin = i * step + xmin
-        anchor_xmax = anchor_xmin + step - 1
-        anchor_ymin = ymin
-        anchor_ymax = ymax
-
-        # 垂直于 X 轴的现
-        left_line = Line(Point(anchor_xmin, 0), Point(anchor_xmin, height))
-        right_line = Line(Point(anchor_xmax, 0), Point(anchor_xmax, height))
-
-        left_cross_pnts = [left_line.cross(l) for l in lines]
-        right_cross_pnts = [right_line.cross(l) for l in lines]
-
-        if l1.k < 0:
-            if l1.contain(right_cross_pnts[0]):
-                anchor_ymin = right_cross_pnts[0].y
-
-            if l4.contain(right_cross_pnts[3]):
-                anchor_ymax = right_cross_pnts[3].y
-
-            if l3.contain(left_cross_pnts[2]):
-                anchor_ymax = left_cross_pnts[2].y
-
-            if l2.contain(left_cross_pnts[1]):
-                anchor_ymin = left_cross_pnts[1].y
-
-        if l1.k > 0:
-            if l4.contain(right_cross_pnts[3]):
-                anchor_ymin = right_cross_pnts[3].y
-
-            if l3.contain(right_cross_pnts[2]):
-                anchor_ymax = right_cross_pnts[2].y
-
-            if l1.contain(left_cross_pnts[0]):
-                anchor_ymin = left_cross_pnts[0].y
-
-            if l2.contain(left_cross_pnts[1]):
-                anchor_ymax = left_cross_pnts[1].y
-
-        if anchor_ymax - anchor_ymin <= MIN_TEXT_HEIGHT:
-            continue
-
-        if DEBUG:
-            img = draw_bounding_box(img, (anchor_xmin, anchor_ymin, anchor_xmax, anchor_ymax), (0, 0, 255))
-            cv2.imshow('test', img)
-            cv2.waitKey()
-
-        splited_lines.append((anchor_xmin, anchor_ymin, anchor_xmax, anchor_ymax))
-
-    if DEBUG:
-        cv2.imshow('test', img)
-        cv2.waitKey()
-
-    return splited_lines
-
-
 def test():
     # p1 = Point(5, 1)
     # p2 = Point(1, 4)
@@ -401,88 +185,174 @@ def test():
     cv2.waitKey(0)
 
 
-def main():
-    dest_label_dir, dest_img_dir, dest_set_dir = build_voc_dirs(out_dir)
-    # training or val
-    setname = os.path.basename(img_dir)
-
-    img_names = os.listdir(img_dir)
-    img_names.sort()
-
-    trainval_set_file = open(os.path.join(dest_set_dir, setname + '.txt'), 'w')
-
-    count = 0
-
-    # img_names = img_names[0:205]
-    for img_name in img_names:
-        img_path = os.path.join(img_dir, img_name)
-
-        _, basename = os.path.split(img_name)
-        if basename.lower().split('.')[-1] not in ['jpg', 'png']:
-            continue
-
-        stem, ext = os.path.splitext(basename)
-        gt_file = os.path.join(gt_dir, 'gt_' + stem + '.txt')
+def convert_image(img_name, img_dir, gt_dir, dest_img_dir, dest_label_dir, setname, scale, max_scale,
+                  annotation_format='voc', whole_lines=False):
+    """
+    Convert one image and its gt file, runs in the workers of main
+    :param whole_lines: write the whole text lines instead of their slices, jsonl format only
+    :return: (out stem, None if the image is skipped; the annotation record in the jsonl format, else None)
+    """
+    img_path = os.path.join(img_dir, img_name)
+    stem, ext = os.path.splitext(img_name)
+    gt_file = os.path.join(gt_dir, 'gt_' + stem + '.txt')
 
-        img = cv2.imread(img_path)
-        im_scale = get_img_scale(img, SCALE, MAX_SCALE_LENGTH)
+    img = cv2.imread(img_path)
+    im_scale = get_img_scale(img, scale, max_scale)
 
-        with open(gt_file, 'r') as f:
-            lines = f.readlines()
+    with open(gt_file, 'r') as f:
+        lines = f.readlines()
 
-        parsed_lines = [parse_line(line, im_scale) for line in lines]
+    parsed_lines = [parse_line(line, im_scale) for line in lines]
 
-        if len(parsed_lines) == 0 or \
-                not all(x[1] in VALID_LANGUAGE for x in parsed_lines):  # 保证图片中只有 latin/chinese
-            print("Skip image: %s" % img_name)
-            continue
+    if len(parsed_lines) == 0 or \
+            not all(x[1] in VALID_LANGUAGE for x in parsed_lines):  # 保证图片中只有 latin/chinese
+        print("Skip image: %s" % img_name)
+        return None, None
 
-        parsed_lines = list(filter(lambda x: x[2] != IGNORE, parsed_lines))
+    parsed_lines = list(filter(lambda x: x[2] != IGNORE, parsed_lines))
 
-        # 过滤掉高度过高或者过小的文本行
-        tmp = []
-        for l in parsed_lines:
-            xmin, ymin, xmax, ymax = get_ltrb(l[0])
-            h = ymax - ymin
-            w = xmax - xmin
-            if MIN_TEXT_HEIGHT < h < MAX_HEIGHT_WIDTH_SCALE * w:
-                tmp.append(l)
+    # 过滤掉高度过高或者过小的文本行
+    tmp = []
+    for l in parsed_lines:
+        xmin, ymin, xmax, ymax = get_ltrb(l[0])
+        h = ymax - ymin
+        w = xmax - xmin
+        if MIN_TEXT_HEIGHT < h < MAX_HEIGHT_WIDTH_SCALE * w:
+            tmp.append(l)
 
-        parsed_lines = tmp
+    parsed_lines = tmp
 
-        resize_img = cv2.resize(img, None, None, fx=im_scale, fy=im_scale, interpolation=cv2.INTER_AREA)
-        resize_img_size = resize_img.shape
+    resize_img = cv2.resize(img, None, None, fx=im_scale, fy=im_scale, interpolation=cv2.INTER_AREA)
+    resize_img_size = resize_img.shape
 
-        anchors = []
-        for line in parsed_lines:
-            temp_splited_lines = split_text_line2(line[0], step, resize_img)
+    quads = np.array([l[0] for l in parsed_lines], dtype=np.int64).reshape((-1, 8))
+    splited_lines, line_inds = split_quads(quads, step, MIN_TEXT_HEIGHT, MAX_HEIGHT_WIDTH_SCALE)
+    splited_lines = clip_slices(splited_lines, resize_img_size)
 
-            temp_splited_lines = [clip_line(l, resize_img_size) for l in temp_splited_lines]
+    # 每个文本行 split 后至少要有 MIN_CONTINUE_ANCHORS 个以上的 anchor
+    continue_lines = np.bincount(line_inds, minlength=len(quads)) > MIN_CONTINUE_ANCHORS
+    anchors = [tuple(l) for l in splited_lines[continue_lines[line_inds]]]
 
-            if len(temp_splited_lines) <= MIN_CONTINUE_ANCHORS:
-                continue
+    if DEBUG:
+        debug_img = resize_img.copy()
+        for quad in quads:
+            debug_img = draw_four_vectors(debug_img, tuple(int(v) for v in quad))
+        for anchor in anchors:
+            debug_img = draw_bounding_box(debug_img, tuple(int(v) for v in anchor), (0, 0, 255))
+        cv2.imshow('test', debug_img)
+        cv2.waitKey()
 
-            anchors.extend(temp_splited_lines)
+    if len(anchors) <= MIN_ANCHOR_COUNT:
+        print("Skip image: %s" % img_name)
+        return None, None
+
+    print("Process image: %s" % img_name)
+    out_stem = '{}_{}'.format(setname, stem)
+    out_img_name = out_stem + '.jpg'
+    imwrite_atomic(os.path.join(dest_img_dir, out_img_name), resize_img)
+    database = 'icdar_mlt17_%s' % setname
+    if whole_lines:
+        # The lines with slices, split again by the training data layer at the scale of each minibatch
+        kept = np.unique(line_inds[continue_lines[line_inds]])
+        boxes = [clip_line(get_ltrb(quad), resize_img_size) for quad in quads[kept]]
+        return out_stem, annotation_record(out_stem, out_img_name, resize_img_size, boxes, database,
+                                           text_lines=quads[kept])
+    if annotation_format == 'jsonl':
+        return out_stem, annotation_record(out_stem, out_img_name, resize_img_size, anchors, database)
+
+    doc, objs = generate_xml(out_img_name, anchors, resize_img_size, database)
+
+    xmlfile = os.path.join(dest_label_dir, out_stem + '.xml')
+    write_atomic(xmlfile, doc.toprettyxml(indent='	'))
+
+    return out_stem, None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Convert ICDAR MLT17 to VOC format')
+    parser.add_argument('--img_dir', default=img_dir)
+    parser.add_argument('--gt_dir', default=gt_dir)
+    parser.add_argument('--out_dir', default=out_dir)
+    parser.add_argument('--scale', type=int, default=SCALE)
+    parser.add_argument('--max_scale', type=int, default=MAX_SCALE_LENGTH)
+    parser.add_argument('--num_workers', type=int, default=multiprocessing.cpu_count(),
+                        help='number of conversion processes, 1 converts in this process')
+    parser.add_argument('--force', action='store_true', help='convert the images that are up to date too')
+    parser.add_argument('--format', dest='annotation_format', choices=ANNOTATION_FORMATS, default='voc',
+                        help='one XML file per image, or all the annotations in Annotations/<set>.jsonl')
+    parser.add_argument('--whole_lines', action='store_true',
+                        help='annotate the whole text lines, split by the training data layer (jsonl format)')
+    args = parser.parse_args()
+    if args.whole_lines and args.annotation_format != 'jsonl':
+        parser.error('--whole_lines needs --format jsonl')
+    return args
 
-        if len(anchors) <= MIN_ANCHOR_COUNT:
-            print("Skip image: %s" % img_name)
-            continue
 
-        print("Process image: %s" % img_name)
-        out_img_name = '{}_{}.jpg'.format(setname, stem)
-        cv2.imwrite(os.path.join(dest_img_dir, out_img_name), resize_img)
-        doc, objs = generate_xml(out_img_name, anchors, resize_img_size, 'icdar_mlt17_%s' % setname)
+def main():
+    args = parse_args()
+    img_dir, gt_dir = args.img_dir, args.gt_dir
 
-        xmlfile = os.path.join(dest_label_dir, '{}_{}.xml'.format(setname, stem))
+    dest_label_dir, dest_img_dir, dest_set_dir = build_voc_dirs(args.out_dir)
+    # training or val
+    setname = os.path.basename(os.path.normpath(img_dir))
 
-        with open(xmlfile, 'w') as f:
-            f.write(doc.toprettyxml(indent='	'))
+    img_names = os.listdir(img_dir)
+    img_names.sort()
+    img_names = [n for n in img_names if n.lower().split('.')[-1] in ['jpg', 'png']]
+
+    # The outputs of an image only depend on its files and on these params
+    params = {'scale': args.scale, 'max_scale': args.max_scale, 'step': step,
+              'min_text_height': MIN_TEXT_HEIGHT, 'min_continue_anchors': MIN_CONTINUE_ANCHORS,
+              'max_height_width_scale': MAX_HEIGHT_WIDTH_SCALE, 'min_anchor_count': MIN_ANCHOR_COUNT,
+              'valid_language': VALID_LANGUAGE, 'format': args.annotation_format}
+    if args.whole_lines:
+        params['whole_lines'] = True
+    manifest_file = os.path.join(args.out_dir, setname + '_manifest.json')
+    manifest = {} if args.force else load_manifest(manifest_file, params)
+    jsonl_file = jsonl_annotations_file(dest_label_dir, setname)
+    # The records of the images up to date are copied from the previous file
+    records = load_jsonl_annotations(jsonl_file) if args.annotation_format == 'jsonl' else {}
+
+    entries = {}
+    todo = []
+    for img_name in img_names:
+        stem, ext = os.path.splitext(img_name)
+        src_files = [os.path.join(img_dir, img_name), os.path.join(gt_dir, 'gt_' + stem + '.txt')]
+        entry = manifest.get(img_name)
+        dst_files = []
+        if entry is not None and entry['stem'] is not None:
+            dst_files = [os.path.join(dest_img_dir, entry['stem'] + '.jpg')]
+            if args.annotation_format == 'voc':
+                dst_files.append(os.path.join(dest_label_dir, entry['stem'] + '.xml'))
+            elif entry['stem'] not in records:
+                entry = None
+        if is_up_to_date(entry, src_files, dst_files):
+            entries[img_name] = entry
+        else:
+            # Read before converting, a source modified meanwhile is converted again next time
+            entries[img_name] = {'mtimes': source_mtimes(src_files), 'stem': None}
+            todo.append(img_name)
+    print("Up to date image count: %d, to convert: %d" % (len(img_names) - len(todo), len(todo)))
+
+    convert_fn = functools.partial(convert_image, img_dir=img_dir, gt_dir=gt_dir, dest_img_dir=dest_img_dir,
+                                   dest_label_dir=dest_label_dir, setname=setname, scale=args.scale,
+                                   max_scale=args.max_scale, annotation_format=args.annotation_format,
+                                   whole_lines=args.whole_lines)
+    converted = converted_records(img_names, entries, todo, map_parallel(convert_fn, todo, args.num_workers),
+                                  records)
+    if args.annotation_format == 'jsonl':
+        with JsonlAnnotationWriter(jsonl_file) as writer:
+            for record in converted:
+                writer.write(record)
+    else:
+        for _ in converted:
+            pass
 
-        trainval_set_file.writelines("{}_{}\n".format(setname, stem))
-        count += 1
+    out_stems = [entries[img_name]['stem'] for img_name in img_names if entries[img_name]['stem'] is not None]
+    write_atomic(os.path.join(dest_set_dir, setname + '.txt'), ''.join('%s\n' % s for s in out_stems))
+    save_manifest(manifest_file, params, entries)
 
-    print("Converted image count: %d" % count)
-    print("K is None: %d" % global_k_is_none_count)
+    print("Converted image count: %d" % len(out_stems))
 
 
 if __name__ == "__main__":
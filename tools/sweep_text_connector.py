@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+"""
+Evaluate a grid of text connector configs on the RPN predictions cached by tools/icdar.py --cache_dir.
+
+The proposals of each image are replayed from the cache once, then every config of the grid
+connects them into text lines with TextDetector.detect and is evaluated by IcdarEvaluator.
+The configs are evaluated in parallel by a pool of processes, no network is run:
+
+    python tools/sweep_text_connector.py --ckpt output/vgg16/voc_2007_trainval/default/xxx.ckpt \
+        --cache_dir data/rpn_cache --img_dir data/ICDAR13/test -c ICDAR13 --gt data/ICDAR13/gt.zip \
+        --grid MAX_HORIZONTAL_GAP=30,50,70 MIN_V_OVERLAPS=0.6,0.7,0.8 LINE_MIN_SCORE=0.8,0.9
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import _init_paths
+from model.config import cfg, cfg_from_file, cfg_from_list
+from model.test import recover_scale
+from model.rpn_cache import RpnCache, im_detect_cached
+from text_connector import TextDetector, Config
+from datasets.icdar_eval import IcdarEvaluator, text_lines_to_points
+from utils import helper
+import argparse
+import ast
+import glob
+import itertools
+import multiprocessing
+import time
+import numpy as np
+
+# State of the pool workers, inherited from the parent process
+_samples = None
+_evaluator = None
+_line_detector = None
+
+
+def parse_grid(items):
+    """
+    :param items: ['KEY=v1,v2,...']
+    :return: list of the {key: value} configs of the grid
+    """
+    keys = []
+    values = []
+    for item in items:
+        key, _, item_values = item.partition('=')
+        if not hasattr(Config, key):
+            raise KeyError('Unknown text connector config {:s}'.format(key))
+        keys.append(key)
+        values.append([ast.literal_eval(v) for v in item_values.split(',')])
+    return [dict(zip(keys, combination)) for combination in itertools.product(*values)]
+
+
+def replay_proposals(cache, im_files, evaluator):
+    """:return: [(sample id, scores, boxes, resized image shape, image scale)] of the cached images"""
+    samples = []
+    missing = 0
+    for im_file in im_files:
+        sample_id = evaluator.sample_id(im_file)
+        if sample_id is None:
+            continue
+        im = helper.read_rgb_img(im_file)
+        try:
+            scores, boxes, resized_im_shape, im_scale = im_detect_cached(cache, im)
+        except KeyError:
+            missing += 1
+            continue
+        samples.append((sample_id, scores, boxes, resized_im_shape, im_scale))
+    if missing > 0:
+        print('{:d} images not in the cache are not evaluated'.format(missing))
+    return samples
+
+
+def _init_worker(samples, evaluator, oriented):
+    global _samples, _evaluator, _line_detector
+    _samples = samples
+    _evaluator = evaluator
+    _line_detector = TextDetector(oriented)
+
+
+def evaluate_config(params):
+    """:return: the metrics of the text lines detected with Config(**params)"""
+    config = Config(**params)
+    detections = {}
+    for sample_id, scores, boxes, resized_im_shape, im_scale in _samples:
+        text_lines = _line_detector.detect(boxes, scores[:, np.newaxis], resized_im_shape, config)
+        if len(text_lines) != 0:
+            text_lines = recover_scale(text_lines, im_scale)
+        detections[sample_id] = text_lines_to_points(text_lines, _evaluator.ltrb)
+    return _evaluator.evaluate(detections)['method']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Evaluate a grid of text connector configs on cached proposals')
+    parser.add_argument('--ckpt', required=True, help='checkpoint file of the cached predictions')
+    parser.add_argument('--cache_dir', required=True, help='cache of the RPN predictions of tools/icdar.py')
+    parser.add_argument('--img_dir', default='./data/demo')
+    parser.add_argument('-c', '--challenge', required=True, choices=['ICDAR13', 'ICDAR13_Det', 'ICDAR15'])
+    parser.add_argument('--gt', required=True, help='ground truth ZIP file of the challenge')
+    parser.add_argument('-o', '--oriented', action='store_true', default=False, help='output rotated detect box')
+    parser.add_argument('--grid', nargs='+', default=[], metavar='KEY=v1,v2',
+                        help='values of the text connector configs, the grid is their cartesian product')
+    parser.add_argument('--num_workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--top', type=int, default=10, help='number of best configs printed')
+    parser.add_argument('--cfg', dest='cfg_file', help='optional config file', default=None, type=str)
+    parser.add_argument('--set', dest='set_cfgs', help='set config keys', default=None,
+                        nargs=argparse.REMAINDER)
+    return parser.parse_args()
+
+
+def main(args):
+    configs = parse_grid(args.grid)
+    # One sample per process, the ICDAR scripts would start pools in the pool workers otherwise
+    evaluator = IcdarEvaluator(args.challenge, args.gt, params={'NUM_WORKERS': 1})
+    cache = RpnCache(args.cache_dir, args.ckpt)
+
+    start = time.time()
+    samples = replay_proposals(cache, sorted(glob.glob(args.img_dir + '/*.*')), evaluator)
+    print('Replayed the proposals of {:d} images in {:.1f}s'.format(len(samples), time.time() - start))
+
+    start = time.time()
+    if args.num_workers > 1 and len(configs) > 1:
+        pool = multiprocessing.Pool(args.num_workers, _init_worker, (samples, evaluator, args.oriented))
+        try:
+            results = pool.map(evaluate_config, configs, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        _init_worker(samples, evaluator, args.oriented)
+        results = [evaluate_config(params) for params in configs]
+    print('Evaluated {:d} configs in {:.1f}s'.format(len(configs), time.time() - start))
+
+    order = np.argsort([-metrics['hmean'] for metrics in results], kind='mergesort')
+    print('{:>8s} {:>8s} {:>8s}  config'.format('hmean', 'prec', 'recall'))
+    for i in order[:args.top]:
+        metrics = results[i]
+        print('{:8.4f} {:8.4f} {:8.4f}  {}'.format(metrics['hmean'], metrics['precision'], metrics['recall'],
+                                                  Config(**configs[i])))
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    if args.cfg_file is not None:
+        cfg_from_file(args.cfg_file)
+    if args.set_cfgs is not None:
+        cfg_from_list(args.set_cfgs)
+    # The predictions are replayed on the CPU
+    cfg.USE_GPU_NMS = False
+
+    main(args)